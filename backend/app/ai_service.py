@@ -1,24 +1,215 @@
-from google import genai
+import asyncio
 import json
+import logging
 import urllib.parse
 import base64
+import time
 from datetime import datetime
 from app.config import settings
 from app.schemas import TrainingStepCreate
+from app.content_cache import tts_cache
 from app.utils.file_manager import file_manager
-from typing import List, Dict, Any
+from app.utils.model_limiter import ModelConcurrencyLimiter
+from app.utils.ttl_cache import AsyncTTLCache
+from app.utils.json_stream import JSONArrayItemStream
+from app.utils.metrics import gemini_request_duration_seconds, gemini_requests_total
+from app.utils.structured_log import log_event
+from app.utils.tracing import span
+from typing import List, Dict, Any, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# 可重试的连接类错误关键字
+_RETRYABLE_ERROR_MARKERS = ("EOF", "SSL", "protocol")
 
 class AIService:
     def __init__(self):
-        # 使用新版SDK的Client
-        # 如果API密钥为空，延迟初始化（用于测试环境）
-        if settings.gemini_api_key:
-            self.client = genai.Client(api_key=settings.gemini_api_key)
-        else:
-            self.client = None
+        # 新版SDK的Client在第一次AI请求时才导入和创建（google.genai 导入较慢，不计入启动时间）
+        # 如果API密钥为空，保持为None（用于测试环境）
+        self.client = None
+        self._client_lock = asyncio.Lock()
+        self.limiter = ModelConcurrencyLimiter(
+            settings.gemini_default_concurrency,
+            settings.gemini_model_concurrency
+        )
+        # 场景规划缓存：课堂上常有多台设备同时打开同一主题
+        self.plan_cache = AsyncTTLCache(
+            max_entries=settings.plan_cache_max_entries,
+            ttl_seconds=settings.plan_cache_ttl_seconds
+        )
+
+    @staticmethod
+    def _create_client():
+        from google import genai
+        return genai.Client(api_key=settings.gemini_api_key)
+
+    async def _get_client(self):
+        """返回Gemini客户端，首次调用时在线程中导入SDK并创建，不阻塞事件循环"""
+        if self.client is None and settings.gemini_api_key:
+            async with self._client_lock:
+                if self.client is None:
+                    self.client = await asyncio.to_thread(self._create_client)
+        return self.client
+
+    @staticmethod
+    def _record_call(model: str, operation: str, started: float, outcome: str):
+        """记录一次模型调用的耗时和结果（不含等待并发名额的时间）"""
+        gemini_request_duration_seconds.observe(time.perf_counter() - started, model, operation)
+        gemini_requests_total.inc(model, operation, outcome)
+
+    async def _generate_content(self, model: str, contents, config=None, operation: str = "other"):
+        """通过异步客户端调用Gemini，受按模型的并发限制约束，连接错误时退避重试
+
+        operation（plan/image/tts）用于按用途统计调用延迟和错误数。
+        """
+        client = await self._get_client()
+        if not client:
+            raise Exception("API client not initialized")
+        max_retries = max(1, settings.gemini_max_retries)
+        retry_delay = 1  # 秒
+
+        for attempt in range(max_retries):
+            try:
+                with span("gemini.generate_content", model=model, operation=operation, attempt=attempt + 1) as s:
+                    async with self.limiter.limit(model):
+                        started = time.perf_counter()
+                        if s:
+                            # 等待并发名额的时间，其余为模型调用本身
+                            s.set(limiter_wait_ms=round((time.time_ns() - s.start_ns) / 1e6, 3))
+                        try:
+                            response = await client.aio.models.generate_content(
+                                model=model,
+                                contents=contents,
+                                config=config
+                            )
+                        except Exception:
+                            self._record_call(model, operation, started, "error")
+                            raise
+                        self._record_call(model, operation, started, "ok")
+                        return response
+            except Exception as retry_error:
+                if attempt < max_retries - 1:
+                    error_msg = str(retry_error)
+                    if any(marker in error_msg for marker in _RETRYABLE_ERROR_MARKERS):
+                        log_event(logger, "gemini.retry", f"SSL/连接错误，{retry_delay}秒后重试 (尝试 {attempt + 1}/{max_retries})...",
+                                  level=logging.WARNING, model=model, attempt=attempt + 1, error=error_msg)
+                        # 退避期间释放并发名额，且不阻塞事件循环
+                        await asyncio.sleep(retry_delay)
+                        continue
+                raise  # 最后一次尝试失败或非SSL错误，抛出异常
 
     async def plan_scenario_steps(self, topic: str, preferences: dict = None) -> Dict[str, Any]:
-        """AI规划场景步骤"""
+        """AI规划场景步骤
+
+        相同 (主题, 昵称, 兴趣) 的规划结果会在 plan_cache 中缓存，
+        并发的相同请求合并为一次模型调用；模型调用失败时返回默认步骤（不缓存）。
+        """
+        try:
+            plan = await self.plan_cache.get_or_load(
+                self._plan_cache_key(topic, preferences),
+                lambda: self._request_plan(topic, preferences)
+            )
+        except Exception as e:
+            log_event(logger, "plan.failed", f"AI planning failed: {e}", level=logging.WARNING, topic=topic)
+            return self._default_plan(topic)
+        # 返回副本，避免调用方修改缓存中的步骤对象
+        return {
+            'total_images': plan['total_images'],
+            'steps': [step.model_copy() for step in plan['steps']]
+        }
+
+    async def stream_scenario_steps(self, topic: str, preferences: dict = None) -> AsyncIterator[Dict[str, Any]]:
+        """流式规划场景步骤，每个步骤完整生成后立即产出
+
+        产出事件：{"type": "step", "step": {...}}，最后为
+        {"type": "done", "total_images": n, "cached": bool, "fallback": bool}。
+        缓存命中时直接产出全部步骤；流式结果完整解析成功后写入 plan_cache。
+        """
+        cache_key = self._plan_cache_key(topic, preferences)
+        cached_plan = self.plan_cache.lookup(cache_key)
+        if cached_plan is not None:
+            for step in cached_plan['steps']:
+                yield {"type": "step", "step": step.model_dump()}
+            yield {"type": "done", "total_images": cached_plan['total_images'], "cached": True, "fallback": False}
+            return
+
+        emitted: List[TrainingStepCreate] = []
+        parser = JSONArrayItemStream("steps")
+        try:
+            client = await self._get_client()
+            if not client:
+                raise Exception("API client not initialized")
+            prompt = self._build_plan_prompt(topic, preferences)
+            model = settings.gemini_text_model
+            chunks: asyncio.Queue = asyncio.Queue()
+            finished = object()
+
+            async def pump():
+                # 并发槽位只在读取上游流期间占用，不受客户端消费步骤的速度影响
+                async with self.limiter.limit(model):
+                    started = time.perf_counter()
+                    outcome = "error"
+                    try:
+                        async for chunk in await client.aio.models.generate_content_stream(model=model, contents=prompt):
+                            chunks.put_nowait(chunk.text or "")
+                        outcome = "ok"
+                    except asyncio.CancelledError:
+                        outcome = "cancelled"
+                        raise
+                    finally:
+                        self._record_call(model, "plan_stream", started, outcome)
+
+            producer = asyncio.ensure_future(pump())
+            producer.add_done_callback(lambda _: chunks.put_nowait(finished))
+            try:
+                while True:
+                    text = await chunks.get()
+                    if text is finished:
+                        break
+                    for step_data in parser.feed(text):
+                        step = TrainingStepCreate(**step_data)
+                        emitted.append(step)
+                        yield {"type": "step", "step": step.model_dump()}
+                producer.result()
+            finally:
+                # 客户端断开或解析出错时停止读取上游，释放槽位
+                producer.cancel()
+        except Exception as e:
+            log_event(logger, "plan.stream_failed", f"AI streaming planning failed: {e}", level=logging.WARNING,
+                      topic=topic, emitted=len(emitted))
+            if not emitted:
+                # 尚未输出任何步骤，整体退回默认规划
+                default_plan = self._default_plan(topic)
+                for step in default_plan['steps']:
+                    yield {"type": "step", "step": step.model_dump()}
+                yield {"type": "done", "total_images": default_plan['total_images'], "cached": False, "fallback": True}
+                return
+            # 已输出的步骤无法撤回，以已完成的部分结束
+            yield {"type": "done", "total_images": len(emitted), "cached": False, "fallback": False, "partial": True}
+            return
+
+        try:
+            plan = self._parse_plan(parser.text)
+        except Exception:
+            plan = {'total_images': len(emitted), 'steps': emitted}
+        if plan['steps']:
+            self.plan_cache.set(cache_key, plan)
+        log_event(logger, "plan.stream_completed", f"AI流式规划完成：将生成 {len(emitted)} 张训练图片",
+                  total_images=len(emitted))
+        yield {"type": "done", "total_images": len(emitted), "cached": False, "fallback": False}
+
+    def _plan_cache_key(self, topic: str, preferences: dict = None) -> tuple:
+        """规划缓存键：规范化后的 (主题, 昵称, 兴趣)"""
+        preferences = preferences or {}
+        normalize = lambda value: " ".join(str(value or "").split()).casefold()
+        return (
+            normalize(topic),
+            normalize(preferences.get('childName', '宝贝')),
+            normalize(preferences.get('interest', ''))
+        )
+
+    def _build_plan_prompt(self, topic: str, preferences: dict = None) -> str:
+        """构建场景规划提示词"""
         # 提取个性化信息
         child_name = preferences.get('childName', '宝贝') if preferences else '宝贝'
         interest = preferences.get('interest', '') if preferences else ''
@@ -85,92 +276,74 @@ image_prompt示例（主题：过马路）：
 - instruction必须严格遵守6字以内的格式要求
 - image_prompt必须严格遵守上述格式要求
 """
+        return prompt
 
-        try:
-            if not self.client:
-                raise Exception("API client not initialized")
-            # 使用新版SDK的API调用方式，添加超时和重试
-            import time
-            max_retries = 2
-            retry_delay = 1  # 秒
-            
-            for attempt in range(max_retries):
-                try:
-                    response = self.client.models.generate_content(
-                        model="gemini-2.5-flash",
-                        contents=prompt
-                    )
-                    break  # 成功则跳出重试循环
-                except Exception as retry_error:
-                    if attempt < max_retries - 1:
-                        error_msg = str(retry_error)
-                        if "EOF" in error_msg or "SSL" in error_msg or "protocol" in error_msg:
-                            print(f"SSL/连接错误，{retry_delay}秒后重试 (尝试 {attempt + 1}/{max_retries})...")
-                            time.sleep(retry_delay)
-                            continue
-                    raise  # 最后一次尝试失败或非SSL错误，抛出异常
-            response_text = response.text.strip()
-            
-            # 尝试提取JSON
-            if '```json' in response_text:
-                response_text = response_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in response_text:
-                response_text = response_text.split('```')[1].split('```')[0].strip()
-            
-            data = json.loads(response_text)
-            steps_data = data.get('steps', [])
-            total_images = data.get('total_images', len(steps_data))
-
-            # 验证total_images与steps长度一致
-            if total_images != len(steps_data):
-                print(f"Warning: total_images ({total_images}) != steps length ({len(steps_data)}), using steps length")
-                total_images = len(steps_data)
-
-            print(f"AI规划完成：将生成 {total_images} 张训练图片")
-            return {
-                'total_images': total_images,
-                'steps': [TrainingStepCreate(**step) for step in steps_data]
-            }
-        except Exception as e:
-            print(f"AI planning failed: {e}")
-            # 返回默认步骤（使用6字内的短指令）
-            default_steps = [
-                TrainingStepCreate(
-                    step_order=1,
-                    instruction="准备开始",
-                    image_prompt=f"A child preparing for {topic} activity, simple illustration"
-                ),
-                TrainingStepCreate(
-                    step_order=2,
-                    instruction="执行步骤",
-                    image_prompt=f"A child performing {topic} activity, clear visual guide"
-                ),
-                TrainingStepCreate(
-                    step_order=3,
-                    instruction="完成训练",
-                    image_prompt=f"A child completing {topic} activity successfully"
-                )
-            ]
-            print(f"🎨 使用默认规划：将生成 {len(default_steps)} 张训练图片")
-            return {
-                'total_images': len(default_steps),
-                'steps': default_steps
-            }
+    def _parse_plan(self, response_text: str) -> Dict[str, Any]:
+        """解析模型返回的规划JSON"""
+        response_text = response_text.strip()
+
+        # 尝试提取JSON
+        if '```json' in response_text:
+            response_text = response_text.split('```json')[1].split('```')[0].strip()
+        elif '```' in response_text:
+            response_text = response_text.split('```')[1].split('```')[0].strip()
+
+        data = json.loads(response_text)
+        steps_data = data.get('steps', [])
+        total_images = data.get('total_images', len(steps_data))
+
+        # 验证total_images与steps长度一致
+        if total_images != len(steps_data):
+            logger.warning(f"total_images ({total_images}) != steps length ({len(steps_data)}), using steps length")
+            total_images = len(steps_data)
+
+        return {
+            'total_images': total_images,
+            'steps': [TrainingStepCreate(**step) for step in steps_data]
+        }
+
+    async def _request_plan(self, topic: str, preferences: dict = None) -> Dict[str, Any]:
+        """调用模型规划场景步骤，失败时抛出异常"""
+        prompt = self._build_plan_prompt(topic, preferences)
+        response = await self._generate_content(settings.gemini_text_model, prompt, operation="plan")
+        plan = self._parse_plan(response.text)
+        log_event(logger, "plan.generated", f"AI规划完成：将生成 {plan['total_images']} 张训练图片",
+                  total_images=plan['total_images'])
+        return plan
+
+    def _default_plan(self, topic: str) -> Dict[str, Any]:
+        """默认步骤（使用6字内的短指令）"""
+        default_steps = [
+            TrainingStepCreate(
+                step_order=1,
+                instruction="准备开始",
+                image_prompt=f"A child preparing for {topic} activity, simple illustration"
+            ),
+            TrainingStepCreate(
+                step_order=2,
+                instruction="执行步骤",
+                image_prompt=f"A child performing {topic} activity, clear visual guide"
+            ),
+            TrainingStepCreate(
+                step_order=3,
+                instruction="完成训练",
+                image_prompt=f"A child completing {topic} activity successfully"
+            )
+        ]
+        log_event(logger, "plan.default", f"使用默认规划：将生成 {len(default_steps)} 张训练图片", topic=topic)
+        return {
+            'total_images': len(default_steps),
+            'steps': default_steps
+        }
 
     async def generate_image(self, prompt: str) -> str:
         """生成训练图像"""
-        print(f"[图片生成] 提示词: {prompt}")
+        log_event(logger, "image.prompt", "[图片生成] 开始生成", prompt=prompt)
         try:
             # 前端已构建完整的图像生成提示词，直接使用
             # 使用新版SDK调用图像生成模型
             try:
-                if not self.client:
-                    raise Exception("API client not initialized")
-                # 使用gemini-2.5-flash-image模型生成图像
-                response = self.client.models.generate_content(
-                    model="gemini-3-pro-image-preview",
-                    contents=prompt
-                )
+                response = await self._generate_content(settings.gemini_image_model, prompt, operation="image")
                 
                 # 提取图像数据
                 if response and response.candidates:
@@ -178,61 +351,59 @@ image_prompt示例（主题：过马路）：
                         if candidate.content and candidate.content.parts:
                             for part in candidate.content.parts:
                                 if hasattr(part, 'inline_data') and part.inline_data:
-                                    # 获取图像数据（可能是bytes或base64字符串）
-                                    image_data = part.inline_data.data
+                                    with span("image.inspect_inline_data"):
+                                        # 获取图像数据（可能是bytes或base64字符串）
+                                        image_data = part.inline_data.data
                                     
-                                    # 处理 Gemini API 返回的数据格式
-                                    # Gemini 可能返回 Base64 编码的字符串（作为 bytes 或 str）
-                                    if isinstance(image_data, bytes):
-                                        # 检查是否是 Base64 编码的字符串（只包含 ASCII 可打印字符）
-                                        try:
-                                            # 尝试解码为字符串
-                                            data_str = image_data.decode('utf-8')
-                                            # 检查是否是 Base64 格式（只包含 Base64 字符）
-                                            import re
-                                            if re.match(r'^[A-Za-z0-9+/=\s]+$', data_str):
-                                                # 是 Base64 字符串，需要解码
-                                                print(f"[图片生成] 检测到 Base64 编码的 bytes，转换为字符串后解码")
-                                                image_data = data_str
-                                        except UnicodeDecodeError:
-                                            # 不是 UTF-8 字符串，可能是真正的二进制数据
-                                            pass
+                                        # 处理 Gemini API 返回的数据格式
+                                        # Gemini 可能返回 Base64 编码的字符串（作为 bytes 或 str）
+                                        if isinstance(image_data, bytes):
+                                            # 检查是否是 Base64 编码的字符串（只包含 ASCII 可打印字符）
+                                            try:
+                                                # 尝试解码为字符串
+                                                data_str = image_data.decode('utf-8')
+                                                # 检查是否是 Base64 格式（只包含 Base64 字符）
+                                                import re
+                                                if re.match(r'^[A-Za-z0-9+/=\s]+$', data_str):
+                                                    # 是 Base64 字符串，需要解码
+                                                    logger.debug("[图片生成] 检测到 Base64 编码的 bytes，转换为字符串后解码")
+                                                    image_data = data_str
+                                            except UnicodeDecodeError:
+                                                # 不是 UTF-8 字符串，可能是真正的二进制数据
+                                                pass
                                     
-                                    # 验证图片数据
-                                    if isinstance(image_data, bytes):
-                                        data_size = len(image_data)
-                                        # 检查 PNG 文件头（PNG 文件以 89 50 4E 47 开头）
-                                        is_valid_png = data_size > 8 and image_data[:8] == b'\x89PNG\r\n\x1a\n'
-                                        print(f"[图片生成] 图片数据验证: 大小={data_size} bytes, 有效PNG={is_valid_png}")
-                                        if not is_valid_png and data_size > 0:
-                                            print(f"[图片生成] 警告: 图片数据可能不是有效的PNG格式，前8字节: {image_data[:8]}")
-                                    elif isinstance(image_data, str):
-                                        data_size = len(image_data)
-                                        print(f"[图片生成] 图片数据验证: Base64字符串长度={data_size}")
+                                        # 验证图片数据
+                                        if isinstance(image_data, bytes):
+                                            data_size = len(image_data)
+                                            # 检查 PNG 文件头（PNG 文件以 89 50 4E 47 开头）
+                                            is_valid_png = data_size > 8 and image_data[:8] == b'\x89PNG\r\n\x1a\n'
+                                            log_event(logger, "image.data", "[图片生成] 图片数据验证", level=logging.DEBUG,
+                                                      size=data_size, valid_png=is_valid_png)
+                                            if not is_valid_png and data_size > 0:
+                                                logger.warning(f"[图片生成] 图片数据可能不是有效的PNG格式，前8字节: {image_data[:8]}")
+                                        elif isinstance(image_data, str):
+                                            data_size = len(image_data)
+                                            log_event(logger, "image.data", "[图片生成] 图片数据验证", level=logging.DEBUG,
+                                                      base64_length=data_size)
                                     
-                                    # 保存图像文件（file_manager 会正确处理 Base64 字符串）
-                                    relative_path = file_manager.save_image(image_data)
-                                    
-                                    # 验证文件是否真的保存成功
-                                    import os
-                                    from pathlib import Path
-                                    full_path = file_manager.upload_dir / relative_path
-                                    file_exists = full_path.exists()
-                                    file_size = full_path.stat().st_size if file_exists else 0
-                                    print(f"[图片生成] 文件保存验证: 路径={full_path}, 存在={file_exists}, 大小={file_size} bytes")
+                                    # 保存图像文件（file_manager 会正确处理 Base64 字符串），磁盘写入放到线程池
+                                    relative_path = await asyncio.to_thread(file_manager.save_image, image_data)
                                     
                                     # 返回文件URL
-                                    image_url = file_manager.get_file_url(relative_path)
-                                    print(f"[图片生成] 成功生成图片: {image_url}")
+                                    with span("file_manager.get_file_url"):
+                                        image_url = file_manager.get_file_url(relative_path)
+                                    log_event(logger, "image.generated", "[图片生成] 成功生成图片", image_url=image_url,
+                                              model=settings.gemini_image_model)
                                     return image_url
             except Exception as img_error:
-                print(f"Image model generation failed: {img_error}")
+                log_event(logger, "image.model_failed", f"Image model generation failed: {img_error}",
+                          level=logging.WARNING, model=settings.gemini_image_model)
                 # 如果图像生成失败，使用fallback
             
             # Fallback: 如果图像生成模型不可用，使用placeholder
             return self._get_fallback_image(prompt)
         except Exception as e:
-            print(f"Image generation failed: {e}")
+            logger.error(f"Image generation failed: {e}")
             return self._get_fallback_image(prompt)
 
     def _get_fallback_image(self, prompt: str) -> str:
@@ -241,56 +412,56 @@ image_prompt示例（主题：过马路）：
         return f"https://placehold.co/400x400/3b82f6/ffffff?text={encoded_prompt}"
 
     async def generate_tts(self, text: str, voice_name: str = "Kore", language: str = "zh-CN") -> str:
-        """生成TTS语音"""
+        """生成TTS语音
+
+        结果按 (文本, 音色, 语言, 模型) 的哈希缓存，重复的短指令直接复用已有的音频文件。
+        """
         try:
-            # 尝试使用Gemini的TTS功能
-            # 注意：Gemini API的TTS支持可能有限，这里尝试使用支持音频生成的模型
-            try:
-                # 构建TTS请求
-                prompt = f"Please say this text in a gentle, slow {language} tone: {text}"
-                
-                if not self.client:
-                    raise Exception("API client not initialized")
-                # 使用新版SDK调用（暂时保持原有逻辑，后续可优化）
-                response = self.client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=prompt
-                )
-                
-                # 提取音频数据
-                if response and response.candidates:
-                    for candidate in response.candidates:
-                        if candidate.content and candidate.content.parts:
-                            for part in candidate.content.parts:
-                                if hasattr(part, 'inline_data') and part.inline_data:
-                                    audio_base64 = part.inline_data.data
-                                    mime_type = getattr(part.inline_data, 'mime_type', 'audio/mp3')
-                                    
-                                    # 确定文件扩展名
-                                    ext = '.mp3'
-                                    if 'wav' in mime_type:
-                                        ext = '.wav'
-                                    elif 'ogg' in mime_type:
-                                        ext = '.ogg'
-                                    
-                                    # 保存音频文件
-                                    relative_path = file_manager.save_audio_from_base64(audio_base64)
-                                    
-                                    # 返回文件URL
-                                    return file_manager.get_file_url(relative_path)
-            except Exception as gemini_tts_error:
-                print(f"Gemini TTS not available: {gemini_tts_error}")
-                # 继续尝试其他方法
-                pass
-            
-            # Fallback: 如果Gemini TTS不可用，返回空字符串
-            # 在实际应用中，可以集成其他TTS服务（如Google Cloud TTS, OpenAI TTS等）
-            print("TTS generation failed: Gemini TTS not available. Consider integrating Google Cloud TTS or other services.")
-            return ""
-            
+            return await tts_cache.get_or_generate(
+                text,
+                voice_name,
+                language,
+                settings.gemini_tts_model,
+                self._synthesize_speech
+            )
         except Exception as e:
-            print(f"TTS generation failed: {e}")
+            logger.error(f"TTS generation failed: {e}")
             return ""
 
+    async def _synthesize_speech(self, text: str, voice_name: str, language: str):
+        """调用模型合成语音，返回 (音频数据, 文件扩展名)；模型不可用或没有音频输出时返回None"""
+        # 尝试使用Gemini的TTS功能
+        # 注意：Gemini API的TTS支持可能有限，这里尝试使用支持音频生成的模型
+        try:
+            # 构建TTS请求
+            prompt = f"Please say this text in a gentle, slow {language} tone: {text}"
+
+            response = await self._generate_content(settings.gemini_tts_model, prompt, operation="tts")
+
+            # 提取音频数据
+            if response and response.candidates:
+                for candidate in response.candidates:
+                    if candidate.content and candidate.content.parts:
+                        for part in candidate.content.parts:
+                            if hasattr(part, 'inline_data') and part.inline_data:
+                                mime_type = getattr(part.inline_data, 'mime_type', None) or 'audio/mp3'
+
+                                # 确定文件扩展名
+                                ext = '.mp3'
+                                if 'wav' in mime_type:
+                                    ext = '.wav'
+                                elif 'ogg' in mime_type:
+                                    ext = '.ogg'
+
+                                return part.inline_data.data, ext
+        except Exception as gemini_tts_error:
+            log_event(logger, "tts.model_failed", f"Gemini TTS not available: {gemini_tts_error}",
+                      level=logging.WARNING, model=settings.gemini_tts_model)
+
+        # 如果Gemini TTS不可用，返回None
+        # 在实际应用中，可以集成其他TTS服务（如Google Cloud TTS, OpenAI TTS等）
+        logger.warning("TTS generation failed: Gemini TTS not available. Consider integrating Google Cloud TTS or other services.")
+        return None
+
 ai_service = AIService()
 
@@ -1,12 +1,143 @@
 import os
-from typing import List
+from typing import Dict, List, Tuple
+
+
+def _parse_int_map(raw: str) -> Dict[str, int]:
+    """解析 "key=value,key=value" 形式的配置为字典"""
+    result: Dict[str, int] = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        key = key.strip()
+        if key and value.strip().isdigit():
+            result[key] = int(value.strip())
+    return result
+
+
+def _parse_float_map(raw: str) -> Dict[str, float]:
+    """解析 "key=0.1,key=0.5" 形式的配置为字典"""
+    result: Dict[str, float] = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        try:
+            result[key.strip()] = float(value)
+        except ValueError:
+            continue
+    return result
+
+
+def _parse_variants(raw: str) -> List[Tuple[int, str]]:
+    """解析 "256:webp,0:png" 形式的派生图片配置为 (宽度, 格式) 列表"""
+    variants: List[Tuple[int, str]] = []
+    for item in raw.split(","):
+        width, _, fmt = item.strip().partition(":")
+        if width.isdigit() and fmt:
+            variants.append((int(width), fmt.strip()))
+    return variants
+
 
 class Settings:
     # AI服务配置
     gemini_api_key: str = os.getenv("GEMINI_API_KEY", "")
 
+    # Gemini模型配置
+    gemini_text_model: str = os.getenv("GEMINI_TEXT_MODEL", "gemini-2.5-flash")
+    gemini_image_model: str = os.getenv("GEMINI_IMAGE_MODEL", "gemini-3-pro-image-preview")
+    gemini_tts_model: str = os.getenv("GEMINI_TTS_MODEL", "gemini-2.5-flash")
+
+    # Gemini并发配置：每个模型同时进行的调用数上限，超出的请求在事件循环上排队等待
+    # 格式："gemini-2.5-flash=8,gemini-3-pro-image-preview=3"，未列出的模型使用默认值
+    gemini_default_concurrency: int = int(os.getenv("GEMINI_DEFAULT_CONCURRENCY", "4"))
+    gemini_model_concurrency: Dict[str, int] = _parse_int_map(
+        os.getenv("GEMINI_MODEL_CONCURRENCY", "gemini-2.5-flash=8,gemini-3-pro-image-preview=3")
+    )
+    gemini_max_retries: int = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+
+    # 图片缓存配置（GeneratedContent表中的提示词→图片URL缓存）
+    image_cache_ttl_hours: int = int(os.getenv("IMAGE_CACHE_TTL_HOURS", str(24 * 30)))
+    image_cache_max_entries: int = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "5000"))
+
+    # 场景规划缓存配置（按主题+个性化设置缓存，进程内LRU）
+    plan_cache_ttl_seconds: int = int(os.getenv("PLAN_CACHE_TTL_SECONDS", "3600"))
+    plan_cache_max_entries: int = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "256"))
+
+    # 场景读取响应缓存：本进程的写操作立即失效；其他worker进程的写入最多在
+    # SCENARIO_CACHE_TTL_SECONDS 秒后可见（0 表示不缓存）
+    scenario_cache_ttl_seconds: float = float(os.getenv("SCENARIO_CACHE_TTL_SECONDS", "5"))
+
+    # 语音缓存配置（内存中最多记住的文本条目数，音频文件本身持久保存在磁盘上）
+    tts_cache_max_entries: int = int(os.getenv("TTS_CACHE_MAX_ENTRIES", "4096"))
+
+    # 后台任务配置（图片/语音生成任务队列）
+    job_workers: int = int(os.getenv("JOB_WORKERS", "4"))
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    job_retention_hours: int = int(os.getenv("JOB_RETENTION_HOURS", "72"))
+    # 执行中的任务每隔 JOB_HEARTBEAT_SECONDS 秒更新心跳；超过 JOB_STALE_SECONDS 秒没有心跳的
+    # running 任务视为执行它的进程已退出，重新排队（多个进程/worker共用任务表时不会重复执行）
+    job_heartbeat_seconds: int = int(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+    job_stale_seconds: int = int(os.getenv("JOB_STALE_SECONDS", "90"))
+    # 失败的任务等待 JOB_RETRY_BACKOFF_SECONDS × 2^(已尝试次数-1) 秒后重试，最长 JOB_RETRY_BACKOFF_MAX_SECONDS 秒
+    job_retry_backoff_seconds: float = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "5"))
+    job_retry_backoff_max_seconds: float = float(os.getenv("JOB_RETRY_BACKOFF_MAX_SECONDS", "300"))
+
+    # 训练步骤事件写缓冲：每隔 STEP_EVENT_FLUSH_MS 毫秒或攒够 STEP_EVENT_BATCH_SIZE 条时批量写入
+    step_event_flush_ms: int = int(os.getenv("STEP_EVENT_FLUSH_MS", "500"))
+    step_event_batch_size: int = int(os.getenv("STEP_EVENT_BATCH_SIZE", "200"))
+
+    # 上传文件存储模式：cas（按内容SHA-256命名、两级目录分片、相同内容只存一份）或 uuid（旧的随机命名）
+    storage_mode: str = os.getenv("STORAGE_MODE", "cas")
+
+    # 上传目录容量上限（字节，0表示不限制），超出时后台按最近最少访问淘汰未被训练步骤引用的文件
+    upload_max_bytes: int = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 ** 3)))
+    file_index_interval_seconds: int = int(os.getenv("FILE_INDEX_INTERVAL_SECONDS", "60"))
+
+    # 图片派生版本配置：可请求的宽度档位，以及保存原图后预生成的 (宽度:格式)，宽度0表示原始尺寸
+    image_derivative_widths: List[int] = [
+        int(w) for w in os.getenv("IMAGE_DERIVATIVE_WIDTHS", "128,256,512,1024").split(",") if w.strip().isdigit()
+    ]
+    image_derivative_defaults: List[Tuple[int, str]] = _parse_variants(
+        os.getenv("IMAGE_DERIVATIVE_DEFAULTS", "256:webp,0:webp,0:png")
+    )
+
+    # 结构化日志：app.* 日志只在请求路径上入队，由后台线程写入按大小轮转的JSON行文件（LOG_FILE留空则不写文件）
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    log_file: str = os.getenv("LOG_FILE", "logs/app.jsonl")
+    log_max_bytes: int = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    log_backup_count: int = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    log_console: bool = os.getenv("LOG_CONSOLE", "True").lower() == "true"
+    log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # 按事件名的采样率（0~1），如 "image.generated=0.1,file.url=0"；WARNING 及以上级别不采样
+    log_sample_rates: Dict[str, float] = _parse_float_map(os.getenv("LOG_SAMPLE_RATES", ""))
+
+    # /metrics 指标（Prometheus 文本格式）：按路由的请求数/延迟、Gemini调用、文件写入、缓存命中和SQL语句数
+    metrics_enabled: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+
+    # 请求追踪：采样请求的span保存在环形缓冲中，/debug/traces 查看瀑布图；
+    # TRACE_EXPORT_FILE 非空时同时以 OTLP/JSON 行导出到该文件
+    tracing_enabled: bool = os.getenv("TRACING_ENABLED", "True").lower() == "true"
+    trace_sample_rate: float = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+    trace_buffer_size: int = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+    trace_export_file: str = os.getenv("TRACE_EXPORT_FILE", "")
+
     # 数据库配置
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+    # 路由使用的异步数据库URL，留空时由 DATABASE_URL 推导（sqlite → sqlite+aiosqlite，postgresql → postgresql+asyncpg）
+    async_database_url: str = os.getenv("ASYNC_DATABASE_URL", "")
+    # 数据库引擎配置档：auto（按URL选择 sqlite / postgres）、sqlite、postgres、default（SQLAlchemy默认参数）
+    db_profile: str = os.getenv("DB_PROFILE", "auto")
+    # SQLite：WAL + synchronous=NORMAL，写锁等待、mmap 和页缓存大小
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    sqlite_mmap_bytes: int = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+    sqlite_cache_kib: int = int(os.getenv("SQLITE_CACHE_KIB", str(64 * 1024)))
+    # PostgreSQL：连接池和语句超时
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    db_pool_timeout: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    db_statement_timeout_ms: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
 
     # 应用配置
     debug: bool = os.getenv("DEBUG", "True").lower() == "true"
@@ -19,4 +150,3 @@ class Settings:
     )
 
 settings = Settings()
-
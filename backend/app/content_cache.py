@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app import models
+from app.config import settings
+from app.utils.file_manager import file_manager
+from app.utils.structured_log import log_event
+from app.utils.tracing import span
+from app.utils.ttl_cache import AsyncTTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """规范化提示词：合并空白并统一大小写，使仅有格式差异的提示词命中同一缓存"""
+    return " ".join(prompt.split()).casefold()
+
+
+class ImageCache:
+    """以 GeneratedContent 表为存储的图片读穿缓存
+
+    键为 (规范化提示词, 模型名) 的 SHA-256；命中时直接返回已保存的 /files/... URL。
+    超过TTL的条目视为失效，条目数超过上限时按最近访问时间淘汰。
+    淘汰只删除缓存记录，图片文件可能仍被训练步骤引用，因此保留在磁盘上。
+    """
+
+    content_type = "image"
+
+    def __init__(self, ttl_hours: int, max_entries: int):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, prompt: str, model: str) -> Tuple[str, str]:
+        normalized = normalize_prompt(prompt)
+        digest = hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+        return normalized, digest
+
+    def _find(self, db: Session, prompt_hash: str, model: str) -> Optional[models.GeneratedContent]:
+        return db.query(models.GeneratedContent).filter(
+            models.GeneratedContent.prompt_hash == prompt_hash,
+            models.GeneratedContent.content_type == self.content_type,
+            models.GeneratedContent.model_name == model
+        ).first()
+
+    def get(self, db: Session, prompt: str, model: str) -> Optional[str]:
+        """查找缓存的图片URL，过期或文件已丢失的条目会被删除"""
+        _, prompt_hash = self.make_key(prompt, model)
+        entry = self._find(db, prompt_hash, model)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        now = datetime.now()
+        expired = entry.created_at is not None and now - entry.created_at > self.ttl
+        path = file_manager.url_to_path(entry.content_url)
+        if expired or path is None or not path.exists():
+            db.delete(entry)
+            db.commit()
+            self.misses += 1
+            return None
+
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_accessed_at = now
+        db.commit()
+        self.hits += 1
+        return entry.content_url
+
+    def put(self, db: Session, prompt: str, model: str, url: str):
+        """记录生成结果；只缓存本地保存的图片，占位图等外部URL不缓存"""
+        if not url or not url.startswith("/files/"):
+            return
+        normalized, prompt_hash = self.make_key(prompt, model)
+        now = datetime.now()
+        entry = self._find(db, prompt_hash, model)
+        if entry is None:
+            entry = models.GeneratedContent(
+                content_type=self.content_type,
+                prompt=normalized,
+                model_name=model,
+                prompt_hash=prompt_hash,
+                hit_count=0
+            )
+            db.add(entry)
+        entry.content_url = url
+        entry.created_at = now
+        entry.last_accessed_at = now
+        db.commit()
+        self.evict(db)
+
+    def evict(self, db: Session) -> int:
+        """删除过期条目，并将条目数压到上限以内（最久未访问的先淘汰）"""
+        table = models.GeneratedContent
+        query = db.query(table).filter(table.content_type == self.content_type)
+        removed = query.filter(table.created_at < datetime.now() - self.ttl).delete(synchronize_session=False)
+
+        overflow = query.count() - self.max_entries
+        if overflow > 0:
+            stale_ids = [
+                row.id for row in query.with_entities(table.id)
+                .order_by(table.last_accessed_at.asc(), table.id.asc())
+                .limit(overflow)
+            ]
+            removed += db.query(table).filter(table.id.in_(stale_ids)).delete(synchronize_session=False)
+        db.commit()
+        return removed
+
+    async def get_or_generate(
+        self,
+        db: AsyncSession,
+        prompt: str,
+        model: str,
+        generate: Callable[[str], Awaitable[str]],
+        bypass_cache: bool = False
+    ) -> str:
+        """读穿缓存：命中直接返回，否则调用 generate 生成并写入缓存
+
+        bypass_cache 为 True 时（例如“重新生成”）跳过查找，但仍用新结果覆盖缓存。
+        get / put 通过 run_sync 在异步会话上执行，数据库IO不阻塞事件循环。
+        """
+        if not bypass_cache:
+            with span("image_cache.lookup", model=model) as s:
+                cached_url = await db.run_sync(self.get, prompt, model)
+                if s:
+                    s.set(hit=bool(cached_url))
+            if cached_url:
+                log_event(logger, "image.cache_hit", "[图片缓存] 命中", image_url=cached_url, model=model)
+                return cached_url
+
+        with span("image_cache.generate", model=model):
+            url = await generate(prompt)
+        with span("image_cache.store", model=model):
+            await db.run_sync(self.put, prompt, model, url)
+        return url
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class TTSCache:
+    """按内容哈希命名的语音文件缓存
+
+    文件名为 (文本, 音色, 语言, 模型) 的 SHA-256，按两级前缀分片保存在 uploads/audio/tts/ 下，
+    同一条指令在所有儿童和会话之间复用同一个音频文件，进程重启后仍能从磁盘命中。
+    内存层记住 键→文件路径 的映射，并合并同一文本的并发合成请求。
+    """
+
+    extensions = (".mp3", ".wav", ".ogg")
+
+    def __init__(self, max_entries: int):
+        self.subdir = "tts"
+        self._paths = AsyncTTLCache(max_entries=max_entries, ttl_seconds=24 * 3600)
+        self.lookups = 0
+        # 命中内存中的路径映射（包括合并到进行中的请求）
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.synthesized = 0
+        # 合成失败或没有返回音频（不计为命中）
+        self.failures = 0
+
+    @property
+    def cache_dir(self):
+        return file_manager.audio_dir / self.subdir
+
+    def make_key(self, text: str, voice_name: str, language: str, model: str) -> str:
+        raw = "\n".join([text.strip(), voice_name or "", language or "", model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _find_on_disk(self, key: str) -> Optional[str]:
+        for ext in self.extensions:
+            # 分片位置优先，其次是分片之前的平铺位置
+            for path in (file_manager.sharded_path(self.cache_dir, f"{key}{ext}"), self.cache_dir / f"{key}{ext}"):
+                if path.exists():
+                    return str(path.relative_to(file_manager.upload_dir))
+        return None
+
+    async def get_or_generate(
+        self,
+        text: str,
+        voice_name: str,
+        language: str,
+        model: str,
+        synthesize: Callable[[str, str, str], Awaitable[Optional[Tuple[object, str]]]]
+    ) -> str:
+        """返回语音文件URL；未缓存时调用 synthesize 合成，它返回 (音频数据, 扩展名)，无音频时返回None"""
+        self.lookups += 1
+        key = self.make_key(text, voice_name, language, model)
+        loaded = []
+
+        async def load() -> str:
+            loaded.append(True)
+            relative_path = self._find_on_disk(key)
+            if relative_path:
+                self.disk_hits += 1
+                return relative_path
+            with span("tts_cache.synthesize", model=model):
+                result = await synthesize(text, voice_name, language)
+            if result is None:
+                raise Exception("语音合成没有返回音频数据")
+            audio_data, ext = result
+            self.synthesized += 1
+            filename = file_manager.sharded_path(Path(self.subdir), f"{key}{ext}")
+            return await asyncio.to_thread(file_manager.save_audio, audio_data, str(filename))
+
+        try:
+            relative_path = await self._paths.get_or_load(key, load)
+            if not (file_manager.upload_dir / relative_path).exists():
+                # 文件已被清理，重新生成
+                self._paths.pop(key)
+                relative_path = await self._paths.get_or_load(key, load)
+        except Exception:
+            self.failures += 1
+            raise
+        if not loaded:
+            # 本次调用没有执行 load：路径来自内存映射或其他请求正在进行的加载
+            self.memory_hits += 1
+        return file_manager.get_file_url(relative_path)
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def misses(self) -> int:
+        return self.synthesized + self.failures
+
+    def stats(self) -> dict:
+        files = 0
+        total_bytes = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.startswith(".") and not name.endswith(".gz"):
+                    files += 1
+                    total_bytes += os.path.getsize(os.path.join(root, name))
+        return {
+            "lookups": self.lookups,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "synthesized": self.synthesized,
+            "failures": self.failures,
+            "hit_ratio": self.hits / self.lookups if self.lookups else 0.0,
+            "files": files,
+            "disk_bytes": total_bytes,
+        }
+
+
+image_cache = ImageCache(
+    ttl_hours=settings.image_cache_ttl_hours,
+    max_entries=settings.image_cache_max_entries
+)
+
+tts_cache = TTSCache(max_entries=settings.tts_cache_max_entries)
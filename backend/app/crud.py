@@ -1,15 +1,57 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import Dict, List, Optional
 from app import models, schemas
+from app.file_index import file_index
+from app.utils.response_cache import scenario_response_cache
 
 # Scenario CRUD
-def get_scenario(db: Session, scenario_id: int):
-    return db.query(models.Scenario).filter(models.Scenario.id == scenario_id).first()
+async def get_scenario(db: AsyncSession, scenario_id: int):
+    """获取场景，步骤随之预加载（异步会话不支持访问属性时的隐式懒加载）"""
+    result = await db.execute(
+        select(models.Scenario).options(selectinload(models.Scenario.steps)).where(models.Scenario.id == scenario_id)
+    )
+    return result.scalar_one_or_none()
+
+async def get_scenarios(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    """按id顺序分页获取场景，步骤通过一次批量查询预加载
+
+    传入 after_id 时使用键集分页（id > after_id），不再扫描并丢弃前面的行；
+    skip 仅为兼容旧客户端保留。
+    """
+    query = select(models.Scenario).options(selectinload(models.Scenario.steps)).order_by(models.Scenario.id)
+    if after_id is not None:
+        query = query.where(models.Scenario.id > after_id)
+    elif skip:
+        query = query.offset(skip)
+    result = await db.execute(query.limit(limit))
+    return result.scalars().all()
+
+async def get_scenario_summaries(db: AsyncSession, limit: int = 100, after_id: Optional[int] = None):
+    """场景列表的轻量版本：只返回场景基本信息和步骤数，不加载步骤内容"""
+    step_counts = select(
+        models.TrainingStep.scenario_id,
+        func.count(models.TrainingStep.id).label("step_count")
+    ).group_by(models.TrainingStep.scenario_id).subquery()
 
-def get_scenarios(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Scenario).offset(skip).limit(limit).all()
+    query = select(
+        models.Scenario.id,
+        models.Scenario.name,
+        models.Scenario.description,
+        models.Scenario.icon,
+        models.Scenario.is_custom,
+        models.Scenario.creator_id,
+        models.Scenario.created_at,
+        func.coalesce(step_counts.c.step_count, 0).label("step_count")
+    ).outerjoin(step_counts, step_counts.c.scenario_id == models.Scenario.id).order_by(models.Scenario.id)
+    if after_id is not None:
+        query = query.where(models.Scenario.id > after_id)
+    result = await db.execute(query.limit(limit))
+    return result.all()
 
-def create_scenario(db: Session, scenario: schemas.ScenarioCreate):
+async def create_scenario(db: AsyncSession, scenario: schemas.ScenarioCreate):
     db_scenario = models.Scenario(
         name=scenario.name,
         description=scenario.description,
@@ -17,7 +59,7 @@ def create_scenario(db: Session, scenario: schemas.ScenarioCreate):
         is_custom=True
     )
     db.add(db_scenario)
-    db.flush()
+    await db.flush()
 
     for step_data in scenario.steps:
         db_step = models.TrainingStep(
@@ -29,48 +71,177 @@ def create_scenario(db: Session, scenario: schemas.ScenarioCreate):
         )
         db.add(db_step)
 
-    db.commit()
-    db.refresh(db_scenario)
-    return db_scenario
+    await db.commit()
+    scenario_response_cache.bump()
+    return await get_scenario(db, db_scenario.id)
 
 # Training Record CRUD
-def create_training_record(db: Session, record: schemas.TrainingRecordCreate):
+async def get_training_record(db: AsyncSession, training_id: int):
+    result = await db.execute(select(models.TrainingRecord).where(models.TrainingRecord.id == training_id))
+    return result.scalar_one_or_none()
+
+async def create_training_record(db: AsyncSession, record: schemas.TrainingRecordCreate):
     db_record = models.TrainingRecord(**record.dict())
     db.add(db_record)
-    db.commit()
-    db.refresh(db_record)
+    await db.commit()
+    await db.refresh(db_record)
     return db_record
 
-def get_training_records(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.TrainingRecord).offset(skip).limit(limit).all()
-
-def delete_scenario_steps(db: Session, scenario_id: int):
-    """删除场景的所有步骤"""
-    steps = db.query(models.TrainingStep).filter(
-        models.TrainingStep.scenario_id == scenario_id
-    ).all()
-    for step in steps:
-        db.delete(step)
-    db.commit()
-    return len(steps)
-
-def update_scenario_steps(db: Session, scenario_id: int, steps: List[schemas.TrainingStepCreate]):
-    """更新场景的步骤（先删除旧步骤，再添加新步骤）"""
-    # 删除旧步骤
-    delete_scenario_steps(db, scenario_id)
-    
-    # 添加新步骤
+async def increment_completed_steps(db: AsyncSession, training_id: int) -> Optional[int]:
+    """原子地将训练记录的 completed_steps 加一，返回新值；记录不存在时返回None"""
+    table = models.TrainingRecord
+    statement = update(table).where(table.id == training_id).values(
+        completed_steps=func.coalesce(table.completed_steps, 0) + 1
+    )
+    if db.bind.dialect.update_returning:
+        completed_steps = (await db.execute(statement.returning(table.completed_steps))).scalar()
+    else:
+        completed_steps = None
+        if (await db.execute(statement)).rowcount:
+            completed_steps = (await db.execute(select(table.completed_steps).where(table.id == training_id))).scalar()
+    await db.commit()
+    return completed_steps
+
+async def get_training_records(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    user_id: Optional[int] = None,
+    scenario_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    overall_level: Optional[str] = None,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None
+):
+    """按开始时间倒序获取训练记录，支持筛选和键集分页
+
+    翻页时传入上一页最后一条记录的 started_at 和 id 作为 before / before_id，
+    由 (user_id, started_at)、(scenario_id, started_at) 等索引直接定位；skip 仅为兼容旧客户端保留。
+    """
+    table = models.TrainingRecord
+    query = select(table)
+    if user_id is not None:
+        query = query.where(table.user_id == user_id)
+    if scenario_id is not None:
+        query = query.where(table.scenario_id == scenario_id)
+    if start_date is not None:
+        query = query.where(table.started_at >= start_date)
+    if end_date is not None:
+        query = query.where(table.started_at < end_date)
+    if overall_level is not None:
+        query = query.where(table.overall_level == overall_level)
+
+    if before is not None:
+        if before_id is not None:
+            query = query.where(tuple_(table.started_at, table.id) < tuple_(before, before_id))
+        else:
+            query = query.where(table.started_at < before)
+    elif skip:
+        query = query.offset(skip)
+    result = await db.execute(query.order_by(table.started_at.desc(), table.id.desc()).limit(limit))
+    return result.scalars().all()
+
+async def delete_scenario_steps(db: AsyncSession, scenario_id: int):
+    """删除场景的所有步骤（一条DELETE语句）"""
+    table = models.TrainingStep
+    image_urls = (await db.execute(select(table.image_url).where(table.scenario_id == scenario_id))).scalars().all()
+    if image_urls:
+        await db.execute(delete(table).where(table.scenario_id == scenario_id))
+    await db.commit()
+    scenario_response_cache.bump()
+    file_index.note_references(image_urls)
+    return len(image_urls)
+
+_STEP_FIELDS = ("instruction", "image_prompt", "image_url")
+
+def diff_scenario_steps(existing: List[models.TrainingStep], steps: List[schemas.TrainingStepCreate]):
+    """按 step_order 对比已有步骤和新步骤，返回 (更新列表, 插入列表, 删除的步骤id)
+
+    同一 step_order 的步骤保留原id，内容完全相同时不产生写入。新步骤未提供 image_url 且
+    image_prompt 未变时沿用原图片；image_prompt 变化时原图片不再对应，清空。
+    """
+    by_order = {}
+    for step in existing:
+        by_order.setdefault(step.step_order, step)
+
+    updates, inserts, matched_ids = [], [], set()
     for step_data in steps:
-        db_step = models.TrainingStep(
-            scenario_id=scenario_id,
-            step_order=step_data.step_order,
-            instruction=step_data.instruction,
-            image_prompt=step_data.image_prompt,
-            image_url=step_data.image_url
+        current = by_order.pop(step_data.step_order, None)
+        values = {
+            "step_order": step_data.step_order,
+            "instruction": step_data.instruction,
+            "image_prompt": step_data.image_prompt,
+            "image_url": step_data.image_url,
+        }
+        if current is None:
+            inserts.append(values)
+            continue
+        matched_ids.add(current.id)
+        if values["image_url"] is None and values["image_prompt"] == current.image_prompt:
+            values["image_url"] = current.image_url
+        changed = {field: values[field] for field in _STEP_FIELDS if values[field] != getattr(current, field)}
+        if changed:
+            updates.append({"id": current.id, **changed})
+
+    # 未匹配的旧步骤（包括同一 step_order 的重复步骤）删除
+    delete_ids = [step.id for step in existing if step.id not in matched_ids]
+    return updates, inserts, delete_ids
+
+async def update_scenario_steps(db: AsyncSession, scenario_id: int, steps: List[schemas.TrainingStepCreate]):
+    """按 step_order 增量更新场景的步骤
+
+    在一个事务中批量执行 UPDATE / INSERT / DELETE：未变化的步骤不写入，保留id和已生成的图片，
+    更新过程中场景不会出现没有步骤的中间状态。
+    """
+    table = models.TrainingStep
+    existing = (await db.execute(
+        select(table).where(table.scenario_id == scenario_id).order_by(table.step_order, table.id)
+    )).scalars().all()
+    updates, inserts, delete_ids = diff_scenario_steps(existing, steps)
+
+    old_urls = {step.id: step.image_url for step in existing}
+    if delete_ids:
+        await db.execute(delete(table).where(table.id.in_(delete_ids)))
+    if updates:
+        await db.execute(update(table), updates)
+    if inserts:
+        await db.execute(insert(table), [{"scenario_id": scenario_id, **values} for values in inserts])
+    await db.commit()
+
+    if delete_ids or updates or inserts:
+        scenario_response_cache.bump()
+        # 批量语句不经过ORM的flush事件，需要手动通知文件索引重新统计引用数
+        file_index.note_references(
+            [old_urls[step_id] for step_id in delete_ids]
+            + [old_urls[values["id"]] for values in updates if "image_url" in values]
+            + [values.get("image_url") for values in updates + inserts]
         )
-        db.add(db_step)
-    
-    db.commit()
-    db.refresh(db.query(models.Scenario).filter(models.Scenario.id == scenario_id).first())
-    return db.query(models.TrainingStep).filter(models.TrainingStep.scenario_id == scenario_id).order_by(models.TrainingStep.step_order).all()
+    result = await db.execute(
+        select(table).where(table.scenario_id == scenario_id).order_by(table.step_order)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().all()
 
+async def update_step_images(db: AsyncSession, scenario_id: int, image_urls: Dict[int, str]) -> int:
+    """在一个事务中批量写入步骤图片URL（step_id -> image_url），只更新属于该场景的步骤"""
+    if not image_urls:
+        return 0
+    rows = await db.execute(
+        select(models.TrainingStep.id, models.TrainingStep.image_url).where(
+            models.TrainingStep.scenario_id == scenario_id,
+            models.TrainingStep.id.in_(list(image_urls))
+        )
+    )
+    old_urls = {row.id: row.image_url for row in rows}
+    step_ids = list(old_urls)
+    if step_ids:
+        await db.execute(
+            update(models.TrainingStep),
+            [{"id": step_id, "image_url": image_urls[step_id]} for step_id in step_ids]
+        )
+    await db.commit()
+    scenario_response_cache.bump()
+    # 批量UPDATE不经过ORM的flush事件，需要手动通知文件索引重新统计引用数
+    file_index.note_references(list(old_urls.values()) + [image_urls[step_id] for step_id in step_ids])
+    return len(step_ids)
@@ -1,25 +1,138 @@
-from sqlalchemy import create_engine
+import logging
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.utils.metrics import count_query
+
+logger = logging.getLogger(__name__)
+
+def resolve_profile(database_url: str, profile: str = "auto") -> str:
+    if profile != "auto":
+        return profile
+    backend = make_url(database_url).get_backend_name()
+    return {"sqlite": "sqlite", "postgresql": "postgres"}.get(backend, "default")
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """每个新连接上设置的 SQLite 参数
+
+    WAL 模式下读写互不阻塞；synchronous=NORMAL 在 WAL 下仍保证数据库一致，只在断电时
+    可能丢失最后几个事务；busy_timeout 让并发写入等待锁而不是立即报 database is locked。
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_bytes)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_kib)}")
+    finally:
+        cursor.close()
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def to_async_url(database_url: str) -> str:
+    """同步数据库URL转换为对应的异步驱动URL（sqlite → aiosqlite，postgresql → asyncpg）"""
+    url = make_url(database_url)
+    drivername = _ASYNC_DRIVERS.get(url.get_backend_name())
+    if drivername is None:
+        raise ValueError(f"不支持异步访问的数据库: {url.get_backend_name()}")
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+def _engine_options(database_url: str, profile: str, is_async: bool):
+    """按配置档生成引擎参数，返回 (create_engine参数, 是否需要设置SQLite pragma)
+
+    - sqlite：WAL、synchronous=NORMAL、busy_timeout、mmap 和页缓存（连接建立时设置）
+    - postgres：固定大小的连接池 + 溢出、pre-ping、连接回收和语句超时
+    - default：SQLAlchemy 默认参数（用于基准对比）
+    """
+    profile = resolve_profile(database_url, profile)
+    is_sqlite = make_url(database_url).get_backend_name() == "sqlite"
+    connect_args = {"check_same_thread": False} if is_sqlite else {}
+    options = {"connect_args": connect_args}
+
+    if profile == "sqlite" and is_sqlite:
+        connect_args["timeout"] = settings.sqlite_busy_timeout_ms / 1000
+        return options, True
+
+    if profile == "postgres" and not is_sqlite:
+        # 语句超时通过连接参数设置：asyncpg 使用 server_settings，psycopg2 / psycopg 使用 options
+        if is_async:
+            connect_args["server_settings"] = {"statement_timeout": str(int(settings.db_statement_timeout_ms))}
+        else:
+            connect_args["options"] = f"-c statement_timeout={int(settings.db_statement_timeout_ms)}"
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=True
+        )
+    return options, False
+
+def build_engine(database_url: str, profile: str = "auto") -> Engine:
+    """按配置档创建同步数据库引擎（后台线程、迁移和初始化脚本使用）"""
+    options, sqlite_pragmas = _engine_options(database_url, profile, is_async=False)
+    engine = create_engine(database_url, **options)
+    if sqlite_pragmas:
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+    # 按请求统计SQL语句数（/metrics）
+    event.listen(engine, "before_cursor_execute", count_query)
+    return engine
+
+def build_async_engine(database_url: str, profile: str = "auto") -> AsyncEngine:
+    """按配置档创建异步数据库引擎（路由处理函数使用，数据库IO不阻塞事件循环）"""
+    options, sqlite_pragmas = _engine_options(database_url, profile, is_async=True)
+    engine = create_async_engine(settings.async_database_url or to_async_url(database_url), **options)
+    if sqlite_pragmas:
+        event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+    return engine
 
 # 创建数据库引擎
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
-)
+engine = build_engine(settings.database_url, settings.db_profile)
+async_engine = build_async_engine(settings.database_url, settings.db_profile)
 
 # 创建Session工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 异步会话提交后不过期对象，避免提交后访问属性时触发隐式的同步加载
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # 声明式基类
 Base = declarative_base()
 
 # 数据库依赖注入
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
+def sync_schema(bind=None):
+    """创建缺失的表，并为已有的表补齐新增的列和索引
+
+    create_all 只会创建不存在的表；已有数据库中的表在模型新增列或索引后
+    需要在这里补齐。新增列必须可为空（或带默认值），以便直接 ALTER TABLE。
+    """
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+                logger.info(f"数据库迁移: {table.name} 新增列 {column.name}")
+
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            index.create(bind=bind, checkfirst=True)
+            logger.info(f"数据库迁移: {table.name} 新增索引 {index.name}")
@@ -0,0 +1,139 @@
+import logging
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional
+from app import models
+from app.database import SessionLocal
+from app.utils.file_manager import file_manager
+from app.utils.image_derivatives import DERIVED_DIRNAME
+from app.utils.response_cache import scenario_response_cache
+
+logger = logging.getLogger(__name__)
+
+
+class FileAliasResolver:
+    """旧文件路径到内容寻址路径的别名表
+
+    迁移后旧的 /files/... URL（已保存在训练步骤、缓存记录或客户端中）仍能访问：
+    静态文件服务找不到文件时按别名表解析到新路径。别名表很小，整体加载到内存。
+    """
+
+    def __init__(self):
+        self._aliases: Optional[Dict[str, str]] = None
+        self._lock = Lock()
+
+    def _load(self) -> Dict[str, str]:
+        with self._lock:
+            if self._aliases is None:
+                db = SessionLocal()
+                try:
+                    self._aliases = {
+                        row.legacy_path: row.target_path
+                        for row in db.query(models.FileAlias).all()
+                    }
+                finally:
+                    db.close()
+            return self._aliases
+
+    def resolve(self, relative_path: str) -> Optional[str]:
+        """返回别名对应的新相对路径（以 / 分隔），没有别名时返回None"""
+        return self._load().get(relative_path.replace("\\", "/").lstrip("/"))
+
+    def add(self, legacy_path: str, target_path: str):
+        self._load()[legacy_path] = target_path
+
+    def invalidate(self):
+        with self._lock:
+            self._aliases = None
+
+
+file_aliases = FileAliasResolver()
+
+
+def _relative(path: Path) -> str:
+    return path.relative_to(file_manager.upload_dir).as_posix()
+
+
+def _legacy_files():
+    """分片存储之前平铺保存的文件：images/、audio/ 和 audio/tts/ 下的直接子文件"""
+    tts_dir = file_manager.audio_dir / "tts"
+    for directory in (file_manager.images_dir, file_manager.audio_dir, tts_dir):
+        if not directory.exists():
+            continue
+        for path in sorted(directory.iterdir()):
+            if path.is_file() and not path.name.startswith(".") and path.suffix != ".gz":
+                yield directory, path
+
+
+def _target_for(directory: Path, path: Path) -> Path:
+    if directory.name == "tts":
+        # 语音缓存文件名是合成参数的哈希，保持原名只做分片
+        return file_manager.sharded_path(directory, path.name)
+    return file_manager.content_path(directory, path.read_bytes(), path.suffix)
+
+
+def migrate_legacy_files() -> int:
+    """将平铺保存的旧文件迁移到内容寻址的分片目录，返回迁移的文件数
+
+    每个文件先记录别名、把数据库中引用旧URL的训练步骤和缓存记录改为新URL并提交，
+    再移动文件（或与已存在的相同内容去重）。可重复执行：已迁移的文件不会再出现在平铺目录中，
+    提交后移动前中断的文件会在下次执行时重新处理。
+    """
+    db = SessionLocal()
+    migrated = 0
+    try:
+        for directory, path in _legacy_files():
+            target = _target_for(directory, path)
+            legacy_path, target_path = _relative(path), _relative(target)
+            old_url, new_url = f"/files/{legacy_path}", f"/files/{target_path}"
+
+            # 先提交别名和URL改写，再移动文件：中途失败时旧文件仍在平铺目录中，
+            # 旧URL照常访问，重新执行会再次处理它；反过来则文件已移走却没有别名，旧URL无法恢复
+            db.merge(models.FileAlias(legacy_path=legacy_path, target_path=target_path))
+            db.query(models.TrainingStep).filter(models.TrainingStep.image_url == old_url).update(
+                {models.TrainingStep.image_url: new_url}, synchronize_session=False
+            )
+            db.query(models.GeneratedContent).filter(models.GeneratedContent.content_url == old_url).update(
+                {models.GeneratedContent.content_url: new_url}, synchronize_session=False
+            )
+            db.commit()
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            gz_sibling = path.with_name(path.name + ".gz")
+            if target.exists():
+                # 相同内容已存在，删除重复文件
+                path.unlink()
+                if gz_sibling.exists():
+                    gz_sibling.unlink()
+            else:
+                os.replace(path, target)
+                if gz_sibling.exists():
+                    os.replace(gz_sibling, target.with_name(target.name + ".gz"))
+
+            # 旧文件名派生出的缩略图等不再使用，按需在新位置重新生成
+            derived_dir = directory / DERIVED_DIRNAME
+            if derived_dir.exists():
+                for derived in derived_dir.glob(f"{path.stem}.w*"):
+                    derived.unlink()
+
+            file_aliases.add(legacy_path, target_path)
+            file_manager.notify(path, "delete")
+            file_manager.notify(target, "write")
+            migrated += 1
+
+        if migrated:
+            scenario_response_cache.bump()
+            logger.info(f"文件迁移: {migrated} 个文件已迁移到内容寻址存储")
+        return migrated
+    except Exception as e:
+        logger.error(f"文件迁移失败: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    migrate_legacy_files()
@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import os
+import urllib.parse
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import event, func, inspect, or_, update
+from sqlalchemy.orm import Session
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+from app.utils.file_manager import file_manager
+from app.utils.image_derivatives import DERIVED_DIRNAME, image_derivatives
+
+logger = logging.getLogger(__name__)
+
+# 只索引这些目录下的生成文件（派生版本和预压缩兄弟文件计入原文件）
+INDEXED_DIRS = ("images", "audio")
+_CHUNK = 500
+
+
+def _chunks(items: List, size: int = _CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def url_to_key(url: Optional[str]) -> Optional[str]:
+    """训练步骤的图片URL → 索引键，不是本地文件URL时返回None
+
+    前端保存的是带域名的绝对URL（http://host/files/images/...），与 /files/... 计为同一文件。
+    """
+    if not url:
+        return None
+    path = urllib.parse.urlsplit(url).path
+    if not path.startswith("/files/"):
+        return None
+    return path[len("/files/"):]
+
+
+class FileIndex:
+    """上传文件索引与按容量的LRU淘汰
+
+    stored_files 表记录每个文件的 (路径, 大小, 最近访问时间, 引用数)。写入、访问和
+    步骤图片变更先记录在内存缓冲中（请求路径上只做一次加锁的字典写入），由后台任务
+    定期批量写入数据库。上传目录超过容量上限时，按 (引用数, 最近访问时间) 的索引取出
+    最久未访问且未被训练步骤引用的文件删除，开销只与淘汰的文件数有关，不再扫描整个目录。
+    仍被训练步骤引用的文件不会被淘汰。
+    """
+
+    # 淘汰到容量上限的90%为止，避免每轮都在上限附近反复淘汰
+    low_watermark = 0.9
+
+    def __init__(self, max_bytes: int, interval_seconds: int, batch_size: int = 200):
+        self.max_bytes = max_bytes
+        self.interval_seconds = max(1, interval_seconds)
+        self.batch_size = batch_size
+        self.root = os.path.realpath(file_manager.upload_dir)
+        self.total_bytes: Optional[int] = None
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self._lock = Lock()
+        self._writes: Set[str] = set()
+        self._extra_bytes: Dict[str, int] = defaultdict(int)
+        self._touches: Dict[str, datetime] = {}
+        self._deletes: Set[str] = set()
+        self._dirty_refs: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def key_for(self, path) -> Optional[str]:
+        """磁盘路径 → 索引键（相对上传目录的路径），不属于索引范围时返回None"""
+        relative = os.path.relpath(os.path.realpath(path), self.root).replace(os.sep, "/")
+        parts = relative.split("/")
+        if parts[0] not in INDEXED_DIRS or DERIVED_DIRNAME in parts or parts[-1].startswith(".") \
+                or relative.endswith((".gz", ".br")):
+            return None
+        return relative
+
+    # ---- 事件记录（请求路径上调用，只写内存） ----
+
+    def on_file_event(self, path: Path, event_name: str):
+        key = self.key_for(path)
+        if key is None:
+            return
+        with self._lock:
+            if event_name == "write":
+                self._writes.add(key)
+                self._deletes.discard(key)
+            elif event_name == "delete":
+                self._deletes.add(key)
+                self._writes.discard(key)
+            self._touches[key] = datetime.now()
+
+    def on_derivative(self, original: Path, derivative: Path):
+        key = self.key_for(original)
+        if key is None:
+            return
+        size = derivative.stat().st_size
+        with self._lock:
+            self._extra_bytes[key] += size
+
+    def touch(self, path):
+        """文件被访问（静态服务或派生图片路由调用）"""
+        key = self.key_for(path)
+        if key is not None:
+            with self._lock:
+                self._touches[key] = datetime.now()
+
+    def note_references(self, urls: Iterable[Optional[str]]):
+        """训练步骤的图片URL发生变化，下一轮重新统计这些文件的引用数"""
+        keys = {url_to_key(url) for url in urls} - {None}
+        if keys:
+            with self._lock:
+                self._dirty_refs.update(keys)
+
+    # ---- 后台维护 ----
+
+    def _file_size(self, key: str) -> int:
+        path = file_manager.upload_dir / key
+        size = 0
+        for candidate in [path] + [path.with_name(path.name + suffix) for suffix in (".gz", ".br")]:
+            try:
+                size += candidate.stat().st_size
+            except FileNotFoundError:
+                continue
+        return size
+
+    def _count_references(self, db: Session, keys: List[str]) -> Dict[str, int]:
+        """统计引用这些文件的训练步骤数，相对和绝对URL都计入"""
+        counts: Dict[str, int] = defaultdict(int)
+        wanted = set(keys)
+        # 按后缀匹配（LIKE），每条查询的条件数比 _CHUNK 少，避免超出SQLite的表达式深度限制
+        for chunk in _chunks(keys, 100):
+            column = models.TrainingStep.image_url
+            rows = db.query(column, func.count(models.TrainingStep.id)).filter(
+                or_(*[column.endswith(f"/files/{key}", autoescape=True) for key in chunk])
+            ).group_by(column)
+            for url, count in rows:
+                key = url_to_key(url)
+                if key in wanted:
+                    counts[key] += count
+        return dict(counts)
+
+    def bootstrap(self, db: Session):
+        """索引为空时扫描一次上传目录建立索引，之后只做增量维护"""
+        if db.query(models.StoredFile.path).first() is None:
+            rows: Dict[str, dict] = {}
+            derived_sizes: Dict[str, int] = defaultdict(int)
+            for directory in INDEXED_DIRS:
+                for dirpath, _, names in os.walk(file_manager.upload_dir / directory):
+                    for name in names:
+                        path = Path(dirpath) / name
+                        if path.parent.name == DERIVED_DIRNAME:
+                            # derived/<原文件名>.w<宽度>.<格式>，生成的图片原文件均为png
+                            original = path.parent.parent / f"{name.split('.w')[0]}.png"
+                            derived_sizes[self.key_for(original)] += path.stat().st_size
+                            continue
+                        key = self.key_for(path)
+                        if key is None:
+                            continue
+                        stat_result = path.stat()
+                        rows[key] = {
+                            "path": key,
+                            "size": self._file_size(key),
+                            "last_access": datetime.fromtimestamp(stat_result.st_mtime),
+                            "ref_count": 0,
+                        }
+            for key, size in derived_sizes.items():
+                if key in rows:
+                    rows[key]["size"] += size
+            for key, count in self._count_references(db, list(rows)).items():
+                rows[key]["ref_count"] = count
+            for chunk in _chunks(list(rows.values())):
+                db.bulk_insert_mappings(models.StoredFile, chunk)
+            db.commit()
+            logger.info(f"[文件索引] 已建立索引: {len(rows)} 个文件")
+
+        self.total_bytes = db.query(func.coalesce(func.sum(models.StoredFile.size), 0)).scalar()
+
+    def flush(self, db: Session):
+        """将内存中的写入、访问和引用变更批量写入索引"""
+        with self._lock:
+            writes, self._writes = self._writes, set()
+            extra_bytes, self._extra_bytes = self._extra_bytes, defaultdict(int)
+            touches, self._touches = self._touches, {}
+            deletes, self._deletes = self._deletes, set()
+            dirty_refs, self._dirty_refs = self._dirty_refs, set()
+
+        table = models.StoredFile
+        if deletes:
+            for chunk in _chunks(list(deletes)):
+                for row in db.query(table).filter(table.path.in_(chunk)):
+                    self.total_bytes -= row.size
+                    db.delete(row)
+
+        if writes:
+            existing = {}
+            for chunk in _chunks(list(writes)):
+                existing.update({row.path: row for row in db.query(table).filter(table.path.in_(chunk))})
+            now = datetime.now()
+            for key in writes:
+                size = self._file_size(key) + extra_bytes.pop(key, 0)
+                row = existing.get(key)
+                if row is None:
+                    db.add(table(path=key, size=size, last_access=touches.pop(key, now), ref_count=0))
+                    self.total_bytes += size
+                else:
+                    self.total_bytes += size - row.size
+                    row.size = size
+                dirty_refs.add(key)
+            db.flush()
+
+        if extra_bytes:
+            for chunk in _chunks(list(extra_bytes)):
+                for row in db.query(table).filter(table.path.in_(chunk)):
+                    row.size += extra_bytes[row.path]
+                    self.total_bytes += extra_bytes[row.path]
+
+        if touches:
+            known: Set[str] = set()
+            for chunk in _chunks(list(touches)):
+                known.update(path for (path,) in db.query(table.path).filter(table.path.in_(chunk)))
+            if known:
+                db.execute(update(table), [{"path": key, "last_access": touches[key]} for key in known])
+
+        if dirty_refs:
+            keys = list(dirty_refs)
+            counts = self._count_references(db, keys)
+            for chunk in _chunks(keys):
+                for row in db.query(table).filter(table.path.in_(chunk)):
+                    row.ref_count = counts.get(row.path, 0)
+
+        db.commit()
+
+    def evict(self, db: Session) -> int:
+        """超过容量上限时淘汰最久未访问的未引用文件，返回淘汰的文件数"""
+        if self.max_bytes <= 0 or self.total_bytes <= self.max_bytes:
+            return 0
+
+        table = models.StoredFile
+        target = self.max_bytes * self.low_watermark
+        evicted = 0
+        while self.total_bytes > target:
+            candidates = db.query(table).filter(table.ref_count == 0).order_by(
+                table.last_access.asc(), table.path.asc()
+            ).limit(self.batch_size).all()
+            if not candidates:
+                logger.warning(f"[文件索引] 上传目录 {self.total_bytes} 字节超过上限，但剩余文件都被训练步骤引用")
+                break
+
+            # 引用数可能尚未同步（例如其他进程刚写入步骤图片），删除前再核对一次
+            counts = self._count_references(db, [row.path for row in candidates])
+            for row in candidates:
+                if self.total_bytes <= target:
+                    break
+                if counts.get(row.path):
+                    row.ref_count = counts[row.path]
+                    continue
+                freed = file_manager.delete(row.path)
+                self.total_bytes -= row.size
+                self.evicted_bytes += freed
+                evicted += 1
+                db.delete(row)
+            db.commit()
+
+        self.evicted_files += evicted
+        if evicted:
+            logger.info(f"[文件索引] 淘汰 {evicted} 个文件，当前 {self.total_bytes} 字节")
+        return evicted
+
+    def run_once(self):
+        db = SessionLocal()
+        try:
+            if self.total_bytes is None:
+                self.bootstrap(db)
+            self.flush(db)
+            self.evict(db)
+        finally:
+            db.close()
+
+    async def start(self):
+        await asyncio.to_thread(self.run_once)
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.run_once)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.warning(f"[文件索引] 维护失败: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "evicted_files": self.evicted_files,
+            "evicted_bytes": self.evicted_bytes,
+            "pending_writes": len(self._writes),
+            "pending_touches": len(self._touches),
+        }
+
+
+file_index = FileIndex(
+    max_bytes=settings.upload_max_bytes,
+    interval_seconds=settings.file_index_interval_seconds
+)
+file_manager.listeners.append(file_index.on_file_event)
+image_derivatives.listeners.append(file_index.on_derivative)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_step_image_changes(session, flush_context, instances):
+    """通过ORM新增、修改或删除训练步骤时，记录受影响的图片URL以重新统计引用数
+
+    监听 Session 类，同步会话和 AsyncSession 内部的同步会话都会触发。
+    """
+    urls = []
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, models.TrainingStep):
+            urls.append(obj.image_url)
+    for obj in session.dirty:
+        if isinstance(obj, models.TrainingStep):
+            history = inspect(obj).attrs.image_url.history
+            urls.extend(history.added or ())
+            urls.extend(history.deleted or ())
+    file_index.note_references(urls)
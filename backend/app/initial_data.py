@@ -1,124 +1,203 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app.crud import diff_scenario_steps
 from app.database import SessionLocal
-from app.models import Scenario, TrainingStep
+from app.file_index import file_index
+from app.models import Scenario, SeedVersion, TrainingStep
+from app.schemas import TrainingStepCreate
+from app.utils.response_cache import scenario_response_cache
 
-def create_initial_data():
-    """创建或更新初始演示数据"""
-    db = SessionLocal()
+logger = logging.getLogger(__name__)
 
-    try:
-        # 预设场景数据
-        scenarios_data = [
+SEED_NAME = "preset_scenarios"
+
+# 预设场景数据（修改后下次启动按 step_order 增量同步到数据库）
+PRESET_SCENARIOS = [
+    {
+        "name": "超市排队",
+        "description": "学习在超市结账时遵守排队规则",
+        "icon": "🛒",
+        "steps": [
+            {
+                "step_order": 1,
+                "instruction": "站在黄线后面",
+                "image_prompt": "a child standing quietly behind a clear thick yellow line on the floor, back view, clear spatial markers"
+            },
+            {
+                "step_order": 2,
+                "instruction": "保持安全距离",
+                "image_prompt": "two children waiting in line with a 2-meter gap between them, simple floor footprints markings"
+            },
+            {
+                "step_order": 3,
+                "instruction": "把物品放在柜台",
+                "image_prompt": "a single hand placing a milk carton on a clean white checkout counter, high contrast"
+            }
+        ]
+    },
+    {
+        "name": "过马路",
+        "description": "交通安全与信号灯识别",
+        "icon": "🚦",
+        "steps": [
             {
-                "name": "超市排队",
-                "description": "学习在超市结账时遵守排队规则",
-                "icon": "🛒",
-                "steps": [
-                    {
-                        "step_order": 1,
-                        "instruction": "站在黄线后面",
-                        "image_prompt": "a child standing quietly behind a clear thick yellow line on the floor, back view, clear spatial markers"
-                    },
-                    {
-                        "step_order": 2,
-                        "instruction": "保持安全距离",
-                        "image_prompt": "two children waiting in line with a 2-meter gap between them, simple floor footprints markings"
-                    },
-                    {
-                        "step_order": 3,
-                        "instruction": "把物品放在柜台",
-                        "image_prompt": "a single hand placing a milk carton on a clean white checkout counter, high contrast"
-                    }
-                ]
+                "step_order": 1,
+                "instruction": "转头观察",
+                "image_prompt": "白色背景，一个的小朋友站在斑马线前准备过马路前转头观察(没有通过马路)，头部明显向左转动90度观察，动作流畅自然。背景只有简单的灰色道路轮廓和黑白相间的斑马线。"
             },
             {
-                "name": "过马路",
-                "description": "交通安全与信号灯识别",
-                "icon": "🚦",
-                "steps": [
-                    {
-                        "step_order": 1,
-                        "instruction": "转头观察",
-                        "image_prompt": "白色背景，一个的小朋友站在斑马线前准备过马路前转头观察(没有通过马路)，头部明显向左转动90度观察，动作流畅自然。背景只有简单的灰色道路轮廓和黑白相间的斑马线。"
-                    },
-                    {
-                        "step_order": 2,
-                        "instruction": "耐心等待绿灯",
-                        "image_prompt": "绘制小朋友站在斑马线前的背身(尚未通过马路)，抬头看着前方交通信号灯等待, 信号灯显示红色圆圈 "
-                    },
-                    {
-                        "step_order": 3,
-                        "instruction": "直行通过",
-                        "image_prompt": "小朋友通过斑马线, 背景只有简单的道路轮廓和斑马线，小朋友占据画面中心位置"
-                    }
-                ]
+                "step_order": 2,
+                "instruction": "耐心等待绿灯",
+                "image_prompt": "绘制小朋友站在斑马线前的背身(尚未通过马路)，抬头看着前方交通信号灯等待, 信号灯显示红色圆圈 "
             },
             {
-                "name": "洗漱刷牙",
-                "description": "每日晨间清洁习惯培养",
-                "icon": "🪥",
-                "steps": [
-                    {
-                        "step_order": 1,
-                        "instruction": "挤牙膏",
-                        "image_prompt": "a hand squeezing a pea-sized amount of blue toothpaste onto a toothbrush, close up"
-                    },
-                    {
-                        "step_order": 2,
-                        "instruction": "刷刷牙",
-                        "image_prompt": "a child with a happy expression brushing teeth, simplified bathroom mirror background"
-                    },
-                    {
-                        "step_order": 3,
-                        "instruction": "漱口杯洗嘴巴",
-                        "image_prompt": "a child holding a simple light blue plastic cup to their mouth"
-                    }
-                ]
+                "step_order": 3,
+                "instruction": "直行通过",
+                "image_prompt": "小朋友通过斑马线, 背景只有简单的道路轮廓和斑马线，小朋友占据画面中心位置"
             }
         ]
+    },
+    {
+        "name": "洗漱刷牙",
+        "description": "每日晨间清洁习惯培养",
+        "icon": "🪥",
+        "steps": [
+            {
+                "step_order": 1,
+                "instruction": "挤牙膏",
+                "image_prompt": "a hand squeezing a pea-sized amount of blue toothpaste onto a toothbrush, close up"
+            },
+            {
+                "step_order": 2,
+                "instruction": "刷刷牙",
+                "image_prompt": "a child with a happy expression brushing teeth, simplified bathroom mirror background"
+            },
+            {
+                "step_order": 3,
+                "instruction": "漱口杯洗嘴巴",
+                "image_prompt": "a child holding a simple light blue plastic cup to their mouth"
+            }
+        ]
+    }
+]
+
+def preset_hash() -> str:
+    """预设定义的内容哈希，定义不变时哈希不变"""
+    canonical = json.dumps(PRESET_SCENARIOS, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
-        for scenario_data in scenarios_data:
-            steps_data = scenario_data.pop("steps")
-            scenario_name = scenario_data["name"]
-            
-            # 检查场景是否已存在
-            existing_scenario = db.query(Scenario).filter(Scenario.name == scenario_name, Scenario.is_custom == False).first()
-            
-            if existing_scenario:
-                # 更新现有场景
-                print(f"更新场景: {scenario_name}")
-                existing_scenario.description = scenario_data.get("description", existing_scenario.description)
-                existing_scenario.icon = scenario_data.get("icon", existing_scenario.icon)
-                
-                # 删除旧的步骤
-                for old_step in existing_scenario.steps:
-                    db.delete(old_step)
-                
-                # 添加新步骤
-                for step_data in steps_data:
-                    step = TrainingStep(**step_data)
-                    existing_scenario.steps.append(step)
-            else:
-                # 创建新场景
-                print(f"创建场景: {scenario_name}")
-                scenario = Scenario(**scenario_data, is_custom=False)
-                
-                for step_data in steps_data:
-                    step = TrainingStep(**step_data)
-                    scenario.steps.append(step)
-                
-                db.add(scenario)
 
+def _lock_seed_row(db) -> SeedVersion:
+    """取得预设版本行并加写锁，多个worker同时启动时只有一个执行同步，其余等待后跳过
+
+    先用一条无实际修改的 UPDATE 占用写锁（SQLite 为数据库写锁，PostgreSQL 为行锁），
+    之后读取到的版本一定是前一个持锁者提交后的结果。
+    """
+    try:
+        with db.begin_nested():
+            db.add(SeedVersion(name=SEED_NAME))
+    except IntegrityError:
+        pass
+    db.commit()
+    db.execute(
+        update(SeedVersion).where(SeedVersion.name == SEED_NAME).values(name=SeedVersion.name)
+    )
+    return db.get(SeedVersion, SEED_NAME, populate_existing=True)
+
+
+def _sync_scenario(db, scenario_data: dict) -> bool:
+    """同步一个预设场景，返回是否有写入"""
+    steps = [TrainingStepCreate(**step_data) for step_data in scenario_data["steps"]]
+    scenario_name = scenario_data["name"]
+
+    # 检查场景是否已存在
+    existing_scenario = db.execute(
+        select(Scenario).where(Scenario.name == scenario_name, Scenario.is_custom == False)
+    ).scalars().first()
+
+    if existing_scenario is None:
+        # 创建新场景
+        logger.info(f"创建场景: {scenario_name}")
+        scenario = Scenario(
+            name=scenario_name,
+            description=scenario_data.get("description"),
+            icon=scenario_data.get("icon"),
+            is_custom=False,
+            steps=[TrainingStep(**step.model_dump()) for step in steps]
+        )
+        db.add(scenario)
+        return True
+
+    changed = False
+    for field in ("description", "icon"):
+        value = scenario_data.get(field, getattr(existing_scenario, field))
+        if value != getattr(existing_scenario, field):
+            setattr(existing_scenario, field, value)
+            changed = True
+
+    # 按 step_order 增量同步步骤：未变化的步骤保留id和已生成的图片
+    existing_steps = db.execute(
+        select(TrainingStep).where(TrainingStep.scenario_id == existing_scenario.id)
+        .order_by(TrainingStep.step_order, TrainingStep.id)
+    ).scalars().all()
+    updates, inserts, delete_ids = diff_scenario_steps(existing_steps, steps)
+    old_urls = {step.id: step.image_url for step in existing_steps}
+    if delete_ids:
+        db.execute(delete(TrainingStep).where(TrainingStep.id.in_(delete_ids)))
+    if updates:
+        db.execute(update(TrainingStep), updates)
+    if inserts:
+        db.execute(insert(TrainingStep), [{"scenario_id": existing_scenario.id, **values} for values in inserts])
+    if delete_ids or updates or inserts:
+        file_index.note_references(
+            [old_urls[step_id] for step_id in delete_ids]
+            + [old_urls[values["id"]] for values in updates if "image_url" in values]
+        )
+        changed = True
+
+    if changed:
+        logger.info(f"更新场景: {scenario_name}（更新 {len(updates)} / 新增 {len(inserts)} / 删除 {len(delete_ids)} 个步骤）")
+    return changed
+
+
+def create_initial_data() -> bool:
+    """创建或更新初始演示数据，返回是否执行了同步
+
+    预设定义的哈希与数据库中记录的一致时直接跳过；不一致时按差异增量更新，
+    不会重建步骤，已生成的图片和步骤id保持不变。在应用启动（lifespan）时调用。
+    """
+    db = SessionLocal()
+    content_hash = preset_hash()
+
+    try:
+        seed = _lock_seed_row(db)
+        if seed.content_hash == content_hash:
+            db.rollback()
+            return False
+
+        changed = False
+        for scenario_data in PRESET_SCENARIOS:
+            changed = _sync_scenario(db, scenario_data) or changed
+
+        seed.content_hash = content_hash
+        seed.applied_at = datetime.now()
         db.commit()
-        print("初始数据创建/更新完成")
+        if changed:
+            scenario_response_cache.bump()
+        logger.info("初始数据创建/更新完成")
+        return True
 
     except Exception as e:
-        print(f"创建/更新初始数据失败: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"创建/更新初始数据失败: {e}")
         db.rollback()
+        return False
     finally:
         db.close()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     create_initial_data()
-
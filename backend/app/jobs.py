@@ -0,0 +1,293 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+from app.ai_service import ai_service
+from app.config import settings
+from app.content_cache import image_cache
+from app.crud import update_step_images
+from app.database import AsyncSessionLocal
+from app.schemas import ImageGenerateRequest, TTSGenerateRequest
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[dict], Awaitable[dict]]
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+class JobQueue:
+    """以数据库表持久化的后台任务队列，由进程内的worker池执行
+
+    任务先写入 generation_jobs 表再进入内存队列，请求立即返回任务id；
+    start() 时重新入队 pending 任务。执行中的任务定期更新心跳，心跳超时的 running 任务
+    （执行它的进程已退出）由各进程定期检查并重新排队；仍在其他进程中执行的任务不受影响。
+    失败的任务按指数退避延迟重试，避免在上游短暂故障期间立即用完重试次数。
+    """
+
+    def __init__(self, workers: int = 4, max_attempts: int = 3, heartbeat_seconds: int = 15,
+                 stale_seconds: int = 90, retry_backoff_seconds: float = 5, retry_backoff_max_seconds: float = 300):
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.heartbeat_seconds = max(1, heartbeat_seconds)
+        self.stale_seconds = max(self.heartbeat_seconds * 2, stale_seconds)
+        self.retry_backoff_seconds = max(0.0, retry_backoff_seconds)
+        self.retry_backoff_max_seconds = max(self.retry_backoff_seconds, retry_backoff_max_seconds)
+        self.handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._done_events: Dict[str, asyncio.Event] = {}
+
+    def handler(self, job_type: str):
+        """注册任务处理函数的装饰器"""
+        def decorator(func: JobHandler) -> JobHandler:
+            self.handlers[job_type] = func
+            return func
+        return decorator
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        """启动worker池，并恢复上次未完成的任务"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        # 心跳超时（执行它的进程已退出）的任务重新排队，下面一并入队
+        await self.requeue_stale()
+        async with AsyncSessionLocal() as db:
+            cutoff = datetime.now() - timedelta(hours=settings.job_retention_hours)
+            await db.execute(
+                delete(models.GenerationJob).where(
+                    models.GenerationJob.status.in_(FINISHED_STATUSES),
+                    models.GenerationJob.finished_at < cutoff
+                )
+            )
+            await db.commit()
+            pending = (await db.execute(
+                select(models.GenerationJob.id, models.GenerationJob.next_attempt_at)
+                .where(models.GenerationJob.status == "pending")
+                .order_by(models.GenerationJob.created_at)
+            )).all()
+
+        for job_id, next_attempt_at in pending:
+            self._enqueue(job_id, next_attempt_at)
+        if pending:
+            logger.info(f"[任务队列] 恢复 {len(pending)} 个未完成任务")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reap_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def requeue_stale(self) -> List[str]:
+        """将心跳超时的 running 任务改回 pending，返回这些任务的id
+
+        只按心跳判断，不按进程重启判断：其他进程正在执行的任务会持续更新心跳，不会被重新排队。
+        多个进程同时检查时任务可能进入多个内存队列，但认领是原子的，只会执行一次。
+        """
+        table = models.GenerationJob
+        cutoff = datetime.now() - timedelta(seconds=self.stale_seconds)
+        stale = (table.status == "running") & (func.coalesce(table.heartbeat_at, table.started_at) < cutoff)
+        async with AsyncSessionLocal() as db:
+            job_ids = list(await db.scalars(select(table.id).where(stale)))
+            if not job_ids:
+                return []
+            await db.execute(update(table).where(table.id.in_(job_ids), stale).values(status="pending"))
+            await db.commit()
+        logger.warning(f"[任务队列] {len(job_ids)} 个任务心跳超时，重新排队")
+        return job_ids
+
+    def retry_delay(self, attempts: int) -> float:
+        """第 attempts 次尝试失败后，距下一次重试的等待秒数"""
+        return min(self.retry_backoff_max_seconds, self.retry_backoff_seconds * 2 ** max(0, attempts - 1))
+
+    def _enqueue(self, job_id: str, not_before: Optional[datetime] = None):
+        """放入内存队列；指定 not_before 时到时间后再放入"""
+        delay = (not_before - datetime.now()).total_seconds() if not_before else 0
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job_id)
+        else:
+            self._queue.put_nowait(job_id)
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                for job_id in await self.requeue_stale():
+                    self._queue.put_nowait(job_id)
+            except Exception as e:
+                logger.warning(f"[任务队列] 检查超时任务失败: {e}")
+
+    async def _heartbeat(self, job_id: str):
+        """执行期间定期更新心跳（每次使用独立的短会话）"""
+        table = models.GenerationJob
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(update(table).where(table.id == job_id, table.status == "running")
+                                     .values(heartbeat_at=datetime.now()))
+                    await db.commit()
+            except Exception as e:
+                logger.warning(f"[任务队列] 任务 {job_id} 心跳更新失败: {e}")
+
+    async def submit(self, db: AsyncSession, job_type: str, payload: dict) -> models.GenerationJob:
+        """创建任务记录并入队"""
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job = models.GenerationJob(
+            id=uuid.uuid4().hex,
+            job_type=job_type,
+            status="pending",
+            payload=payload,
+            attempts=0
+        )
+        db.add(job)
+        await db.commit()
+        if self._queue is not None:
+            self._queue.put_nowait(job.id)
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[models.GenerationJob]:
+        """长轮询：等待任务结束或超时，返回最新的任务记录
+
+        本进程内完成的任务通过事件立即唤醒；其他进程执行的任务按秒轮询数据库。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        event = self._done_events.setdefault(job_id, asyncio.Event())
+        try:
+            while True:
+                job = await self._load(job_id)
+                remaining = deadline - loop.time()
+                if job is None or job.status in FINISHED_STATUSES or remaining <= 0:
+                    return job
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(1.0, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._done_events.pop(job_id, None)
+
+    async def _load(self, job_id: str) -> Optional[models.GenerationJob]:
+        async with AsyncSessionLocal() as db:
+            return await db.get(models.GenerationJob, job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.warning(f"[任务队列] 任务 {job_id} 执行异常: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        table = models.GenerationJob
+        async with AsyncSessionLocal() as db:
+            # 原子地认领任务，避免同一任务被重复执行；退避时间未到的任务不认领
+            now = datetime.now()
+            claimed = (await db.execute(
+                update(table)
+                .where(
+                    table.id == job_id,
+                    table.status == "pending",
+                    table.next_attempt_at.is_(None) | (table.next_attempt_at <= now)
+                )
+                .values(status="running", started_at=now, heartbeat_at=now, attempts=table.attempts + 1)
+            )).rowcount
+            if not claimed:
+                # 定时器可能比数据库中记录的重试时间略早触发，这种情况下按记录的时间重新排期
+                row = (await db.execute(
+                    select(table.status, table.next_attempt_at).where(table.id == job_id)
+                )).one_or_none()
+                await db.rollback()
+                if row is not None and row.status == "pending" and row.next_attempt_at:
+                    self._enqueue(job_id, row.next_attempt_at)
+                return
+            # 在认领的事务中读出执行所需的字段，提交后会话随即关闭
+            job_type, payload, attempts = (await db.execute(
+                select(table.job_type, table.payload, table.attempts).where(table.id == job_id)
+            )).one()
+            await db.commit()
+
+        # 连接已归还连接池，生成期间（可能长达数十秒）不占用数据库连接
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result = await self.handlers[job_type](payload)
+        except Exception as e:
+            if attempts < self.max_attempts:
+                values = {"status": "pending", "error": str(e),
+                          "next_attempt_at": datetime.now() + timedelta(seconds=self.retry_delay(attempts))}
+            else:
+                values = {"status": "failed", "error": str(e), "finished_at": datetime.now()}
+        else:
+            values = {"status": "succeeded", "result": result, "error": None, "finished_at": datetime.now()}
+        finally:
+            heartbeat.cancel()
+
+        # 只为写入结果重新打开一个会话
+        async with AsyncSessionLocal() as db:
+            # 心跳曾超时而被其他worker重新认领的任务（attempts 已变化）不覆盖其结果
+            await db.execute(
+                update(models.GenerationJob)
+                .where(models.GenerationJob.id == job_id, models.GenerationJob.attempts == attempts)
+                .values(**values)
+            )
+            await db.commit()
+
+        if values["status"] == "pending":
+            self._enqueue(job_id, values["next_attempt_at"])
+            return
+        event = self._done_events.get(job_id)
+        if event is not None:
+            event.set()
+
+job_queue = JobQueue(
+    workers=settings.job_workers,
+    max_attempts=settings.job_max_attempts,
+    heartbeat_seconds=settings.job_heartbeat_seconds,
+    stale_seconds=settings.job_stale_seconds,
+    retry_backoff_seconds=settings.job_retry_backoff_seconds,
+    retry_backoff_max_seconds=settings.job_retry_backoff_max_seconds
+)
+
+
+@job_queue.handler("image")
+async def run_image_job(payload: dict) -> dict:
+    """生成图片（经过图片缓存），提供step_id和scenario_id时写回步骤"""
+    request = ImageGenerateRequest(**payload)
+    async with AsyncSessionLocal() as db:
+        image_url = await image_cache.get_or_generate(
+            db,
+            request.prompt,
+            settings.gemini_image_model,
+            ai_service.generate_image,
+            bypass_cache=request.bypass_cache
+        )
+        # 模型失败时 generate_image 返回占位图URL而不抛异常；按失败处理，走重试，
+        # 也不把占位图永久写入训练步骤
+        if not image_url or not image_url.startswith("/files/"):
+            raise Exception(f"图片生成失败，返回了占位图: {image_url}")
+        if request.step_id and request.scenario_id:
+            await update_step_images(db, request.scenario_id, {request.step_id: image_url})
+        return {"image_url": image_url}
+
+
+@job_queue.handler("tts")
+async def run_tts_job(payload: dict) -> dict:
+    request = TTSGenerateRequest(**payload)
+    audio_url = await ai_service.generate_tts(request.text, request.voice_name, request.language)
+    if not audio_url:
+        raise Exception("TTS服务暂不可用")
+    return {"audio_url": audio_url}
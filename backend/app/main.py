@@ -1,23 +1,60 @@
+import asyncio
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from app.ai_service import ai_service
 from app.config import settings
-from app.database import engine, Base
-from app.routes import scenarios, training, ai
+from app.content_cache import image_cache, tts_cache
+from app.database import sync_schema
+from app.routes import scenarios, training, ai, files
+from app.jobs import job_queue
+from app.file_aliases import file_aliases, migrate_legacy_files
+from app.file_index import file_index
+from app.initial_data import create_initial_data
+from app.training_stats import rebuild_training_stats
+from app.step_events import step_event_buffer
 from app.utils.file_manager import file_manager
+from app.utils.metrics import MetricsMiddleware, registry
+from app.utils.response_cache import scenario_response_cache
+from app.utils.static_files import CachedStaticFiles
+from app.utils.structured_log import log_pipeline
+from app.utils.tracing import TracingMiddleware, render_waterfall, to_otlp, tracer
 
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
-
-# 初始化数据
-from app.initial_data import create_initial_data
-create_initial_data()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动日志后台写入线程（app.* 日志在请求路径上只入队）
+    log_pipeline.start()
+    # 追踪导出线程（仅在配置了 TRACE_EXPORT_FILE 时启动）
+    tracer.start()
+    # 创建数据库表（并为已有数据库补齐新增列和索引）；在启动时而不是导入时执行，导入 app.main 不访问数据库
+    await asyncio.to_thread(sync_schema)
+    # 同步预设场景（按内容哈希判断是否需要写入；多个worker同时启动时由数据库锁保证只执行一次）
+    await asyncio.to_thread(create_initial_data)
+    # 将平铺保存的旧文件迁移到内容寻址存储（旧URL通过别名表继续可用）
+    if settings.storage_mode == "cas":
+        await asyncio.to_thread(migrate_legacy_files)
+    # 训练统计汇总表为空而已有训练记录时（升级后首次启动）重建一次
+    await asyncio.to_thread(rebuild_training_stats)
+    # 建立/同步上传文件索引，并启动按容量的LRU淘汰
+    await file_index.start()
+    # 启动后台任务worker池（并恢复未完成的任务）
+    await job_queue.start()
+    # 训练步骤事件的批量写入
+    await step_event_buffer.start()
+    yield
+    await step_event_buffer.stop()
+    await job_queue.stop()
+    await file_index.stop()
+    tracer.stop()
+    log_pipeline.stop()
 
 app = FastAPI(
     title="星桥AI训练系统",
     description="黑客松轻量级版本",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS配置（生产环境允许所有来源）
@@ -39,22 +76,101 @@ else:
         allow_headers=["*"],
     )
 
+# 请求追踪（按请求的span瀑布图，见 /debug/traces）
+if settings.tracing_enabled:
+    app.add_middleware(TracingMiddleware)
+
+# 请求指标（放在最外层，统计包括CORS预检在内的所有请求）
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 # 路由注册
 app.include_router(scenarios.router, prefix="/api/scenarios", tags=["scenarios"])
 app.include_router(training.router, prefix="/api/training", tags=["training"])
 app.include_router(ai.router, prefix="/api/ai", tags=["ai"])
 
-# 挂载静态文件目录
+# 图片按尺寸/格式访问（需在 /files 静态目录挂载之前注册，优先匹配）
+app.include_router(files.router, prefix="/files", tags=["files"])
+
+# 挂载静态文件目录（强ETag、Range、预压缩；uuid/哈希命名的生成文件标记为immutable；旧路径按别名表解析）
 # 注意：StaticFiles 会自动应用 CORS 中间件（如果已配置）
-app.mount("/files", StaticFiles(directory=str(file_manager.upload_dir)), name="files")
+app.mount(
+    "/files",
+    CachedStaticFiles(directory=str(file_manager.upload_dir), alias_resolver=file_aliases.resolve,
+                     access_hook=file_index.touch),
+    name="files"
+)
 
 # 挂载demo静态文件目录（用于预设图片）
 from pathlib import Path
 demo_dir = Path(__file__).parent.parent / "demo"
 if demo_dir.exists():
-    app.mount("/demo", StaticFiles(directory=str(demo_dir)), name="demo")
+    # 预设图片随部署更新，不标记immutable，过期后通过ETag重新验证
+    app.mount("/demo", CachedStaticFiles(directory=str(demo_dir), immutable_names=False), name="demo")
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+
+def _cache_counts():
+    """各缓存的 (命中数, 未命中数)；合并到进行中请求的调用计为命中，语音合成失败计为未命中"""
+    plan_cache = ai_service.plan_cache
+    return {
+        "plan": (plan_cache.hits + plan_cache.coalesced, plan_cache.misses),
+        "image": (image_cache.hits, image_cache.misses),
+        "tts": (tts_cache.hits, tts_cache.misses),
+        "scenario_responses": (scenario_response_cache.hits, scenario_response_cache.misses),
+    }
+
+
+registry.callback("cache_hits_total", "Cache hits by cache", ("cache",),
+                  lambda: {(name,): hits for name, (hits, _) in _cache_counts().items()}, kind="counter")
+registry.callback("cache_misses_total", "Cache misses by cache", ("cache",),
+                  lambda: {(name,): misses for name, (_, misses) in _cache_counts().items()}, kind="counter")
+registry.callback("cache_hit_ratio", "Cache hit ratio since process start", ("cache",),
+                  lambda: {(name,): hits / (hits + misses) if hits + misses else 0.0
+                           for name, (hits, misses) in _cache_counts().items()})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 文本格式的进程内指标"""
+    if not settings.metrics_enabled:
+        return Response(status_code=404)
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/debug/traces", include_in_schema=False)
+async def debug_traces(
+    trace_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=500),
+    min_ms: float = Query(0, ge=0),
+    path: Optional[str] = None,
+    format: str = Query("text", pattern="^(text|json|otlp)$")
+):
+    """最近请求的span瀑布图
+
+    text：每个请求一张文本瀑布图；json：请求概要和span列表；otlp：OTLP/JSON。
+    可按 trace_id 查看单个请求，或按最小耗时（毫秒）和路由（如 generate-image）筛选。
+    """
+    if not settings.tracing_enabled:
+        return Response(status_code=404)
+    if trace_id:
+        trace = tracer.get(trace_id)
+        traces = [trace] if trace else []
+    else:
+        traces = tracer.recent(limit=limit, min_ms=min_ms, name=path)
+
+    if format == "otlp":
+        return {"resourceSpans": [item for trace in traces for item in to_otlp(trace)["resourceSpans"]]}
+    if format == "json":
+        return {
+            "traces": [
+                {**trace.summary(), "spans": [trace.root.to_dict()] + [span.to_dict() for span in trace.spans]}
+                for trace in traces
+            ],
+            "buffered": len(tracer.traces),
+        }
+    body = "\n\n".join(render_waterfall(trace) for trace in traces) or "no traces"
+    return Response(body + "\n", media_type="text/plain; charset=utf-8")
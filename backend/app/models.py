@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, func, JSON
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, Boolean, DateTime, ForeignKey, Index, UniqueConstraint, func, JSON
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -33,6 +33,12 @@ class TrainingStep(Base):
 
 class TrainingRecord(Base):
     __tablename__ = "training_records"
+    # 训练历史按时间倒序分页，常用筛选为某个孩子或某个场景
+    __table_args__ = (
+        Index("ix_training_records_user_id_started_at", "user_id", "started_at"),
+        Index("ix_training_records_scenario_id_started_at", "scenario_id", "started_at"),
+        Index("ix_training_records_started_at", "started_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     scenario_id = Column(Integer, ForeignKey("scenarios.id"), nullable=False)
@@ -50,14 +56,107 @@ class TrainingRecord(Base):
     # 关联
     scenario = relationship("Scenario")
 
+
+class TrainingStepEvent(Base):
+    """训练中每完成一个步骤记录一条事件，用于分析每步用时和辅助等级"""
+    __tablename__ = "training_step_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    training_id = Column(Integer, ForeignKey("training_records.id"), nullable=False, index=True)
+    step_id = Column(Integer, nullable=False)
+    level = Column(String, nullable=True)  # 'F', 'P', or 'I'
+    timestamp = Column(DateTime, nullable=False)
+
 class GeneratedContent(Base):
     __tablename__ = "generated_content"
 
     id = Column(Integer, primary_key=True, index=True)
     content_type = Column(String, nullable=False)
-    prompt = Column(Text, nullable=False)
+    prompt = Column(Text, nullable=False)  # 规范化后的提示词
     content_url = Column(String)
     content_data = Column(Text)
 
+    # 缓存字段：按 (规范化提示词, 模型名) 的哈希查找
+    model_name = Column(String, nullable=True)
+    prompt_hash = Column(String(64), nullable=True, index=True)
+    hit_count = Column(Integer, default=0)
+    last_accessed_at = Column(DateTime, nullable=True)
+
+    created_at = Column(DateTime, default=func.now())
+
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    job_type = Column(String, nullable=False)  # 'image' or 'tts'
+    status = Column(String, nullable=False, default="pending", index=True)  # pending/running/succeeded/failed
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # 执行中由认领它的worker定期更新，用于识别进程退出后遗留的 running 任务
+    heartbeat_at = Column(DateTime, nullable=True)
+    # 失败后等待重试的任务在此时间之前不会被认领（指数退避）
+    next_attempt_at = Column(DateTime, nullable=True)
+
+
+class FileAlias(Base):
+    __tablename__ = "file_aliases"
+
+    # 迁移到内容寻址存储之前的相对路径（如 images/<uuid>.png）→ 迁移后的相对路径
+    legacy_path = Column(String, primary_key=True)
+    target_path = Column(String, nullable=False)
+
     created_at = Column(DateTime, default=func.now())
 
+
+class StoredFile(Base):
+    __tablename__ = "stored_files"
+    # 淘汰时按 (引用数, 最近访问时间) 顺序取候选
+    __table_args__ = (Index("ix_stored_files_ref_count_last_access", "ref_count", "last_access"),)
+
+    path = Column(String, primary_key=True)  # 相对于上传目录的路径，如 images/ab/cd/<sha256>.png
+    size = Column(BigInteger, nullable=False, default=0)  # 含预压缩兄弟文件和图片派生版本
+    last_access = Column(DateTime, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # 引用该文件的训练步骤数
+
+    created_at = Column(DateTime, default=func.now())
+
+
+class TrainingStats(Base):
+    """训练统计汇总，在完成训练时增量更新
+
+    scenario_id / user_id 为0表示“全部”：(场景, 0) 为该场景所有用户的汇总，
+    (0, 用户) 为该用户所有场景的汇总，(0, 0) 为全局汇总。
+    """
+    __tablename__ = "training_stats"
+    __table_args__ = (UniqueConstraint("scenario_id", "user_id", name="uq_training_stats_scope"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    scenario_id = Column(Integer, nullable=False, default=0)
+    user_id = Column(Integer, nullable=False, default=0)
+
+    sessions = Column(Integer, nullable=False, default=0)
+    level_f = Column(Integer, nullable=False, default=0)
+    level_p = Column(Integer, nullable=False, default=0)
+    level_i = Column(Integer, nullable=False, default=0)
+    milestone_level1 = Column(Integer, nullable=False, default=0)
+    milestone_level2 = Column(Integer, nullable=False, default=0)
+    completion_ratio_sum = Column(Float, nullable=False, default=0.0)  # 平均完成率 = 总和 / sessions
+    last_session_at = Column(DateTime, nullable=True)
+
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class SeedVersion(Base):
+    """已写入的预设数据版本：记录预设定义的内容哈希，未变化时启动跳过写入"""
+    __tablename__ = "seed_versions"
+
+    name = Column(String, primary_key=True)  # 预设数据集名称，如 preset_scenarios
+    content_hash = Column(String, nullable=True)  # 预设定义的SHA-256，尚未写入时为空
+    applied_at = Column(DateTime, nullable=True)
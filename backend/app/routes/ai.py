@@ -1,13 +1,28 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+import asyncio
+import json
+import logging
+import anyio
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.ai_service import ai_service
-from app.schemas import ScenarioPlanRequest, ImageGenerateRequest, TTSGenerateRequest, APIResponse
-from app.database import get_db
+from app.config import settings
+from app.content_cache import image_cache, tts_cache
+from app.crud import get_scenario, update_step_images
+from app.file_index import file_index
+from app.utils.response_cache import scenario_response_cache
+from app.utils.structured_log import log_event, log_pipeline
+from app.utils.tracing import span
+from app.jobs import job_queue
+from app.schemas import ScenarioPlanRequest, ImageGenerateRequest, BatchImageGenerateRequest, TTSGenerateRequest, JobCreateRequest, Job, APIResponse
+from app.database import get_db, AsyncSessionLocal
 from app import models
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import Optional
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class PresetImageRequest(BaseModel):
     scenario_name: str
@@ -16,21 +31,14 @@ class PresetImageRequest(BaseModel):
 
 @router.post("/plan-scenario", response_model=APIResponse)
 async def plan_scenario(request: ScenarioPlanRequest):
-    # #region agent log
-    import json
-    import time
-    with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-        f.write(json.dumps({"location":"routes/ai.py:plan_scenario","message":"plan_scenario API called","data":{"topic":request.topic},"timestamp":time.time()*1000,"sessionId":"debug-session","runId":"run1","hypothesisId":"B"})+'\n')
-    # #endregion
+    log_event(logger, "plan.request", "plan_scenario API called", topic=request.topic)
     try:
         result = await ai_service.plan_scenario_steps(
             request.topic,
             request.preferences
         )
-        # #region agent log
-        with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"location":"routes/ai.py:plan_scenario","message":"plan_scenario completed","data":{"total_images":result['total_images'],"steps_count":len(result['steps'])},"timestamp":time.time()*1000,"sessionId":"debug-session","runId":"run1","hypothesisId":"B"})+'\n')
-        # #endregion
+        log_event(logger, "plan.completed", "plan_scenario completed", total_images=result['total_images'],
+                  steps_count=len(result['steps']))
         return APIResponse(
             success=True,
             data={
@@ -42,6 +50,36 @@ async def plan_scenario(request: ScenarioPlanRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"场景规划失败: {str(e)}")
 
+@router.post("/plan-scenario/stream")
+async def plan_scenario_stream(request: ScenarioPlanRequest):
+    """流式场景规划：以NDJSON逐个返回规划完成的步骤，客户端可在后续步骤规划期间开始生成第一张图片"""
+    async def stream():
+        async for event in ai_service.stream_scenario_steps(request.topic, request.preferences):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/cache-stats", response_model=APIResponse)
+async def get_cache_stats():
+    """AI相关缓存的命中统计与模型并发占用，用于调整缓存容量"""
+    return APIResponse(
+        success=True,
+        data={
+            "plan_cache": ai_service.plan_cache.stats(),
+            "image_cache": image_cache.stats(),
+            "model_concurrency": ai_service.limiter.stats(),
+            "files": file_index.stats(),
+            "scenario_responses": scenario_response_cache.stats(),
+            "logging": log_pipeline.stats(),
+        }
+    )
+
+@router.get("/admin/tts-cache", response_model=APIResponse)
+async def get_tts_cache_stats():
+    """语音缓存的命中率与磁盘占用"""
+    stats = await asyncio.to_thread(tts_cache.stats)
+    return APIResponse(success=True, data=stats)
+
 @router.post("/get-preset-image", response_model=APIResponse)
 async def get_preset_image(request: PresetImageRequest):
     """获取预设图片URL（用于特定场景的固定图片）"""
@@ -67,37 +105,35 @@ async def get_preset_image(request: PresetImageRequest):
     )
 
 @router.post("/generate-image", response_model=APIResponse)
-async def generate_image(request: ImageGenerateRequest, db: Session = Depends(get_db)):
-    # #region agent log
-    import json
-    import time
-    with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-        f.write(json.dumps({"location":"routes/ai.py:generate_image","message":"Image generation API called","data":{"prompt":request.prompt[:50],"step_id":request.step_id,"scenario_id":request.scenario_id},"timestamp":time.time()*1000,"sessionId":"debug-session","runId":"run1","hypothesisId":"D"})+'\n')
-    # #endregion
+async def generate_image(request: ImageGenerateRequest, db: AsyncSession = Depends(get_db)):
+    log_event(logger, "image.request", "Image generation API called", prompt=request.prompt[:50],
+              step_id=request.step_id, scenario_id=request.scenario_id)
     try:
-        image_url = await ai_service.generate_image(request.prompt)
-        # #region agent log
-        with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"location":"routes/ai.py:generate_image","message":"Image generation completed","data":{"step_id":request.step_id,"scenario_id":request.scenario_id,"has_url":bool(image_url)},"timestamp":time.time()*1000,"sessionId":"debug-session","runId":"run1","hypothesisId":"D"})+'\n')
-        # #endregion
-        # #region agent log
-        with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"location":"routes/ai.py:generate_image","message":"Image URL returned","data":{"image_url":image_url,"url_type":type(image_url).__name__,"url_starts_with_files":image_url.startswith("/files") if isinstance(image_url, str) else False},"timestamp":__import__('time').time()*1000,"sessionId":"debug-session","runId":"run1","hypothesisId":"B"})+'\n')
-        # #endregion
+        image_url = await image_cache.get_or_generate(
+            db,
+            request.prompt,
+            settings.gemini_image_model,
+            ai_service.generate_image,
+            bypass_cache=request.bypass_cache
+        )
+        log_event(logger, "image.completed", "Image generation completed", step_id=request.step_id,
+                  scenario_id=request.scenario_id, image_url=image_url)
         
         # 如果提供了step_id和scenario_id，自动保存到数据库
         if request.step_id and request.scenario_id:
-            step = db.query(models.TrainingStep).filter(
-                models.TrainingStep.id == request.step_id,
-                models.TrainingStep.scenario_id == request.scenario_id
-            ).first()
+            with span("db.load_step", step_id=request.step_id):
+                result = await db.execute(select(models.TrainingStep).where(
+                    models.TrainingStep.id == request.step_id,
+                    models.TrainingStep.scenario_id == request.scenario_id
+                ))
+                step = result.scalar_one_or_none()
             if step:
-                step.image_url = image_url
-                db.commit()
-                # #region agent log
-                with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-                    f.write(json.dumps({"location":"routes/ai.py:generate_image","message":"Image URL saved to database","data":{"step_id":request.step_id,"scenario_id":request.scenario_id,"image_url":image_url},"timestamp":__import__('time').time()*1000,"sessionId":"debug-session","runId":"run1","hypothesisId":"B"})+'\n')
-                # #endregion
+                with span("db.commit_image_url", step_id=request.step_id):
+                    step.image_url = image_url
+                    await db.commit()
+                scenario_response_cache.bump()
+                log_event(logger, "image.saved", "Image URL saved to database", step_id=request.step_id,
+                          scenario_id=request.scenario_id, image_url=image_url)
         
         return APIResponse(
             success=True,
@@ -105,12 +141,77 @@ async def generate_image(request: ImageGenerateRequest, db: Session = Depends(ge
             message="图像生成成功"
         )
     except Exception as e:
-        # #region agent log
-        with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"location":"routes/ai.py:generate_image","message":"Image generation failed","data":{"error":str(e)},"timestamp":__import__('time').time()*1000,"sessionId":"debug-session","runId":"run1","hypothesisId":"B"})+'\n')
-        # #endregion
+        log_event(logger, "image.failed", "Image generation failed", level=logging.ERROR, error=str(e))
         raise HTTPException(status_code=500, detail=f"图像生成失败: {str(e)}")
 
+@router.post("/generate-images")
+async def generate_images(request: BatchImageGenerateRequest, db: AsyncSession = Depends(get_db)):
+    """批量生成图片，以NDJSON流的形式逐条返回完成的结果
+
+    每生成完一张图片输出一行 {"index", "step_id", "image_url"}（失败时为 "error"），
+    最后输出 {"done": true, "persisted": n}。属于 scenario_id 的步骤图片在结束时一次性提交。
+    """
+    if request.items:
+        jobs = [(item.step_id, item.prompt) for item in request.items]
+    elif request.scenario_id:
+        scenario = await get_scenario(db, request.scenario_id)
+        if scenario is None:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+        jobs = []
+        for step in scenario.steps:
+            if not step.image_prompt or (request.only_missing and step.image_url):
+                continue
+            prompt = f"{step.image_prompt}, {request.prompt_suffix}" if request.prompt_suffix else step.image_prompt
+            jobs.append((step.id, prompt))
+    else:
+        raise HTTPException(status_code=400, detail="需要提供scenario_id或items")
+
+    scenario_id = request.scenario_id
+    model = settings.gemini_image_model
+
+    async def stream():
+        # 流式响应在依赖清理之后仍可能继续执行，不使用请求的会话；
+        # AsyncSession 不能被并发的任务共用，每个生成任务使用自己的会话
+        image_urls = {}
+        persisted = None
+
+        async def run(index: int, step_id: Optional[int], prompt: str):
+            try:
+                async with AsyncSessionLocal() as task_db:
+                    image_url = await image_cache.get_or_generate(
+                        task_db, prompt, model, ai_service.generate_image,
+                        bypass_cache=request.bypass_cache
+                    )
+                return {"index": index, "step_id": step_id, "image_url": image_url}
+            except Exception as e:
+                return {"index": index, "step_id": step_id, "error": str(e)}
+
+        tasks = [asyncio.create_task(run(index, step_id, prompt)) for index, (step_id, prompt) in enumerate(jobs)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result.get("image_url") and result["step_id"] is not None:
+                    image_urls[result["step_id"]] = result["image_url"]
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+            if scenario_id:
+                async with AsyncSessionLocal() as stream_db:
+                    persisted = await update_step_images(stream_db, scenario_id, image_urls)
+            else:
+                persisted = 0
+            yield json.dumps({"done": True, "total": len(jobs), "persisted": persisted}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            # 客户端中途断开时，仍保存已经完成的图片。Starlette 在断开时取消响应所在的任务组，
+            # 其中之后的每个 await 都会被取消，因此保存需要在屏蔽取消的作用域中执行
+            if persisted is None and scenario_id and image_urls:
+                with anyio.CancelScope(shield=True):
+                    async with AsyncSessionLocal() as stream_db:
+                        await update_step_images(stream_db, scenario_id, image_urls)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @router.post("/generate-tts", response_model=APIResponse)
 async def generate_tts(request: TTSGenerateRequest):
     try:
@@ -134,3 +235,29 @@ async def generate_tts(request: TTSGenerateRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"语音生成失败: {str(e)}")
 
+_JOB_PARAM_SCHEMAS = {"image": ImageGenerateRequest, "tts": TTSGenerateRequest}
+
+@router.post("/jobs", response_model=APIResponse)
+async def create_job(request: JobCreateRequest, db: AsyncSession = Depends(get_db)):
+    """提交后台生成任务（图片/语音），立即返回任务id"""
+    try:
+        params = _JOB_PARAM_SCHEMAS[request.job_type](**request.params)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    job = await job_queue.submit(db, request.job_type, params.model_dump())
+    return APIResponse(
+        success=True,
+        data={"job_id": job.id, "status": job.status},
+        message="任务已提交"
+    )
+
+@router.get("/jobs/{job_id}", response_model=APIResponse)
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=30), db: AsyncSession = Depends(get_db)):
+    """查询任务状态；wait>0 时长轮询，直到任务结束或超时（秒）"""
+    if wait > 0:
+        job = await job_queue.wait(job_id, wait)
+    else:
+        job = await db.get(models.GenerationJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return APIResponse(success=True, data=Job.model_validate(job).model_dump(mode="json"))
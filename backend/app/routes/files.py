@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from app.file_aliases import file_aliases
+from app.file_index import file_index
+from app.utils.file_manager import file_manager
+from app.utils.image_derivatives import image_derivatives
+from app.utils.static_files import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, build_file_response, file_metadata, is_immutable_name
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/images/{image_path:path}")
+async def get_image(
+    image_path: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096),
+    fmt: Optional[Literal["webp", "png", "auto"]] = None
+):
+    """按尺寸/格式获取生成的图片，例如 /files/images/<id>.png?w=256&fmt=webp
+
+    不带参数时返回原图；fmt=auto 时根据 Accept 头优先返回 WebP。
+    """
+    original = file_manager.url_to_path(f"/files/images/{image_path}")
+    if original is not None and not original.is_file():
+        # 迁移到内容寻址存储之前的旧URL
+        target = await asyncio.to_thread(file_aliases.resolve, f"images/{image_path}")
+        original = file_manager.url_to_path(f"/files/{target}") if target else None
+    if original is None or not original.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    file_index.touch(original)
+
+    headers = {}
+    path = original
+    if w is not None or fmt is not None:
+        if fmt == "auto":
+            fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "png"
+            headers["vary"] = "Accept"
+        try:
+            path = await asyncio.to_thread(image_derivatives.get_or_create, original, w, fmt or "png")
+        except Exception as e:
+            logger.warning(f"[图片派生] 生成失败，返回原图: {e}")
+
+    stat_result, etag, siblings = await asyncio.to_thread(file_metadata, path)
+    cache_control = IMMUTABLE_CACHE_CONTROL if is_immutable_name(original.name) else REVALIDATE_CACHE_CONTROL
+    return build_file_response(
+        path,
+        stat_result,
+        etag,
+        request.headers,
+        method=request.method,
+        cache_control=cache_control,
+        extra_headers=headers,
+        siblings=siblings
+    )
@@ -1,75 +1,129 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from app.database import get_db
-from app.schemas import Scenario as ScenarioSchema, ScenarioCreate, StepImageUpdateRequest, APIResponse, TrainingStepCreate
+from app.schemas import Scenario as ScenarioSchema, ScenarioSummary, ScenarioCreate, StepImageUpdateRequest, APIResponse, TrainingStepCreate
 from app import schemas
-from app.crud import create_scenario, get_scenarios, get_scenario, delete_scenario_steps, update_scenario_steps
+from app.crud import create_scenario, get_scenarios, get_scenario_summaries, get_scenario, delete_scenario_steps, update_scenario_steps
 from app import models
+from app.utils.response_cache import scenario_response_cache
 
 router = APIRouter()
 
+# 单页最多返回的条数；更大的 limit 会被截断到该值（而不是返回422），
+# 以兼容之前不限制 limit 的客户端。需要更多数据时用 after_id 继续翻页。
+MAX_SCENARIO_PAGE = 500
+MAX_SUMMARY_PAGE = 1000
+
+_scenario_list_adapter = TypeAdapter(List[ScenarioSchema])
+_summary_list_adapter = TypeAdapter(List[ScenarioSummary])
+
+async def _cached_response(request: Request, key, render):
+    """命中时直接返回缓存的响应体（不查询数据库），否则 await render() 生成并缓存
+
+    数据库会话在第一次查询时才建立连接，因此命中缓存的请求不会占用连接。
+    """
+    entry = scenario_response_cache.get(key)
+    if entry is None:
+        version = scenario_response_cache.version
+        entry = scenario_response_cache.put(key, version, await render())
+    return scenario_response_cache.respond(entry, request.headers)
+
 @router.get("/", response_model=List[ScenarioSchema])
-async def read_scenarios(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    scenarios = get_scenarios(db, skip=skip, limit=limit)
-    return scenarios
+async def read_scenarios(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, description=f"每页条数，超过 {MAX_SCENARIO_PAGE} 时按 {MAX_SCENARIO_PAGE} 返回"),
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """场景列表（含步骤）；翻页时传入上一页最后一个场景的id作为 after_id"""
+    limit = min(limit, MAX_SCENARIO_PAGE)
+
+    async def render() -> bytes:
+        scenarios = await get_scenarios(db, skip=skip, limit=limit, after_id=after_id)
+        return _scenario_list_adapter.dump_json(_scenario_list_adapter.validate_python(scenarios, from_attributes=True))
+
+    return await _cached_response(request, ("list", skip, limit, after_id), render)
+
+@router.get("/summary", response_model=List[ScenarioSummary])
+async def read_scenario_summaries(
+    request: Request,
+    limit: int = Query(100, ge=1, description=f"每页条数，超过 {MAX_SUMMARY_PAGE} 时按 {MAX_SUMMARY_PAGE} 返回"),
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """场景列表的轻量版本：只返回场景基本信息和步骤数，适合首页列表"""
+    limit = min(limit, MAX_SUMMARY_PAGE)
+
+    async def render() -> bytes:
+        summaries = await get_scenario_summaries(db, limit=limit, after_id=after_id)
+        return _summary_list_adapter.dump_json(_summary_list_adapter.validate_python(summaries, from_attributes=True))
+
+    return await _cached_response(request, ("summary", limit, after_id), render)
 
 @router.post("/", response_model=ScenarioSchema)
-async def create_new_scenario(scenario: ScenarioCreate, db: Session = Depends(get_db)):
-    return create_scenario(db=db, scenario=scenario)
+async def create_new_scenario(scenario: ScenarioCreate, db: AsyncSession = Depends(get_db)):
+    return await create_scenario(db=db, scenario=scenario)
 
 @router.get("/{scenario_id}", response_model=ScenarioSchema)
-async def read_scenario(scenario_id: int, db: Session = Depends(get_db)):
-    db_scenario = get_scenario(db, scenario_id=scenario_id)
-    if db_scenario is None:
-        raise HTTPException(status_code=404, detail="Scenario not found")
-    return db_scenario
+async def read_scenario(scenario_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    async def render() -> bytes:
+        db_scenario = await get_scenario(db, scenario_id=scenario_id)
+        if db_scenario is None:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+        return ScenarioSchema.model_validate(db_scenario).model_dump_json().encode()
+
+    return await _cached_response(request, ("detail", scenario_id), render)
 
 @router.patch("/{scenario_id}/steps/{step_id}/image", response_model=APIResponse)
 async def update_step_image(
     scenario_id: int,
     step_id: int,
     request: StepImageUpdateRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """更新训练步骤的图片URL"""
-    step = db.query(models.TrainingStep).filter(
+    result = await db.execute(select(models.TrainingStep).where(
         models.TrainingStep.id == step_id,
         models.TrainingStep.scenario_id == scenario_id
-    ).first()
+    ))
+    step = result.scalar_one_or_none()
     if not step:
         raise HTTPException(status_code=404, detail="Step not found")
     
     step.image_url = request.image_url
-    db.commit()
-    db.refresh(step)
+    await db.commit()
+    scenario_response_cache.bump()
     return APIResponse(success=True, message="图片URL已更新", data={"image_url": step.image_url})
 
 @router.delete("/{scenario_id}/steps", response_model=APIResponse)
 async def delete_scenario_steps_endpoint(
     scenario_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """删除场景的所有步骤"""
-    scenario = get_scenario(db, scenario_id)
+    scenario = await db.get(models.Scenario, scenario_id)
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
     
-    deleted_count = delete_scenario_steps(db, scenario_id)
+    deleted_count = await delete_scenario_steps(db, scenario_id)
     return APIResponse(success=True, message=f"已删除 {deleted_count} 个步骤", data={"deleted_count": deleted_count})
 
 @router.put("/{scenario_id}/steps", response_model=APIResponse)
 async def update_scenario_steps_endpoint(
     scenario_id: int,
     steps: List[TrainingStepCreate],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """更新场景的步骤（先删除旧步骤，再添加新步骤）"""
-    scenario = get_scenario(db, scenario_id)
+    """按 step_order 增量更新场景的步骤（未变化的步骤保留id和图片）"""
+    scenario = await db.get(models.Scenario, scenario_id)
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
     
-    updated_steps = update_scenario_steps(db, scenario_id, steps)
+    updated_steps = await update_scenario_steps(db, scenario_id, steps)
     return APIResponse(
         success=True,
         message="步骤已更新",
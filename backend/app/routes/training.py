@@ -1,44 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 from datetime import datetime
 from app.database import get_db
 from app.models import TrainingRecord
-from app.schemas import TrainingRecord as TrainingRecordSchema, TrainingRecordCreate
-from app.crud import create_training_record, get_training_records
+from app.schemas import TrainingRecord as TrainingRecordSchema, TrainingRecordCreate, TrainingStats
+from app.crud import create_training_record, get_training_record, get_training_records, increment_completed_steps
+from app.step_events import step_event_buffer
+from app.training_stats import apply_session, get_stats
 
 router = APIRouter()
 
+# 训练历史单页最多返回的条数；更大的 limit 会被截断到该值（而不是返回422），
+# 以兼容之前不限制 limit 的客户端。需要更多数据时用 before / before_id 继续翻页。
+MAX_HISTORY_PAGE = 500
+
 @router.post("/start")
-async def start_training(scenario_id: int, db: Session = Depends(get_db)):
-    """开始训练会话"""
+async def start_training(scenario_id: int, user_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """开始训练会话（提供 user_id 时训练统计会按用户汇总）"""
     record = TrainingRecord(
         scenario_id=scenario_id,
+        user_id=user_id,
         started_at=datetime.now()
     )
     db.add(record)
-    db.commit()
-    db.refresh(record)
+    await db.commit()
     return {"training_id": record.id, "started_at": record.started_at}
 
 @router.post("/{training_id}/step")
-async def complete_step(training_id: int, step_id: int, db: Session = Depends(get_db)):
-    """完成训练步骤"""
-    record = db.query(TrainingRecord).filter(TrainingRecord.id == training_id).first()
-    if not record:
+async def complete_step(
+    training_id: int,
+    step_id: int,
+    level: Optional[Literal['F', 'P', 'I']] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """完成训练步骤
+
+    completed_steps 用一条 UPDATE ... RETURNING 原子加一，并发点击不会丢失计数；
+    步骤事件（步骤、辅助等级、时间）进入写缓冲，由后台批量写入。
+    """
+    completed_steps = await increment_completed_steps(db, training_id)
+    if completed_steps is None:
         raise HTTPException(status_code=404, detail="Training record not found")
-    
-    record.completed_steps += 1
-    db.commit()
-    return {"completed_steps": record.completed_steps}
+
+    step_event_buffer.add(training_id, step_id, level)
+    return {"completed_steps": completed_steps}
 
 @router.post("/{training_id}/finish")
-async def finish_training(training_id: int, data: dict, db: Session = Depends(get_db)):
+async def finish_training(training_id: int, data: dict, db: AsyncSession = Depends(get_db)):
     """完成训练"""
-    record = db.query(TrainingRecord).filter(TrainingRecord.id == training_id).first()
+    record = await get_training_record(db, training_id)
     if not record:
         raise HTTPException(status_code=404, detail="Training record not found")
     
+    # 重复提交完成时，先从汇总中移除上一次的结果
+    if record.completed_at is not None:
+        await db.run_sync(apply_session, record, -1)
+
     record.completed_at = datetime.now()
     record.score = data.get("score", 0)  # 保留用于向后兼容
     record.total_steps = data.get("total_steps", 0)
@@ -51,13 +69,49 @@ async def finish_training(training_id: int, data: dict, db: Session = Depends(ge
         record.overall_level = data.get("overall_level")
     if "milestone" in data:
         record.milestone = data.get("milestone")
-    
-    db.commit()
-    db.refresh(record)
+
+    # 在同一事务中增量更新训练统计汇总
+    await db.run_sync(apply_session, record)
+    await db.commit()
     return record
 
 @router.get("/history", response_model=List[TrainingRecordSchema])
-async def get_history(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """获取训练历史"""
-    return get_training_records(db, skip=skip, limit=limit)
+async def get_history(
+    skip: int = 0,
+    limit: int = Query(100, ge=1, description=f"每页条数，超过 {MAX_HISTORY_PAGE} 时按 {MAX_HISTORY_PAGE} 返回"),
+    user_id: Optional[int] = None,
+    scenario_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    overall_level: Optional[Literal['F', 'P', 'I']] = None,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取训练历史（按开始时间倒序）
+
+    可按孩子、场景、日期范围 [start_date, end_date) 和总体辅助等级筛选；
+    翻页时传入上一页最后一条记录的 started_at 和 id 作为 before / before_id。
+    """
+    limit = min(limit, MAX_HISTORY_PAGE)
+    return await get_training_records(
+        db,
+        skip=skip,
+        limit=limit,
+        user_id=user_id,
+        scenario_id=scenario_id,
+        start_date=start_date,
+        end_date=end_date,
+        overall_level=overall_level,
+        before=before,
+        before_id=before_id
+    )
+
+
+@router.get("/stats", response_model=TrainingStats)
+async def get_training_stats(scenario_id: int = 0, user_id: int = 0, db: AsyncSession = Depends(get_db)):
+    """训练统计汇总（F/P/I等级、里程碑、平均完成率、最近训练时间）
 
+    直接读取增量维护的汇总表中的一行；scenario_id / user_id 省略或为0表示全部。
+    """
+    return await db.run_sync(get_stats, scenario_id, user_id)
@@ -39,6 +39,17 @@ class Scenario(ScenarioBase):
     class Config:
         from_attributes = True
 
+class ScenarioSummary(ScenarioBase):
+    """场景列表的轻量版本（不含步骤内容）"""
+    id: int
+    is_custom: bool
+    creator_id: Optional[int]
+    created_at: datetime
+    step_count: int = 0
+
+    class Config:
+        from_attributes = True
+
 # 训练记录
 class TrainingRecordBase(BaseModel):
     scenario_id: int
@@ -52,8 +63,22 @@ class TrainingRecordBase(BaseModel):
 class TrainingRecordCreate(TrainingRecordBase):
     pass
 
+class TrainingStats(BaseModel):
+    """训练统计汇总；scenario_id / user_id 为0表示全部"""
+    scenario_id: int = 0
+    user_id: int = 0
+    sessions: int = 0
+    level_f: int = 0
+    level_p: int = 0
+    level_i: int = 0
+    milestone_level1: int = 0
+    milestone_level2: int = 0
+    avg_completion_ratio: float = 0.0
+    last_session_at: Optional[datetime] = None
+
 class TrainingRecord(TrainingRecordBase):
     id: int
+    user_id: Optional[int] = None
     started_at: datetime
     completed_at: Optional[datetime] = None
 
@@ -69,6 +94,19 @@ class ImageGenerateRequest(BaseModel):
     prompt: str
     step_id: Optional[int] = None
     scenario_id: Optional[int] = None
+    bypass_cache: bool = False  # 为True时跳过缓存强制重新生成（“重新生成”按钮）
+
+class BatchImageItem(BaseModel):
+    prompt: str
+    step_id: Optional[int] = None
+
+class BatchImageGenerateRequest(BaseModel):
+    """批量生成图片：提供scenario_id时按场景步骤生成，或直接提供items列表"""
+    scenario_id: Optional[int] = None
+    items: Optional[List[BatchImageItem]] = None
+    prompt_suffix: Optional[str] = None  # 按场景生成时追加到每个步骤image_prompt之后（人物描述、画风等）
+    only_missing: bool = False  # 按场景生成时跳过已有图片的步骤
+    bypass_cache: bool = False
 
 class StepImageUpdateRequest(BaseModel):
     image_url: str
@@ -78,6 +116,25 @@ class TTSGenerateRequest(BaseModel):
     voice_name: Optional[str] = "Kore"  # 默认语音
     language: Optional[str] = "zh-CN"   # 默认语言
 
+class JobCreateRequest(BaseModel):
+    job_type: Literal['image', 'tts']
+    params: dict  # image: ImageGenerateRequest 字段；tts: TTSGenerateRequest 字段
+
+class Job(BaseModel):
+    id: str
+    job_type: str
+    status: Literal['pending', 'running', 'succeeded', 'failed']
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    next_attempt_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 class APIResponse(BaseModel):
     success: bool
     data: Optional[dict] = None
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from datetime import datetime
+from threading import Lock
+from typing import List, Optional
+from sqlalchemy import insert
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class StepEventBuffer:
+    """训练步骤事件的进程内写缓冲
+
+    complete_step 只把事件追加到内存列表；后台任务每隔 flush_interval 秒，或缓冲达到
+    batch_size 条时立即，把积压的事件用一条批量INSERT在一个事务中写入，
+    高频的步骤点击不再每次单独提交。进程退出时 stop() 会写入剩余事件。
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int):
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self._pending: List[dict] = []
+        self._lock = Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.batches = 0
+
+    def add(self, training_id: int, step_id: int, level: Optional[str] = None,
+            timestamp: Optional[datetime] = None):
+        with self._lock:
+            self._pending.append({
+                "training_id": training_id,
+                "step_id": step_id,
+                "level": level,
+                "timestamp": timestamp or datetime.now(),
+            })
+            full = len(self._pending) >= self.batch_size
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """把缓冲中的事件写入数据库，返回写入条数；写入失败时事件放回缓冲，下次重试"""
+        with self._lock:
+            events, self._pending = self._pending, []
+        if not events:
+            return 0
+        db = SessionLocal()
+        try:
+            db.execute(insert(models.TrainingStepEvent), events)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._pending[:0] = events
+            raise
+        finally:
+            db.close()
+        self.written += len(events)
+        self.batches += 1
+        return len(events)
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.warning(f"[步骤事件] 批量写入失败，稍后重试: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "written": self.written,
+            "batches": self.batches,
+        }
+
+
+step_event_buffer = StepEventBuffer(
+    flush_interval=settings.step_event_flush_ms / 1000,
+    batch_size=settings.step_event_batch_size
+)
@@ -0,0 +1,113 @@
+import logging
+from typing import Dict, Optional
+from sqlalchemy import case, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import models, schemas
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+_LEVEL_COLUMNS = {"F": "level_f", "P": "level_p", "I": "level_i"}
+_MILESTONE_COLUMNS = {"Level1": "milestone_level1", "Level2": "milestone_level2"}
+
+
+def session_contribution(record: models.TrainingRecord) -> Dict[str, float]:
+    """一次已完成的训练对汇总表各计数列的贡献"""
+    contribution = {"sessions": 1, "completion_ratio_sum": 0.0}
+    if record.total_steps:
+        contribution["completion_ratio_sum"] = min(1.0, (record.completed_steps or 0) / record.total_steps)
+    if record.overall_level in _LEVEL_COLUMNS:
+        contribution[_LEVEL_COLUMNS[record.overall_level]] = 1
+    if record.milestone in _MILESTONE_COLUMNS:
+        contribution[_MILESTONE_COLUMNS[record.milestone]] = 1
+    return contribution
+
+
+def _scopes(record: models.TrainingRecord):
+    """一条记录计入的汇总范围：场景、全局，以及有 user_id 时的 (场景, 用户) 和 (全部场景, 用户)"""
+    scopes = [(record.scenario_id, 0), (0, 0)]
+    if record.user_id:
+        scopes += [(record.scenario_id, record.user_id), (0, record.user_id)]
+    return scopes
+
+
+def apply_session(db: Session, record: models.TrainingRecord, sign: int = 1):
+    """将一次训练计入（sign=1）或移出（sign=-1）汇总表，不提交事务
+
+    使用 UPDATE ... SET 列 = 列 + 增量，并发完成的训练不会互相覆盖；
+    汇总行不存在时插入，插入冲突（另一个请求刚插入）时改为更新。
+    """
+    contribution = session_contribution(record)
+    table = models.TrainingStats
+    for scenario_id, user_id in _scopes(record):
+        values = {getattr(table, column): getattr(table, column) + sign * delta
+                  for column, delta in contribution.items()}
+        if sign > 0 and record.completed_at is not None:
+            values[table.last_session_at] = case(
+                (or_(table.last_session_at.is_(None), table.last_session_at < record.completed_at), record.completed_at),
+                else_=table.last_session_at
+            )
+        statement = update(table).where(table.scenario_id == scenario_id, table.user_id == user_id).values(values)
+        if db.execute(statement).rowcount or sign < 0:
+            continue
+        try:
+            with db.begin_nested():
+                db.add(table(
+                    scenario_id=scenario_id,
+                    user_id=user_id,
+                    last_session_at=record.completed_at,
+                    **{column: delta for column, delta in contribution.items()}
+                ))
+        except IntegrityError:
+            db.execute(statement)
+
+
+def get_stats(db: Session, scenario_id: int = 0, user_id: int = 0) -> schemas.TrainingStats:
+    """按 (场景, 用户) 读取一行汇总，没有训练记录时返回全零"""
+    row = db.query(models.TrainingStats).filter(
+        models.TrainingStats.scenario_id == scenario_id,
+        models.TrainingStats.user_id == user_id
+    ).first()
+    if row is None:
+        return schemas.TrainingStats(scenario_id=scenario_id, user_id=user_id)
+    return schemas.TrainingStats(
+        scenario_id=row.scenario_id,
+        user_id=row.user_id,
+        sessions=row.sessions,
+        level_f=row.level_f,
+        level_p=row.level_p,
+        level_i=row.level_i,
+        milestone_level1=row.milestone_level1,
+        milestone_level2=row.milestone_level2,
+        avg_completion_ratio=row.completion_ratio_sum / row.sessions if row.sessions else 0.0,
+        last_session_at=row.last_session_at
+    )
+
+
+def rebuild_training_stats(db: Optional[Session] = None) -> int:
+    """根据已完成的训练记录重建汇总表（汇总表为空而已有训练记录时在启动时执行一次），返回记录数"""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        if db.query(models.TrainingStats.id).first() is not None:
+            return 0
+        records = db.query(models.TrainingRecord).filter(
+            models.TrainingRecord.completed_at.isnot(None)
+        ).all()
+        count = 0
+        for record in records:
+            apply_session(db, record)
+            count += 1
+        db.commit()
+        if count:
+            logger.info(f"训练统计: 已根据 {count} 条训练记录重建汇总")
+        return count
+    finally:
+        if own_session:
+            db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    rebuild_training_stats()
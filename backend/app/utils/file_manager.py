@@ -1,13 +1,30 @@
 import os
+import gzip
+import logging
 import uuid
 import base64
+import hashlib
 from pathlib import Path
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
+from app.config import settings
+from app.utils.image_derivatives import DERIVED_DIRNAME, image_derivatives
+from app.utils.metrics import file_bytes_written_total, file_writes_total
+from app.utils.structured_log import log_event
+from app.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 可从预压缩中获益的文件类型（图片和mp3/ogg本身已压缩），保存时同时写入 .gz 兄弟文件
+PRECOMPRESS_SUFFIXES = {".wav", ".svg", ".json", ".txt"}
 
 class FileManager:
-    def __init__(self, upload_dir: str = "uploads"):
+    def __init__(self, upload_dir: str = "uploads", storage_mode: str = "cas"):
         self.upload_dir = Path(upload_dir)
         self.upload_dir.mkdir(exist_ok=True)
+        # cas：按内容SHA-256命名并分两级目录存放，相同内容只存一份；uuid：旧的随机命名平铺存放
+        self.storage_mode = storage_mode
+        # 文件事件监听器 (路径, 事件)，事件为 write/access/delete，用于维护文件索引
+        self.listeners: List[Callable[[Path, str], None]] = []
 
         # 创建子目录
         self.images_dir = self.upload_dir / "images"
@@ -15,31 +32,78 @@ class FileManager:
         self.images_dir.mkdir(exist_ok=True)
         self.audio_dir.mkdir(exist_ok=True)
 
-    def save_image(self, image_data, filename: Optional[str] = None) -> str:
-        """保存图像数据（支持bytes或base64字符串），返回相对路径用于URL生成"""
-        if not filename:
-            filename = f"{uuid.uuid4()}.png"
-
-        filepath = self.images_dir / filename
-
-        # 处理不同类型的数据
-        if isinstance(image_data, bytes):
+    def _decode(self, data) -> bytes:
+        """将bytes或base64字符串统一转换为bytes"""
+        if isinstance(data, bytes):
             # 如果已经是bytes，直接保存
-            image_bytes = image_data
-        elif isinstance(image_data, str):
+            return data
+        if isinstance(data, str):
             # 如果是字符串，可能是base64编码
             # 移除base64前缀（如果有）
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
+            if ',' in data:
+                data = data.split(',')[1]
             # 解码base64字符串
-            image_bytes = base64.b64decode(image_data)
+            return base64.b64decode(data)
+        # 尝试转换为bytes
+        return bytes(data)
+
+    def _write_atomic(self, filepath: Path, data: bytes):
+        """先写临时文件再重命名，并发读取方不会读到写了一半的文件"""
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = filepath.with_name(f".{filepath.name}.{uuid.uuid4().hex}.tmp")
+        kind = self._kind(filepath)
+        with span("file_manager.write", kind=kind, bytes=len(data)):
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, filepath)
+            finally:
+                if temp_path.exists():
+                    temp_path.unlink()
+        file_bytes_written_total.inc(kind, amount=len(data))
+        file_writes_total.inc(kind)
+
+    def _kind(self, filepath: Path) -> str:
+        """指标标签：上传目录下的一级目录（images / audio）"""
+        try:
+            return filepath.relative_to(self.upload_dir).parts[0]
+        except (ValueError, IndexError):
+            return "other"
+
+    def sharded_path(self, directory: Path, name: str) -> Path:
+        """两级前缀分片：<目录>/<名称前2位>/<名称3-4位>/<名称>，避免单个目录文件过多"""
+        return directory / name[:2] / name[2:4] / name
+
+    def content_path(self, directory: Path, data: bytes, ext: str) -> Path:
+        """内容寻址路径：以文件内容的SHA-256命名"""
+        return self.sharded_path(directory, f"{hashlib.sha256(data).hexdigest()}{ext}")
+
+    def _store(self, directory: Path, data: bytes, ext: str, filename: Optional[str] = None) -> Tuple[Path, bool]:
+        """写入文件，返回 (路径, 是否新写入)；内容寻址模式下已存在的相同内容直接复用"""
+        if filename:
+            filepath = directory / filename
+        elif self.storage_mode == "cas":
+            filepath = self.content_path(directory, data, ext)
+            if filepath.exists():
+                return filepath, False
         else:
-            # 尝试转换为bytes
-            image_bytes = bytes(image_data)
+            filepath = directory / f"{uuid.uuid4()}{ext}"
+        self._write_atomic(filepath, data)
+        return filepath, True
 
-        # 保存文件
-        with open(filepath, 'wb') as f:
-            f.write(image_bytes)
+    def save_image(self, image_data, filename: Optional[str] = None) -> str:
+        """保存图像数据（支持bytes或base64字符串），返回相对路径用于URL生成"""
+        with span("file_manager.save_image") as s:
+            with span("file_manager.decode"):
+                image_bytes = self._decode(image_data)
+            filepath, created = self._store(self.images_dir, image_bytes, ".png", filename)
+            if s:
+                s.set(bytes=len(image_bytes), created=created)
+
+            if created:
+                # 后台预生成缩略图、WebP等派生版本
+                image_derivatives.schedule_defaults(filepath)
+            self.notify(filepath, "write" if created else "access")
 
         # 返回相对路径（相对于upload_dir）
         relative_path = filepath.relative_to(self.upload_dir)
@@ -49,68 +113,90 @@ class FileManager:
         """保存base64图像数据（向后兼容），返回相对路径用于URL生成"""
         return self.save_image(base64_data, filename)
 
-    def save_audio_from_base64(self, base64_data: str, filename: Optional[str] = None) -> str:
-        """保存base64音频数据，返回相对路径用于URL生成"""
-        if not filename:
-            filename = f"{uuid.uuid4()}.mp3"
-
-        filepath = self.audio_dir / filename
-
-        # 移除base64前缀（如果有）
-        if ',' in base64_data:
-            base64_data = base64_data.split(',')[1]
-
-        # 解码并保存
-        audio_data = base64.b64decode(base64_data)
-        with open(filepath, 'wb') as f:
-            f.write(audio_data)
+    def save_audio(self, audio_data, filename: Optional[str] = None, ext: str = ".mp3") -> str:
+        """保存音频数据（支持bytes或base64字符串），返回相对路径用于URL生成"""
+        with span("file_manager.save_audio", ext=ext) as s:
+            audio_bytes = self._decode(audio_data)
+            filepath, created = self._store(self.audio_dir, audio_bytes, ext, filename)
+            if s:
+                s.set(bytes=len(audio_bytes), created=created)
+            if created:
+                self._write_precompressed(filepath, audio_bytes)
+            self.notify(filepath, "write" if created else "access")
 
         # 返回相对路径（相对于upload_dir）
         relative_path = filepath.relative_to(self.upload_dir)
         return str(relative_path)
 
+    def notify(self, filepath: Path, event: str):
+        for listener in self.listeners:
+            try:
+                listener(filepath, event)
+            except Exception as e:
+                logger.warning(f"[文件管理] 事件监听器出错 {event} {filepath}: {e}")
+
+    def _write_precompressed(self, filepath: Path, data: bytes):
+        """为可压缩的文件写入 .gz 兄弟文件，静态服务按 Accept-Encoding 直接返回"""
+        if filepath.suffix.lower() not in PRECOMPRESS_SUFFIXES:
+            return
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) >= len(data) * 0.9:
+            return
+        self._write_atomic(filepath.with_name(filepath.name + ".gz"), compressed)
+
+    def save_audio_from_base64(self, base64_data: str, filename: Optional[str] = None) -> str:
+        """保存base64音频数据（向后兼容），返回相对路径用于URL生成"""
+        return self.save_audio(base64_data, filename)
+
     def get_file_url(self, filepath: str) -> str:
         """获取文件访问URL"""
-        # #region agent log
-        import json
-        with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"location":"file_manager.py:get_file_url","message":"Generating file URL","data":{"input_filepath":filepath,"has_backslash":"\\" in str(filepath)},"timestamp":__import__('time').time()*1000,"sessionId":"debug-session","runId":"post-fix","hypothesisId":"B"})+'\n')
-        # #endregion
         # 如果filepath是绝对路径，转换为相对路径
         filepath_obj = Path(filepath)
         if filepath_obj.is_absolute():
             # 尝试获取相对于upload_dir的路径
             try:
                 relative_path = filepath_obj.relative_to(self.upload_dir)
-                # 将Windows路径分隔符转换为URL路径分隔符
-                url_path = str(relative_path).replace('\\', '/')
-                final_url = f"/files/{url_path}"
-                # #region agent log
-                with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-                    f.write(json.dumps({"location":"file_manager.py:get_file_url","message":"File URL generated (absolute path)","data":{"relative_path":str(relative_path),"url_path":url_path,"final_url":final_url,"has_backslash_in_url":"\\" in final_url},"timestamp":__import__('time').time()*1000,"sessionId":"debug-session","runId":"post-fix","hypothesisId":"B"})+'\n')
-                # #endregion
-                return final_url
             except ValueError:
                 # 如果无法获取相对路径，返回文件名
                 return f"/files/{filepath_obj.name}"
+            filepath = str(relative_path)
         # 将Windows路径分隔符转换为URL路径分隔符
         url_path = filepath.replace('\\', '/')
         final_url = f"/files/{url_path}"
-        # #region agent log
-        with open('d:\\AAAPyCharm_project\\XINGQIAO\\XINGQIAO\\.cursor\\debug.log', 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"location":"file_manager.py:get_file_url","message":"File URL generated (relative path)","data":{"input_filepath":filepath,"url_path":url_path,"final_url":final_url,"has_backslash_in_url":"\\" in final_url},"timestamp":__import__('time').time()*1000,"sessionId":"debug-session","runId":"post-fix","hypothesisId":"B"})+'\n')
-        # #endregion
+        log_event(logger, "file.url", "File URL generated", level=logging.DEBUG, input_filepath=str(filepath_obj),
+                  final_url=final_url)
         return final_url
 
-    def cleanup_old_files(self, days: int = 7):
-        """清理旧文件"""
-        import time
-        current_time = time.time()
-
-        for file_path in self.upload_dir.rglob("*"):
-            if file_path.is_file():
-                if current_time - file_path.stat().st_mtime > days * 24 * 3600:
-                    file_path.unlink()
-
-file_manager = FileManager()
+    def url_to_path(self, url: str) -> Optional[Path]:
+        """将 /files/... URL 转换为磁盘路径，非本地文件URL返回None"""
+        if not url or not url.startswith("/files/"):
+            return None
+        relative = url[len("/files/"):].split("?", 1)[0]
+        path = (self.upload_dir / relative).resolve()
+        try:
+            path.relative_to(self.upload_dir.resolve())
+        except ValueError:
+            return None
+        return path
+
+    def delete(self, relative_path: str) -> int:
+        """删除文件及其预压缩兄弟文件和图片派生版本，返回释放的字节数"""
+        filepath = self.upload_dir / relative_path
+        targets = [filepath] + [filepath.with_name(filepath.name + suffix) for suffix in (".gz", ".br")]
+        derived_dir = filepath.parent / DERIVED_DIRNAME
+        if derived_dir.exists():
+            targets.extend(derived_dir.glob(f"{filepath.stem}.w*"))
+
+        freed = 0
+        for target in targets:
+            try:
+                size = target.stat().st_size
+                target.unlink()
+                freed += size
+            except FileNotFoundError:
+                continue
+        self.notify(filepath, "delete")
+        return freed
+
+file_manager = FileManager(storage_mode=settings.storage_mode)
 
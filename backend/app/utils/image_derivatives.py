@@ -0,0 +1,112 @@
+import io
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 未安装时只提供原图
+    Image = None
+
+# 可选的派生格式：webp 取有损/无损中较小者；png 为调色板量化后的PNG，适合极简线条风格
+FORMATS = ("webp", "png")
+DERIVED_DIRNAME = "derived"
+
+
+class ImageDerivatives:
+    """图片派生版本：缩略图、WebP 和调色板量化 PNG
+
+    派生文件保存在原图所在目录的 derived/ 子目录，命名为 <原文件名>.w<宽度>.<格式>
+    （宽度为0表示原始尺寸）。请求的宽度会向上取整到配置的档位，避免任意宽度产生大量文件。
+    """
+
+    def __init__(self, widths: Iterable[int], default_variants: Iterable[Tuple[int, str]],
+                 webp_quality: int = 80, png_colors: int = 64):
+        self.widths = sorted({w for w in widths if w > 0})
+        self.default_variants = list(default_variants)
+        self.webp_quality = webp_quality
+        self.png_colors = png_colors
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-derivatives")
+        # 新派生文件的监听器 (原图路径, 派生文件路径)，用于把派生文件大小计入原图
+        self.listeners: List[Callable[[Path, Path], None]] = []
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def normalize_width(self, width: Optional[int]) -> int:
+        """将请求宽度映射到档位；0或超过最大档位时返回0（原始尺寸）"""
+        if not width or width <= 0:
+            return 0
+        for candidate in self.widths:
+            if width <= candidate:
+                return candidate
+        return 0
+
+    def derivative_path(self, original: Path, width: int, fmt: str) -> Path:
+        return original.parent / DERIVED_DIRNAME / f"{original.stem}.w{width}.{fmt}"
+
+    def get_or_create(self, original: Path, width: Optional[int], fmt: str) -> Path:
+        """返回派生文件路径，不存在时同步生成；Pillow 不可用时返回原图"""
+        if not self.available or fmt not in FORMATS:
+            return original
+        width = self.normalize_width(width)
+        target = self.derivative_path(original, width, fmt)
+        if target.exists():
+            return target
+
+        with Image.open(original) as img:
+            img.load()
+            if width and img.width > width:
+                height = max(1, round(img.height * width / img.width))
+                img = img.resize((width, height), Image.LANCZOS)
+            if fmt == "webp":
+                if img.mode not in ("RGB", "RGBA"):
+                    img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+                data = self._encode_webp(img)
+            else:
+                img = img.convert("RGB").quantize(colors=self.png_colors, method=Image.Quantize.MEDIANCUT)
+                buffer = io.BytesIO()
+                img.save(buffer, format="PNG", optimize=True)
+                data = buffer.getvalue()
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, target)
+        for listener in self.listeners:
+            listener(original, target)
+        return target
+
+    def _encode_webp(self, img) -> bytes:
+        """线条图用无损WebP通常更小，照片类用有损更小，两种都编码后取较小者"""
+        encoded = []
+        for options in ({"lossless": True, "method": 6}, {"quality": self.webp_quality, "method": 6}):
+            buffer = io.BytesIO()
+            img.save(buffer, format="WEBP", **options)
+            encoded.append(buffer.getvalue())
+        return min(encoded, key=len)
+
+    def create_defaults(self, original: Path):
+        for width, fmt in self.default_variants:
+            try:
+                self.get_or_create(original, width, fmt)
+            except Exception as e:
+                logger.warning(f"[图片派生] 生成失败 {original.name} w={width} fmt={fmt}: {e}")
+
+    def schedule_defaults(self, original: Path):
+        """保存原图后在后台线程中预生成默认派生版本"""
+        if self.available and self.default_variants:
+            self._executor.submit(self.create_defaults, original)
+
+
+image_derivatives = ImageDerivatives(
+    widths=settings.image_derivative_widths,
+    default_variants=settings.image_derivative_defaults
+)
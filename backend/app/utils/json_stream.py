@@ -0,0 +1,75 @@
+import json
+from typing import Any, List, Optional
+
+
+class JSONArrayItemStream:
+    """从流式返回的JSON文本中增量提取顶层对象某个数组字段的元素
+
+    例如对 {"total_images": 3, "steps": [{...}, {...}]}，每当 steps 中的一个对象
+    完整到达就立即返回它，而不必等待整个响应结束。对象外的内容（如 ```json 代码块标记）会被忽略。
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self.finished = False
+
+    @property
+    def text(self) -> str:
+        """目前为止收到的完整文本"""
+        return self._buffer
+
+    def feed(self, chunk: str) -> List[Any]:
+        """追加一段文本，返回本次新完成的数组元素"""
+        self._buffer += chunk
+        items = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = buffer[self._string_start:i + 1]
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":" and self._depth == 1:
+                try:
+                    self._pending_key = json.loads(self._last_string) if self._last_string else None
+                except ValueError:
+                    self._pending_key = None
+            elif c == "," and self._depth == 1:
+                self._pending_key = None
+            elif c in "{[":
+                self._depth += 1
+                if (c == "[" and self._array_depth is None and not self.finished
+                        and self._depth == 2 and self._pending_key == self.key):
+                    self._array_depth = self._depth
+                elif c == "{" and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = i
+            elif c in "}]":
+                if (c == "}" and self._array_depth is not None and self._item_start is not None
+                        and self._depth == self._array_depth + 1):
+                    items.append(json.loads(buffer[self._item_start:i + 1]))
+                    self._item_start = None
+                elif c == "]" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._array_depth = None
+                    self.finished = True
+                self._depth = max(0, self._depth - 1)
+        self._pos = len(buffer)
+        return items
@@ -0,0 +1,267 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 默认延迟分桶（秒）：覆盖从缓存命中的毫秒级读取到数十秒的图片生成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """按线程分片的指标存储
+
+    每个线程只写自己的分片（普通 dict，不加锁），采集时复制各分片后汇总。
+    只有线程第一次写入时注册分片需要加锁，请求路径上的计数没有锁竞争。
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _snapshots(self) -> List[dict]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        # dict.copy() 在持有GIL时完成，不会与所属线程的写入交错
+        return [shard.copy() for shard in shards]
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self) -> Dict[LabelValues, float]:
+        totals: Dict[LabelValues, float] = {}
+        for snapshot in self._snapshots():
+            for labels, value in snapshot.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.collect().items())
+        ]
+
+
+class Histogram(_Sharded):
+    """累积分桶直方图；每个分片按标签保存 [各桶计数..., 总和, 总数]"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            row = shard[labels] = [0] * (len(self.buckets) + 3)
+        # 落入的最小桶；超过所有上限的计入 +Inf 桶
+        row[bisect_left(self.buckets, value)] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def collect(self) -> Dict[LabelValues, List[float]]:
+        totals: Dict[LabelValues, List[float]] = {}
+        for snapshot in self._snapshots():
+            for labels, row in snapshot.items():
+                total = totals.setdefault(labels, [0] * len(row))
+                for index, value in enumerate(list(row)):
+                    total[index] += value
+        return totals
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, row in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-2]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {row[-1]}")
+        return lines
+
+
+class CallbackGauge:
+    """采集时调用回调读取当前值，适合导出已有的统计（如缓存命中数）"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str],
+                 callback: Callable[[], Dict[LabelValues, float]], kind: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.callback().items())
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name: str, help_text: str, labelnames: Iterable[str],
+                 callback: Callable[[], Dict[LabelValues, float]], kind: str = "gauge") -> CallbackGauge:
+        return self.register(CallbackGauge(name, help_text, labelnames, callback, kind))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.render()
+            except Exception as e:
+                lines.append(f"# {metric.name} collection failed: {_escape(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP requests by route template, method and status", ("method", "route", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response body finishes", ("method", "route")
+)
+gemini_requests_total = registry.counter(
+    "gemini_requests_total", "Gemini API calls (each retry attempt counted) by outcome",
+    ("model", "operation", "outcome")
+)
+gemini_request_duration_seconds = registry.histogram(
+    "gemini_request_duration_seconds", "Gemini API call latency", ("model", "operation")
+)
+file_bytes_written_total = registry.counter(
+    "file_manager_bytes_written_total", "Bytes written by FileManager (including precompressed siblings)", ("kind",)
+)
+file_writes_total = registry.counter("file_manager_writes_total", "Files written by FileManager", ("kind",))
+db_queries_total = registry.counter("db_queries_total", "SQL statements executed", ("route",))
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "SQL statements executed while handling one request", ("route",), QUERY_BUCKETS
+)
+
+# 当前请求的SQL语句计数（列表便于在复制的上下文中原地累加，如 to_thread / greenlet 中执行的查询）
+_request_queries: ContextVar[Optional[List[int]]] = ContextVar("request_queries", default=None)
+
+
+def count_query(*_):
+    """SQLAlchemy before_cursor_execute 监听器：计入当前请求的查询数"""
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class RouteTemplates:
+    """根据路由匹配后写入 scope 的 endpoint 反查路由模板（如 /api/scenarios/{scenario_id}）
+
+    用模板而不是实际路径作为标签，避免路径参数导致标签数量无限增长；
+    未匹配任何路由的请求返回 <unmatched>。
+    """
+
+    def __init__(self):
+        self._routes: Optional[Dict[object, str]] = None
+
+    def lookup(self, scope) -> str:
+        if self._routes is None:
+            routes = {}
+            for route in getattr(scope.get("app"), "routes", []):
+                path = getattr(route, "path", "")
+                if getattr(route, "endpoint", None) is not None:
+                    routes[route.endpoint] = path
+                elif getattr(route, "app", None) is not None:
+                    routes[route.app] = f"{path}/{{path}}"
+            self._routes = routes
+        return self._routes.get(scope.get("endpoint"), "<unmatched>")
+
+
+class MetricsMiddleware:
+    """纯ASGI中间件：按路由模板统计请求数、延迟（到响应体发送完毕）和SQL语句数"""
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = RouteTemplates()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+        queries = [0]
+        token = _request_queries.set(queries)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_queries.reset(token)
+            route = self.routes.lookup(scope)
+            method = scope["method"]
+            http_requests_total.inc(method, route, str(status[0]))
+            http_request_duration_seconds.observe(time.perf_counter() - started, method, route)
+            db_queries_per_request.observe(queries[0], route)
+            if queries[0]:
+                db_queries_total.inc(route, amount=queries[0])
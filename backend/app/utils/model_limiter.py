@@ -0,0 +1,55 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict
+
+
+class ModelConcurrencyLimiter:
+    """按模型名限制并发调用数
+
+    每个模型拥有独立的信号量，慢速的图像模型排满时不会占用文本模型的名额；
+    等待中的协程只是挂起，不会阻塞事件循环上的其他请求。
+    """
+
+    def __init__(self, default_limit: int = 4, limits: Dict[str, int] = None):
+        self.default_limit = max(1, default_limit)
+        self.limits = {model: max(1, limit) for model, limit in (limits or {}).items()}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+
+    def get_limit(self, model: str) -> int:
+        return self.limits.get(model, self.default_limit)
+
+    def _get_semaphore(self, model: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.get_limit(model))
+            self._semaphores[model] = semaphore
+        return semaphore
+
+    @asynccontextmanager
+    async def limit(self, model: str):
+        """占用指定模型的一个并发名额"""
+        semaphore = self._get_semaphore(model)
+        self._waiting[model] = self._waiting.get(model, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[model] -= 1
+        self._in_flight[model] = self._in_flight.get(model, 0) + 1
+        try:
+            yield
+        finally:
+            self._in_flight[model] -= 1
+            semaphore.release()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """返回各模型当前的并发占用情况"""
+        return {
+            model: {
+                "limit": self.get_limit(model),
+                "in_flight": self._in_flight.get(model, 0),
+                "waiting": self._waiting.get(model, 0),
+            }
+            for model in self._semaphores
+        }
@@ -0,0 +1,90 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from app.config import settings
+from app.utils.static_files import etag_matches
+
+# 客户端每次使用前都要用ETag重新验证，数据未变时只返回304
+REVALIDATE_ALWAYS = "no-cache"
+
+
+class VersionedResponseCache:
+    """按版本号整体失效的序列化响应缓存
+
+    缓存的是已序列化的JSON响应体及其ETag（响应体的SHA-256）。任何写操作调用 bump()
+    使版本号加一并清空缓存；读请求命中时直接返回缓存的字节，不查询数据库也不重新序列化。
+    put 时需传入渲染开始前取得的版本号，渲染期间发生写操作时结果不会被缓存，避免缓存旧数据。
+
+    版本号只在本进程内有效：多个worker进程时，其他进程的写操作无法使本进程的缓存失效，
+    因此每个条目只保留 ttl_seconds 秒，跨进程的旧数据最多持续这么久。过期后重新渲染，
+    内容未变时ETag不变，客户端的重新验证仍然返回304。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 5):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, str, float]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: Hashable, version: int, body: bytes) -> Tuple[bytes, str]:
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        with self._lock:
+            if version == self.version and self.ttl_seconds > 0:
+                self._entries[key] = (body, etag, time.monotonic() + self.ttl_seconds)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return body, etag
+
+    def respond(self, entry: Tuple[bytes, str], request_headers: Headers) -> Response:
+        """返回缓存的响应体；If-None-Match 匹配时返回304"""
+        body, etag = entry
+        headers = {"etag": etag, "cache-control": REVALIDATE_ALWAYS}
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+# 场景读取接口（列表、轻量列表、详情）的响应缓存，场景或步骤有任何写入时失效
+scenario_response_cache = VersionedResponseCache(ttl_seconds=settings.scenario_cache_ttl_seconds)
@@ -0,0 +1,308 @@
+import hashlib
+import os
+import re
+import stat
+from collections import OrderedDict
+from email.utils import formatdate
+from mimetypes import guess_type
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+
+# 生成后不再变化的文件（uuid 或 SHA-256 命名，包括其派生版本）可被客户端永久缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=3600"
+
+_IMMUTABLE_NAME = re.compile(
+    r"^([0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(\.|$)"
+)
+_RANGE_SPEC = re.compile(r"^bytes=(\d*)-(\d*)$", re.IGNORECASE)
+
+# 预压缩的同名兄弟文件：按优先级排列 (Content-Encoding, 后缀)
+PRECOMPRESSED_SIBLINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def is_immutable_name(name: str) -> bool:
+    return bool(_IMMUTABLE_NAME.match(name))
+
+
+def precompressed_siblings(path) -> List[Tuple[str, str]]:
+    """存在的预压缩兄弟文件 [(Content-Encoding, 路径)]；会访问磁盘，应在线程池中调用"""
+    path = str(path)
+    return [(encoding, path + suffix) for encoding, suffix in PRECOMPRESSED_SIBLINGS
+            if os.path.isfile(path + suffix)]
+
+
+def file_metadata(path) -> Tuple[os.stat_result, str, List[Tuple[str, str]]]:
+    """一次取得构建文件响应所需的 (stat, ETag, 预压缩兄弟文件)，供 asyncio.to_thread 调用"""
+    stat_result = os.stat(path)
+    return stat_result, etag_cache.get(path, stat_result), precompressed_siblings(path)
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """解析 Accept-Encoding 为 {编码: q值}，如 "br;q=0, gzip" → {"br": 0.0, "gzip": 1.0}"""
+    result = {}
+    for item in accept_encoding.split(","):
+        token, *params = [part.strip() for part in item.split(";")]
+        if not token:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        result[token.lower()] = quality
+    return result
+
+
+def choose_encoding(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    """从可用的编码中选出客户端接受（q>0）且q值最高的一个，q值相同时按 encodings 的顺序
+
+    未列出的编码按 "*" 的q值处理；q=0 表示明确拒绝。
+    """
+    accepted = accepted_encodings(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class ETagCache:
+    """强ETag缓存：基于文件内容的SHA-256，按 (路径, mtime, 大小) 记忆，每个文件只读取一次"""
+
+    def __init__(self, max_entries: int = 8192):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, path, stat_result: Optional[os.stat_result] = None) -> str:
+        path = str(path)
+        stat_result = stat_result or os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == stat_result.st_mtime_ns and entry[1] == stat_result.st_size:
+                self._entries.move_to_end(path)
+                return entry[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()}"'
+
+        with self._lock:
+            self._entries[path] = (stat_result.st_mtime_ns, stat_result.st_size, etag)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+
+etag_cache = ETagCache()
+
+
+class PartialFileResponse(Response):
+    """返回文件的一个字节区间（206 Partial Content）"""
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path, start: int, end: int, file_size: int,
+                 headers: Dict[str, str], media_type: str, method: str = "GET"):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = 206
+        self.media_type = media_type
+        self.background = None
+        self.send_header_only = method.upper() == "HEAD"
+        self.init_headers({
+            **headers,
+            "content-range": f"bytes {start}-{end}/{file_size}",
+            "content-length": str(end - start + 1),
+        })
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = self.end - self.start + 1
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """解析单区间 Range 头，返回 (start, end)
+
+    多区间或格式错误时返回None（按整文件返回）；区间不可满足时抛出 ValueError。
+    """
+    match = _RANGE_SPEC.match(range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    start_text, end_text = match.groups()
+    if not start_text:
+        suffix_length = int(end_text)
+        if suffix_length == 0 or file_size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, file_size - suffix_length), file_size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else file_size - 1
+    if start >= file_size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, file_size - 1)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 使用弱比较；预压缩版本的ETag（"<hash>-gzip"）同样视为匹配"""
+    if if_none_match.strip() == "*":
+        return True
+    accepted = {etag} | {f'{etag[:-1]}-{encoding}"' for encoding, _ in PRECOMPRESSED_SIBLINGS}
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in accepted:
+            return True
+    return False
+
+
+def build_file_response(
+    path,
+    stat_result: os.stat_result,
+    etag: str,
+    request_headers: Headers,
+    method: str = "GET",
+    cache_control: str = REVALIDATE_CACHE_CONTROL,
+    extra_headers: Optional[Dict[str, str]] = None,
+    siblings: Sequence[Tuple[str, str]] = ()
+) -> Response:
+    """构建支持强ETag、304、Range 和预压缩兄弟文件的文件响应
+
+    siblings 为 precompressed_siblings() 的结果，由调用方在线程池中取得，这里不访问磁盘。
+    """
+    path = str(path)
+    media_type = guess_type(path)[0] or "application/octet-stream"
+    headers = {
+        "etag": etag,
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        **(extra_headers or {}),
+    }
+
+    if siblings:
+        headers["vary"] = ", ".join(filter(None, [headers.get("vary"), "Accept-Encoding"]))
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "accept-ranges"})
+
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, stat_result.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{stat_result.st_size}"})
+        if byte_range is not None:
+            return PartialFileResponse(path, byte_range[0], byte_range[1], stat_result.st_size,
+                                       headers, media_type, method)
+
+    encoding = choose_encoding(request_headers.get("accept-encoding", ""), [name for name, _ in siblings])
+    if encoding is not None:
+        return FileResponse(
+            dict(siblings)[encoding],
+            media_type=media_type,
+            method=method,
+            headers={**headers, "content-encoding": encoding, "etag": f'{etag[:-1]}-{encoding}"'},
+        )
+
+    return FileResponse(path, stat_result=stat_result, media_type=media_type, method=method, headers=headers)
+
+
+class CachedStaticFiles(StaticFiles):
+    """带缓存语义的静态文件目录
+
+    - 强ETag（内容哈希），支持 If-None-Match 返回 304
+    - uuid/SHA-256 命名的文件返回 Cache-Control: immutable，其他文件按 default_cache_control 重新验证
+    - 支持单区间 Range 请求，以及 .br/.gz 预压缩兄弟文件
+    - 文件不存在时可通过 alias_resolver 解析旧路径（例如迁移到内容寻址存储之前的URL）
+    - 每次命中文件时调用 access_hook（例如记录文件的最近访问时间）
+    """
+
+    def __init__(self, *args, immutable_names: bool = True,
+                 default_cache_control: str = REVALIDATE_CACHE_CONTROL,
+                 alias_resolver: Optional[Callable[[str], Optional[str]]] = None,
+                 access_hook: Optional[Callable[[str], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable_names = immutable_names
+        self.default_cache_control = default_cache_control
+        self.alias_resolver = alias_resolver
+        self.access_hook = access_hook
+
+    def lookup_path(self, path: str):
+        # lookup_path 在线程池中执行，顺便计算（并记忆）ETag，避免在事件循环上读取文件
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is None and self.alias_resolver is not None:
+            target = self.alias_resolver(path)
+            if target:
+                full_path, stat_result = super().lookup_path(target)
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            etag_cache.get(full_path, stat_result)
+            if self.access_hook is not None:
+                self.access_hook(full_path)
+        return full_path, stat_result
+
+    def _resolve(self, path: str):
+        """在线程池中执行：查找文件并探测预压缩兄弟文件"""
+        full_path, stat_result = self.lookup_path(path)
+        siblings = []
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            siblings = precompressed_siblings(full_path)
+        return full_path, stat_result, siblings
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        try:
+            full_path, stat_result, siblings = await anyio.to_thread.run_sync(self._resolve, path)
+        except PermissionError:
+            raise HTTPException(status_code=401)
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            return build_file_response(
+                full_path,
+                stat_result,
+                etag_cache.get(full_path, stat_result),
+                Headers(scope=scope),
+                method=scope["method"],
+                cache_control=self.cache_control_for(full_path),
+                siblings=siblings,
+            )
+        # 目录、html模式和404由父类处理
+        return await super().get_response(path, scope)
+
+    def cache_control_for(self, full_path) -> str:
+        if self.immutable_names and is_immutable_name(Path(full_path).name):
+            return IMMUTABLE_CACHE_CONTROL
+        return self.default_cache_control
@@ -0,0 +1,148 @@
+import json
+import logging
+import queue
+import random
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.config import settings
+
+# 应用日志的根logger，各模块使用 logging.getLogger(__name__)（app.*）
+APP_LOGGER = "app"
+
+
+def log_event(logger: logging.Logger, event: str, message: str = "", level: int = logging.INFO, **fields):
+    """记录一条结构化事件：event 为事件名（用于采样和检索），fields 作为JSON字段输出
+
+    未启用该级别时直接返回；启用时只构造日志记录并入队，格式化和写文件在后台线程完成。
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, message or event, extra={"event": event, "fields": fields})
+
+
+class JSONLineFormatter(logging.Formatter):
+    """每条日志一行JSON：ts、level、logger、event、message 以及事件字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": getattr(record, "event", record.name),
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """按事件名采样：采样率为 r 的事件只保留约 r 比例；WARNING 及以上级别总是保留"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(getattr(record, "event", record.name))
+        if rate is None or rate >= 1 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class BufferedQueueHandler(QueueHandler):
+    """请求路径上只做采样判断和一次非阻塞入队
+
+    不在调用线程中格式化（QueueHandler 默认会先格式化整条消息），JSON序列化和写文件
+    都由 QueueListener 的后台线程完成；队列满时丢弃并计数，不阻塞事件循环。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只合并消息参数，避免参数对象在后台格式化前被修改
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """app.* 日志的后台写入管道：BufferedQueueHandler → 队列 → QueueListener → 轮转的JSON行文件 / 控制台"""
+
+    def __init__(self):
+        self.handler: Optional[BufferedQueueHandler] = None
+        self.sampler: Optional[SamplingFilter] = None
+        self._listener: Optional[QueueListener] = None
+        self._outputs: List[logging.Handler] = []
+
+    def _build_outputs(self) -> List[logging.Handler]:
+        outputs: List[logging.Handler] = []
+        if settings.log_file:
+            path = Path(settings.log_file)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            file_handler = RotatingFileHandler(
+                path, maxBytes=settings.log_max_bytes, backupCount=settings.log_backup_count, encoding="utf-8"
+            )
+            file_handler.setFormatter(JSONLineFormatter())
+            outputs.append(file_handler)
+        if settings.log_console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+            outputs.append(console_handler)
+        return outputs
+
+    def start(self):
+        if self._listener is not None:
+            return
+        log_queue: queue.Queue = queue.Queue(maxsize=max(1, settings.log_queue_size))
+        self.handler = BufferedQueueHandler(log_queue)
+        self.sampler = SamplingFilter(settings.log_sample_rates)
+        self.handler.addFilter(self.sampler)
+
+        logger = logging.getLogger(APP_LOGGER)
+        logger.setLevel(settings.log_level.upper())
+        logger.addHandler(self.handler)
+        # 不再传给根logger，避免与 uvicorn 的日志配置重复输出
+        logger.propagate = False
+
+        self._outputs = self._build_outputs()
+        self._listener = QueueListener(log_queue, *self._outputs, respect_handler_level=True)
+        self._listener.start()
+
+    def stop(self):
+        """停止后台线程，写完队列中剩余的日志"""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        self._listener = None
+        logger = logging.getLogger(APP_LOGGER)
+        logger.removeHandler(self.handler)
+        logger.propagate = True
+        for output in self._outputs:
+            output.close()
+        self._outputs = []
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.handler.queue.qsize() if self.handler else 0,
+            "dropped": self.handler.dropped if self.handler else 0,
+            "sampled_out": self.sampler.sampled_out if self.sampler else 0,
+        }
+
+
+log_pipeline = LogPipeline()
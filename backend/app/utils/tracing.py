@@ -0,0 +1,296 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from app.config import settings
+from app.utils.metrics import RouteTemplates
+
+SERVICE_NAME = "xingqiao-backend"
+
+# OTLP 中的 span kind 与状态码
+_KIND_INTERNAL = 1
+_KIND_SERVER = 2
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error", "kind")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, Any],
+                 kind: int = _KIND_INTERNAL):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        self.kind = kind
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """一次请求的所有span；根span结束时整体放入环形缓冲"""
+    __slots__ = ("trace_id", "root", "spans")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(self.trace_id, None, name, attributes, kind=_KIND_SERVER)
+        self.spans: List[Span] = []
+
+    def summary(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started_at": self.root.start_ns / 1e9,
+            "duration_ms": round(self.root.duration_ms, 3),
+            "status": self.root.attributes.get("http.status_code"),
+            "span_count": len(self.spans) + 1,
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class span:
+    """记录一段耗时：with span("file_manager.save_image", bytes=n) as s: ...
+
+    不在被采样的请求中时（或未启用追踪）什么都不做，开销只有一次 ContextVar 读取。
+    同步代码、协程以及 to_thread / run_sync 中执行的代码都可以使用，子span自动挂到当前span下。
+    """
+    __slots__ = ("name", "attributes", "_span", "_token", "_trace")
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self._span: Optional[Span] = None
+
+    def __enter__(self) -> Optional[Span]:
+        trace = _current_trace.get()
+        if trace is None:
+            return None
+        parent = _current_span.get() or trace.root
+        self._trace = trace
+        self._span = Span(trace.trace_id, parent.span_id, self.name, self.attributes)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        current = self._span
+        if current is None:
+            return False
+        current.end_ns = time.time_ns()
+        if exc is not None:
+            current.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        self._trace.spans.append(current)
+        return False
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(item: Span) -> dict:
+    result = {
+        "traceId": item.trace_id,
+        "spanId": item.span_id,
+        "name": item.name,
+        "kind": item.kind,
+        "startTimeUnixNano": str(item.start_ns),
+        "endTimeUnixNano": str(item.end_ns or item.start_ns),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in item.attributes.items()],
+        "status": {"code": _STATUS_ERROR, "message": item.error} if item.error else {"code": _STATUS_OK},
+    }
+    if item.parent_id:
+        result["parentSpanId"] = item.parent_id
+    return result
+
+
+def to_otlp(trace: Trace) -> dict:
+    """OTLP/JSON 格式（ExportTraceServiceRequest），可被 OpenTelemetry Collector 的文件接收器读取"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "app.utils.tracing"},
+                "spans": [_otlp_span(trace.root)] + [_otlp_span(item) for item in list(trace.spans)],
+            }],
+        }]
+    }
+
+
+def render_waterfall(trace: Trace, width: int = 60) -> str:
+    """文本瀑布图：每行一个span，按开始时间排序并按父子关系缩进，条形表示在请求时间轴上的位置"""
+    root = trace.root
+    total_ns = max(1, (root.end_ns or time.time_ns()) - root.start_ns)
+    spans = sorted(list(trace.spans), key=lambda item: item.start_ns)
+    depth = {root.span_id: 0}
+    lines = [f"{trace.trace_id}  {root.name}  {root.duration_ms:.1f}ms  status={root.attributes.get('http.status_code')}"]
+    for item in [root] + spans:
+        level = depth.get(item.span_id)
+        if level is None:
+            level = depth[item.span_id] = depth.get(item.parent_id, 0) + 1
+        offset = (item.start_ns - root.start_ns) / total_ns
+        length = ((item.end_ns or item.start_ns) - item.start_ns) / total_ns
+        start_col = min(width - 1, int(offset * width))
+        bar = " " * start_col + "█" * max(1, min(width - start_col, round(length * width)))
+        label = ("  " * level + item.name)[:40]
+        error = f"  ! {item.error}" if item.error else ""
+        lines.append(f"  {label:<40} {(item.start_ns - root.start_ns) / 1e6:>9.1f}ms {item.duration_ms:>9.1f}ms |{bar:<{width}}|{error}")
+    return "\n".join(lines)
+
+
+class TraceFileExporter:
+    """后台线程把完成的追踪以 OTLP/JSON 行写入本地文件；队列满时丢弃，不阻塞请求"""
+
+    def __init__(self, path: str, max_queue: int = 1000):
+        self.path = Path(path)
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                trace = self._queue.get()
+                if trace is None:
+                    break
+                f.write(json.dumps(to_otlp(trace), ensure_ascii=False, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+
+class Tracer:
+    """请求追踪：采样的请求在环形缓冲中保留最近的 buffer_size 条，可选导出到文件"""
+
+    def __init__(self, buffer_size: int, sample_rate: float, export_file: str = ""):
+        self.sample_rate = sample_rate
+        self.traces: deque = deque(maxlen=max(1, buffer_size))
+        self.exporter = TraceFileExporter(export_file) if export_file else None
+
+    def start(self):
+        if self.exporter:
+            self.exporter.start()
+
+    def stop(self):
+        if self.exporter:
+            self.exporter.stop()
+
+    def begin(self, name: str, **attributes) -> Optional[Trace]:
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+        return Trace(name, attributes)
+
+    def finish(self, trace: Trace):
+        trace.root.end_ns = time.time_ns()
+        self.traces.append(trace)
+        if self.exporter:
+            self.exporter.export(trace)
+
+    def recent(self, limit: int = 20, min_ms: float = 0, name: Optional[str] = None) -> List[Trace]:
+        """最近的追踪（新的在前），可按最小耗时和名称（包含匹配）筛选"""
+        result = []
+        for trace in reversed(list(self.traces)):
+            if trace.root.duration_ms < min_ms or (name and name not in trace.root.name):
+                continue
+            result.append(trace)
+            if len(result) >= limit:
+                break
+        return result
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        return next((trace for trace in list(self.traces) if trace.trace_id == trace_id), None)
+
+
+tracer = Tracer(
+    buffer_size=settings.trace_buffer_size,
+    sample_rate=settings.trace_sample_rate,
+    export_file=settings.trace_export_file
+)
+
+
+class TracingMiddleware:
+    """为每个（被采样的）HTTP请求创建根span，请求结束（响应体发送完毕）时记录整条追踪"""
+
+    def __init__(self, app, exclude_prefixes=("/debug/traces", "/metrics")):
+        self.app = app
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.routes = RouteTemplates()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+            return
+        trace = tracer.begin(scope["method"], **{"http.method": scope["method"], "http.target": scope["path"]})
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.root.attributes["http.status_code"] = message["status"]
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            trace.root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_trace.reset(token)
+            route = self.routes.lookup(scope)
+            trace.root.name = f"{scope['method']} {route}"
+            trace.root.attributes["http.route"] = route
+            tracer.finish(trace)
@@ -0,0 +1,289 @@
+"""离线基准使用的 genai.Client 替身
+
+只实现应用用到的接口：client.aio.models.generate_content / generate_content_stream，
+返回结构与SDK一致（response.text、response.candidates[].content.parts[].inline_data）。
+
+- 延迟：每种调用（plan / image / tts）可配置分布，如 "lognormal:median=8,sigma=0.4"；
+- 失败：按比例抛出异常，其中一部分是应用会重试的连接错误（消息含 SSL/EOF），其余为不可重试错误；
+- 负载：图片为真实PNG（随机像素，边长可配置，不可压缩，大小接近真实生成结果），
+  语音为真实WAV（16位单声道PCM，时长按文本长度估算），规划返回指定步骤数的JSON。
+
+结果是确定的：每次调用的随机数由 (seed, 模型, 提示词, 该提示词的第几次调用) 决定，
+与并发调度顺序无关，同一配置在不同提交之间得到相同的延迟序列、失败和负载。
+
+用法：
+    from fake_genai import FakeConfig, FakeGenAIClient
+    ai_service.client = FakeGenAIClient(FakeConfig(seed=1, latency={"image": "fixed:0.5"}))
+"""
+import asyncio
+import base64
+import io
+import json
+import math
+import random
+import struct
+import threading
+import wave
+import zlib
+from collections import Counter
+from typing import Dict, Optional
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+OPERATIONS = ("plan", "image", "tts")
+
+
+class FakeAPIError(Exception):
+    """模拟的API错误"""
+
+
+class LatencyDistribution:
+    """延迟分布（秒），由字符串描述：
+
+    fixed:0.05                         固定值
+    uniform:0.5,2                      均匀分布 [0.5, 2]
+    normal:mean=1,std=0.2              正态分布（截断到 >= 0）
+    lognormal:median=8,sigma=0.4       对数正态（长尾，接近模型调用的真实分布）
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip()
+        values = [item.split("=")[-1] for item in params.split(",") if item.strip()]
+        try:
+            self.params = [float(value) for value in values]
+        except ValueError:
+            raise ValueError(f"无法解析延迟分布: {spec}")
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if expected.get(self.kind) != len(self.params):
+            raise ValueError(f"无法解析延迟分布: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(*self.params))
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma)
+
+    def __repr__(self):
+        return self.spec
+
+
+class FakeConfig:
+    def __init__(
+        self,
+        seed: int = 0,
+        latency: Optional[Dict[str, str]] = None,
+        failure_rate: Optional[Dict[str, float]] = None,
+        latency_scale: float = 1.0,
+        retryable_fraction: float = 0.5,
+        image_px: int = 512,
+        image_base64: bool = False,
+        audio_sample_rate: int = 24000,
+        audio_seconds_per_char: float = 0.25,
+        plan_steps: int = 5,
+        stream_chunks: int = 20,
+        image_models=(),
+    ):
+        self.seed = seed
+        latency = {"plan": "lognormal:median=2,sigma=0.3", "image": "lognormal:median=8,sigma=0.4",
+                   "tts": "lognormal:median=1.5,sigma=0.3", **(latency or {})}
+        self.latency = {op: LatencyDistribution(spec) for op, spec in latency.items()}
+        # 所有延迟乘以该系数，用于缩短运行时间（分布形状不变）
+        self.latency_scale = latency_scale
+        self.failure_rate = {op: 0.0 for op in OPERATIONS}
+        self.failure_rate.update(failure_rate or {})
+        self.retryable_fraction = retryable_fraction
+        self.image_px = image_px
+        # 以base64文本（bytes）返回图片数据，覆盖应用中的base64检测和解码分支
+        self.image_base64 = image_base64
+        self.audio_sample_rate = audio_sample_rate
+        self.audio_seconds_per_char = audio_seconds_per_char
+        self.plan_steps = plan_steps
+        self.stream_chunks = max(1, stream_chunks)
+        self.image_models = set(image_models)
+
+    def describe(self) -> dict:
+        return {
+            "seed": self.seed,
+            "latency": {op: str(dist) for op, dist in self.latency.items()},
+            "latency_scale": self.latency_scale,
+            "failure_rate": self.failure_rate,
+            "retryable_fraction": self.retryable_fraction,
+            "image_px": self.image_px,
+            "image_base64": self.image_base64,
+            "audio_sample_rate": self.audio_sample_rate,
+            "audio_seconds_per_char": self.audio_seconds_per_char,
+            "plan_steps": self.plan_steps,
+        }
+
+
+def make_png(rng: random.Random, size: int) -> bytes:
+    """size×size 的RGB随机像素PNG（每个结果内容不同，内容寻址存储不会去重）"""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    row_bytes = size * 3
+    noise = rng.randbytes(row_bytes * size)
+    raw = b"".join(b"\x00" + noise[y * row_bytes:(y + 1) * row_bytes] for y in range(size))
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return PNG_SIGNATURE + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+def make_wav(rng: random.Random, seconds: float, sample_rate: int) -> bytes:
+    """单声道16位PCM WAV：正弦音加少量噪声"""
+    frames = max(1, int(seconds * sample_rate))
+    frequency = rng.uniform(180, 320)
+    step = 2 * math.pi * frequency / sample_rate
+    samples = [int(8000 * math.sin(i * step)) + rng.randint(-200, 200) for i in range(frames)]
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(struct.pack(f"<{frames}h", *samples))
+    return buffer.getvalue()
+
+
+def make_plan_text(rng: random.Random, steps: int) -> str:
+    actions = ["看一看", "走过去", "举起手", "说你好", "排好队", "洗洗手", "坐下来", "拿起杯子"]
+    data = {
+        "total_images": steps,
+        "steps": [
+            {
+                "step_order": i + 1,
+                "instruction": rng.choice(actions),
+                "image_prompt": f"children's book illustration, step {i + 1}, scene {rng.randrange(10 ** 6)}",
+            }
+            for i in range(steps)
+        ],
+    }
+    return f"```json\n{json.dumps(data, ensure_ascii=False)}\n```"
+
+
+# ---- 与SDK响应结构一致的最小对象 ----
+
+class _InlineData:
+    def __init__(self, data, mime_type: str):
+        self.data = data
+        self.mime_type = mime_type
+
+
+class _Part:
+    def __init__(self, inline_data: Optional[_InlineData] = None, text: Optional[str] = None):
+        self.inline_data = inline_data
+        self.text = text
+
+
+class _Content:
+    def __init__(self, parts):
+        self.parts = parts
+
+
+class _Candidate:
+    def __init__(self, parts):
+        self.content = _Content(parts)
+
+
+class FakeResponse:
+    def __init__(self, text: Optional[str] = None, inline_data: Optional[_InlineData] = None):
+        self.text = text
+        part = _Part(inline_data=inline_data, text=text)
+        self.candidates = [_Candidate([part])]
+
+
+class FakeModels:
+    """client.aio.models 的替身"""
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.calls: Counter = Counter()
+        self.failures: Counter = Counter()
+        self._attempts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _operation(self, model: str, contents) -> str:
+        # TTS 与规划默认使用同一个模型，按应用构造的TTS提示词区分
+        if model in self.config.image_models or "image" in model:
+            return "image"
+        if isinstance(contents, str) and contents.startswith("Please say"):
+            return "tts"
+        return "plan"
+
+    def _rng(self, model: str, contents) -> random.Random:
+        key = f"{model}\n{contents}"
+        with self._lock:
+            attempt = self._attempts[key]
+            self._attempts[key] += 1
+        return random.Random(f"{self.config.seed}\n{key}\n{attempt}")
+
+    def _maybe_fail(self, operation: str, rng: random.Random):
+        if rng.random() < self.config.failure_rate.get(operation, 0.0):
+            self.failures[operation] += 1
+            if rng.random() < self.config.retryable_fraction:
+                raise FakeAPIError("[SSL: UNEXPECTED_EOF_WHILE_READING] EOF occurred in violation of protocol")
+            raise FakeAPIError("429 RESOURCE_EXHAUSTED (simulated)")
+
+    async def generate_content(self, model: str, contents, config=None) -> FakeResponse:
+        operation = self._operation(model, contents)
+        self.calls[operation] += 1
+        rng = self._rng(model, contents)
+        await asyncio.sleep(self.config.latency[operation].sample(rng) * self.config.latency_scale)
+        self._maybe_fail(operation, rng)
+
+        if operation == "image":
+            # 生成兆字节级的像素数据需要CPU，放到线程中，不计入事件循环
+            data = await asyncio.to_thread(make_png, rng, self.config.image_px)
+            if self.config.image_base64:
+                data = base64.b64encode(data)
+            return FakeResponse(inline_data=_InlineData(data, "image/png"))
+        if operation == "tts":
+            text = contents.split(": ", 1)[-1]
+            seconds = max(0.5, len(text) * self.config.audio_seconds_per_char)
+            data = await asyncio.to_thread(make_wav, rng, seconds, self.config.audio_sample_rate)
+            return FakeResponse(inline_data=_InlineData(data, "audio/wav"))
+        return FakeResponse(text=make_plan_text(rng, self.config.plan_steps))
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        """流式规划：首个分片前等待约一半延迟，其余延迟均匀分布在各分片之间"""
+        operation = self._operation(model, contents)
+        self.calls[operation] += 1
+        rng = self._rng(model, contents)
+        total = self.config.latency[operation].sample(rng) * self.config.latency_scale
+        text = make_plan_text(rng, self.config.plan_steps)
+        chunks = self.config.stream_chunks
+        size = max(1, math.ceil(len(text) / chunks))
+        fail = rng.random() < self.config.failure_rate.get(operation, 0.0)
+
+        async def iterate():
+            await asyncio.sleep(total / 2)
+            for index in range(0, len(text), size):
+                if fail and index >= len(text) // 2:
+                    self.failures[operation] += 1
+                    raise FakeAPIError("stream interrupted (simulated)")
+                await asyncio.sleep(total / 2 / chunks)
+                yield FakeResponse(text=text[index:index + size])
+
+        return iterate()
+
+    def stats(self) -> dict:
+        return {"calls": dict(self.calls), "failures": dict(self.failures)}
+
+
+class _Aio:
+    def __init__(self, models: FakeModels):
+        self.models = models
+
+
+class FakeGenAIClient:
+    """genai.Client 替身：只提供应用使用的异步接口 client.aio.models"""
+
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.config = config or FakeConfig()
+        self.aio = _Aio(FakeModels(self.config))
+
+    def stats(self) -> dict:
+        return self.aio.models.stats()
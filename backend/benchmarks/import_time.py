@@ -0,0 +1,119 @@
+"""启动导入耗时检查：用 python -X importtime 统计 import app.main 的耗时
+
+报告累计耗时最高的模块，并检查：
+- 总导入耗时不超过预算（--budget-ms，取多次运行的最小值，减少抖动）；
+- 不应在导入时加载的重量级模块（默认 google.genai，首次AI请求时才加载）没有被导入；
+- 导入过程没有创建数据库文件（建表、迁移和初始数据在 lifespan 中执行）。
+任一检查不通过时以非0状态退出，可直接用于CI。
+
+用法（在 backend 目录下）：
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 800 --runs 5 --top 30
+    python benchmarks/import_time.py --output import_time.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# 导入 app.main 时不应加载的模块（前缀匹配）
+DEFAULT_FORBIDDEN = ("google.genai",)
+
+
+def _parse_importtime(stderr: str):
+    """解析 -X importtime 输出，返回 [(模块, 自身耗时us, 累计耗时us)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def _run_once(module: str, workdir: str):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(BACKEND_DIR)
+    # 使用临时数据库路径，检查导入过程是否访问数据库
+    env["DATABASE_URL"] = f"sqlite:///{Path(workdir) / 'import_check.db'}"
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    return _parse_importtime(completed.stderr)
+
+
+def measure(module: str, runs: int):
+    """多次导入取总耗时最小的一次，返回 (导入记录, 是否创建了数据库文件)"""
+    best = None
+    created_db = False
+    for _ in range(max(1, runs)):
+        with tempfile.TemporaryDirectory(prefix="import-time-") as workdir:
+            rows = _run_once(module, workdir)
+            created_db = created_db or (Path(workdir) / "import_check.db").exists()
+        total = next((cumulative for name, _, cumulative in rows if name == module), 0)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    return best[1], created_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查 import app.main 的耗时预算")
+    parser.add_argument("--module", default="app.main", help="要导入的模块")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="总导入耗时预算（毫秒）")
+    parser.add_argument("--runs", type=int, default=3, help="运行次数，取最小值")
+    parser.add_argument("--top", type=int, default=20, help="报告累计耗时最高的模块数")
+    parser.add_argument("--forbid", default=",".join(DEFAULT_FORBIDDEN),
+                        help="逗号分隔的模块前缀，导入时不应被加载")
+    parser.add_argument("--output", help="结果写入JSON文件")
+    args = parser.parse_args()
+
+    rows, created_db = measure(args.module, args.runs)
+    total_us = next((cumulative for name, _, cumulative in rows if name == args.module), 0)
+    forbidden = [prefix.strip() for prefix in args.forbid.split(",") if prefix.strip()]
+    loaded_forbidden = sorted({
+        name for name, _, _ in rows
+        if any(name == prefix or name.startswith(prefix + ".") for prefix in forbidden)
+    })
+    top = sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]
+
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for name, self_us, cumulative_us in top:
+        print(f"{cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {name}")
+    print()
+    print(f"import {args.module}: {total_us / 1000:.1f}ms（预算 {args.budget_ms:.0f}ms，{len(rows)} 个模块）")
+
+    failures = []
+    if total_us / 1000 > args.budget_ms:
+        failures.append(f"导入耗时 {total_us / 1000:.1f}ms 超过预算 {args.budget_ms:.0f}ms")
+    if loaded_forbidden:
+        failures.append(f"导入时加载了不应加载的模块: {', '.join(loaded_forbidden[:10])}")
+    if created_db:
+        failures.append("导入时创建了数据库文件（数据库初始化应在 lifespan 中执行）")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({
+            "module": args.module,
+            "total_ms": round(total_us / 1000, 1),
+            "budget_ms": args.budget_ms,
+            "modules": len(rows),
+            "forbidden_loaded": loaded_forbidden,
+            "created_db": created_db,
+            "top": [{"module": name, "self_ms": round(self_us / 1000, 2), "cumulative_ms": round(cumulative_us / 1000, 2)}
+                    for name, self_us, cumulative_us in top],
+            "failures": failures,
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"结果已写入 {args.output}")
+
+    for failure in failures:
+        print(f"失败: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
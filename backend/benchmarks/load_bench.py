@@ -0,0 +1,411 @@
+"""离线负载基准：用确定性的 genai.Client 替身（fake_genai.py）驱动整个应用，不消耗 Gemini 配额
+
+在本进程的后台线程中启动 uvicorn（使用临时目录中的数据库和上传目录），把替身注入
+ai_service.client，然后以指定并发的闭环客户端依次压测各个工作负载：
+
+    plan       POST /api/ai/plan-scenario
+    image      POST /api/ai/generate-image（部分请求带 step_id，覆盖写回数据库的路径）
+    tts        POST /api/ai/generate-tts
+    scenarios  GET /api/scenarios/、/api/scenarios/summary、/api/scenarios/{id}
+    training   POST /api/training/start → step × N → finish
+    mixed      以上负载按权重混合同时进行
+
+报告每个工作负载及其各接口的 p50/p95/p99、吞吐量、错误数和降级数（图片返回占位图、
+语音返回不可用），结果写入JSON；--compare 与之前提交的结果对比，超过 --max-regression
+时以非0状态退出。
+
+请求的提示词由 (seed, 负载, 序号) 决定，--repeat-ratio 控制重复提示词（命中缓存）的比例。
+负载生成器与服务在同一进程中，会共享GIL，结果用于提交之间的相对比较。
+
+用法（在 backend 目录下）：
+    python benchmarks/load_bench.py --latency-scale 0.05 --requests 100
+    python benchmarks/load_bench.py --workloads image,tts --concurrency 32 --failure-rate image=0.05
+    python benchmarks/load_bench.py --latency image=uniform:5,20 --output results/HEAD.json
+    python benchmarks/load_bench.py --compare results/main.json --max-regression 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+WORKLOADS = ("plan", "image", "tts", "scenarios", "training", "mixed")
+MIXED_WEIGHTS = {"scenarios": 5, "training": 3, "tts": 2, "image": 1, "plan": 1}
+TOPICS = ["过马路", "洗手", "刷牙", "排队", "打招呼", "吃饭", "穿鞋", "看医生", "坐公交", "收玩具"]
+PHRASES = ["请看这里", "我们一起走", "举起你的手", "做得很好", "慢慢来", "轮到你了", "说谢谢", "再试一次"]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _parse_pairs(items, cast):
+    """["image=0.05", "tts=0.1"] → {"image": 0.05, "tts": 0.1}"""
+    result = {}
+    for item in items or ():
+        key, _, value = item.partition("=")
+        if not value:
+            raise SystemExit(f"参数格式应为 操作=值: {item}")
+        result[key.strip()] = cast(value.strip())
+    return result
+
+
+class Workloads:
+    """各工作负载的一次操作，返回 [(接口, 耗时秒, 是否成功, 是否降级)]"""
+
+    def __init__(self, seed: int, repeat_ratio: float, hot_set: int, training_steps: int, steps):
+        self.seed = seed
+        self.repeat_ratio = repeat_ratio
+        self.hot_set = max(1, hot_set)
+        self.training_steps = training_steps
+        # 预设场景的 (scenario_id, step_id)，图片请求按比例写回这些步骤
+        self.steps = steps
+        self.scenario_ids = sorted({scenario_id for scenario_id, _ in steps}) or [1]
+
+    def _rng(self, name: str, index: int) -> random.Random:
+        return random.Random(f"{self.seed}\n{name}\n{index}")
+
+    def _variant(self, rng: random.Random, index: int) -> str:
+        """重复的提示词从热点集合中选取（命中缓存），其余每个请求唯一"""
+        if rng.random() < self.repeat_ratio:
+            return f"hot{rng.randrange(self.hot_set)}"
+        return f"u{index}"
+
+    @staticmethod
+    async def _call(client: httpx.AsyncClient, records, name, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            response, ok = None, False
+        duration = time.perf_counter() - started
+        body = response.json() if ok and response.headers.get("content-type", "").startswith("application/json") \
+            else None
+        records.append([name, duration, ok, False])
+        return body
+
+    async def plan(self, client, index):
+        rng = self._rng("plan", index)
+        records = []
+        topic = f"{rng.choice(TOPICS)} {self._variant(rng, index)}"
+        await self._call(client, records, "plan", "POST", "/api/ai/plan-scenario",
+                         json={"topic": topic, "preferences": {}})
+        return records
+
+    async def image(self, client, index):
+        rng = self._rng("image", index)
+        records = []
+        payload = {"prompt": f"children's book illustration, {rng.choice(TOPICS)}, {self._variant(rng, index)}"}
+        if self.steps and rng.random() < 0.5:
+            payload["scenario_id"], payload["step_id"] = rng.choice(self.steps)
+        body = await self._call(client, records, "image", "POST", "/api/ai/generate-image", json=payload)
+        if body is not None and not body["data"]["image_url"].startswith("/files/"):
+            records[-1][3] = True
+        return records
+
+    async def tts(self, client, index):
+        rng = self._rng("tts", index)
+        records = []
+        text = f"{rng.choice(PHRASES)} {self._variant(rng, index)}"
+        body = await self._call(client, records, "tts", "POST", "/api/ai/generate-tts", json={"text": text})
+        if body is not None and not body.get("success"):
+            records[-1][3] = True
+        return records
+
+    async def scenarios(self, client, index):
+        rng = self._rng("scenarios", index)
+        records = []
+        choice = rng.random()
+        if choice < 0.4:
+            await self._call(client, records, "scenarios.list", "GET", "/api/scenarios/")
+        elif choice < 0.7:
+            await self._call(client, records, "scenarios.summary", "GET", "/api/scenarios/summary")
+        else:
+            await self._call(client, records, "scenarios.detail", "GET",
+                             f"/api/scenarios/{rng.choice(self.scenario_ids)}")
+        return records
+
+    async def training(self, client, index):
+        rng = self._rng("training", index)
+        records = []
+        scenario_id = rng.choice(self.scenario_ids)
+        body = await self._call(client, records, "training.start", "POST", "/api/training/start",
+                                params={"scenario_id": scenario_id, "user_id": rng.randrange(1, 20)})
+        if body is None:
+            return records
+        training_id = body["training_id"]
+        levels = [rng.choice("FPI") for _ in range(self.training_steps)]
+        for step, level in enumerate(levels):
+            await self._call(client, records, "training.step", "POST", f"/api/training/{training_id}/step",
+                             params={"step_id": step + 1, "level": level})
+        await self._call(client, records, "training.finish", "POST", f"/api/training/{training_id}/finish", json={
+            "total_steps": self.training_steps,
+            "completed_steps": self.training_steps,
+            "step_levels": levels,
+            "overall_level": rng.choice("FPI"),
+            "milestone": "Level1",
+        })
+        return records
+
+    async def mixed(self, client, index):
+        rng = self._rng("mixed", index)
+        name = rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+        # 使用独立的序号区间，不与单独运行的负载重复提示词（避免全部命中缓存）
+        return await getattr(self, name)(client, 5 * 10 ** 8 + index)
+
+
+def _summarize(records, elapsed: float) -> dict:
+    latencies = [duration for _, duration, ok, _ in records if ok]
+    return {
+        "requests": len(records),
+        "errors": sum(1 for _, _, ok, _ in records if not ok),
+        "fallbacks": sum(1 for _, _, _, fallback in records if fallback),
+        "throughput_rps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def run_workload(client, workloads: Workloads, name: str, requests: int, concurrency: int,
+                       warmup: int, fake) -> dict:
+    """闭环压测：concurrency 个并发客户端各自连续发送请求，直到完成 requests 次操作"""
+    operation = getattr(workloads, name)
+    # 预热请求使用单独的序号区间，不计入结果
+    await asyncio.gather(*[operation(client, 10 ** 9 + i) for i in range(warmup)])
+
+    counter = itertools.count()
+    records = []
+    calls_before = fake.stats()
+
+    async def worker():
+        while (index := next(counter)) < requests:
+            records.extend(await operation(client, index))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    calls_after = fake.stats()
+    result = _summarize(records, elapsed)
+    result.update({
+        "operations": requests,
+        "elapsed_s": round(elapsed, 3),
+        "endpoints": {
+            endpoint: _summarize([record for record in records if record[0] == endpoint], elapsed)
+            for endpoint in sorted({record[0] for record in records})
+        },
+        # 本负载期间替身收到的模型调用和注入的失败（含重试）
+        "model_calls": {
+            key: {op: count - calls_before[key].get(op, 0) for op, count in calls_after[key].items()
+                  if count - calls_before[key].get(op, 0)}
+            for key in ("calls", "failures")
+        },
+    })
+    return result
+
+
+async def drive(base_url: str, args, fake) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        scenarios = (await client.get("/api/scenarios/")).json()
+        steps = [(scenario["id"], step["id"]) for scenario in scenarios for step in scenario.get("steps", [])]
+        workloads = Workloads(args.seed, args.repeat_ratio, args.hot_set, args.training_steps, steps)
+
+        results = {}
+        for name in args.workloads:
+            print(f"运行 {name} ...", flush=True)
+            results[name] = await run_workload(client, workloads, name, args.requests, args.concurrency,
+                                               args.warmup, fake)
+        cache_stats = (await client.get("/api/ai/cache-stats")).json().get("data")
+    return {"workloads": results, "cache_stats": cache_stats}
+
+
+class _ServerThread:
+    """在后台线程中运行 uvicorn（独立事件循环），负载生成器在主线程的事件循环中运行"""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, name="bench-server", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 60
+        while not self.server.started:
+            if not self.thread.is_alive() or time.time() > deadline:
+                raise RuntimeError("服务启动失败")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+def _prepare_environment(workdir: Path):
+    """必须在导入 app 之前调用：数据库、上传目录和日志都放在临时目录中"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir / 'bench.db'}",
+        "LOG_FILE": str(workdir / "logs" / "app.jsonl"),
+        "LOG_CONSOLE": "False",
+        "FILE_INDEX_INTERVAL_SECONDS": "3600",
+    })
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    # FileManager 的上传目录是相对当前目录的 uploads
+    os.chdir(workdir)
+    sys.path.insert(0, str(BACKEND_DIR))
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+def compare(current: dict, baseline: dict, max_regression) -> list:
+    """打印与基线结果的对比，返回超过阈值的退化"""
+    regressions = []
+    print(f"\n对比基线 {baseline['meta'].get('commit')}（{baseline['meta'].get('timestamp')}）")
+    print(f"{'workload':<10} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in current["workloads"].items():
+        base = baseline["workloads"].get(name)
+        if base is None:
+            continue
+        for metric, higher_is_worse in (("p50_ms", True), ("p95_ms", True), ("p99_ms", True),
+                                        ("throughput_rps", False)):
+            old, new = base[metric], result[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"{name:<10} {metric:<15} {old:>10} {new:>10} {change:>+7.1f}%")
+            worse = change if higher_is_worse else -change
+            if max_regression is not None and metric != "p50_ms" and worse > max_regression:
+                regressions.append(f"{name} {metric} {old} → {new}（{change:+.1f}%）")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用确定性的Gemini替身对应用做离线负载基准")
+    parser.add_argument("--workloads", default="plan,image,tts,scenarios,training",
+                        help=f"逗号分隔，可选 {','.join(WORKLOADS)}")
+    parser.add_argument("--requests", type=int, default=200, help="每个工作负载的操作次数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发客户端数")
+    parser.add_argument("--warmup", type=int, default=5, help="每个工作负载的预热操作数（不计入结果）")
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求超时（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="替身和请求序列的随机种子")
+    parser.add_argument("--repeat-ratio", type=float, default=0.2, help="使用热点提示词（可命中缓存）的请求比例")
+    parser.add_argument("--hot-set", type=int, default=10, help="热点提示词数量")
+    parser.add_argument("--training-steps", type=int, default=5, help="每次训练的步骤数")
+    parser.add_argument("--latency", action="append", metavar="OP=SPEC",
+                        help="模型延迟分布，如 image=lognormal:median=8,sigma=0.4、tts=fixed:0.5（可重复）")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="所有模型延迟乘以该系数")
+    parser.add_argument("--failure-rate", action="append", metavar="OP=RATE",
+                        help="模型调用失败率，如 image=0.05（可重复）")
+    parser.add_argument("--retryable-fraction", type=float, default=0.5, help="失败中可重试的连接错误比例")
+    parser.add_argument("--image-px", type=int, default=512, help="生成图片的边长（像素）")
+    parser.add_argument("--image-base64", action="store_true", help="以base64文本返回图片数据")
+    parser.add_argument("--plan-steps", type=int, default=5, help="规划返回的步骤数")
+    parser.add_argument("--workdir", help="数据库和上传文件目录（默认使用临时目录）")
+    parser.add_argument("--output", help="结果写入JSON文件")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    parser.add_argument("--max-regression", type=float,
+                        help="与 --compare 对比时允许的最大退化百分比（p95/p99 升高或吞吐下降），超过时以非0状态退出")
+    args = parser.parse_args()
+    args.workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"未知的工作负载: {', '.join(sorted(unknown))}")
+
+    output = Path(args.output).resolve() if args.output else None
+    baseline_path = Path(args.compare).resolve() if args.compare else None
+    workdir = Path(args.workdir).resolve() if args.workdir else Path(tempfile.mkdtemp(prefix="load-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    _prepare_environment(workdir)
+
+    from fake_genai import FakeConfig, FakeGenAIClient
+    from app.ai_service import ai_service
+    from app.config import settings
+    from app.main import app
+
+    fake_config = FakeConfig(
+        seed=args.seed,
+        latency=_parse_pairs(args.latency, str),
+        failure_rate=_parse_pairs(args.failure_rate, float),
+        latency_scale=args.latency_scale,
+        retryable_fraction=args.retryable_fraction,
+        image_px=args.image_px,
+        image_base64=args.image_base64,
+        plan_steps=args.plan_steps,
+        image_models={settings.gemini_image_model},
+    )
+    fake = FakeGenAIClient(fake_config)
+    ai_service.client = fake
+
+    port = _free_port()
+    with _ServerThread(app, port):
+        result = asyncio.run(drive(f"http://127.0.0.1:{port}", args, fake))
+
+    result["meta"] = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workdir": str(workdir),
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "fake": fake_config.describe(),
+    }
+
+    print()
+    print(f"{'endpoint':<20} {'requests':>8} {'errors':>7} {'fallback':>8} {'rps':>8} "
+          f"{'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, workload in result["workloads"].items():
+        for endpoint, stats in [(name, workload)] + [(f"  {key}", value) for key, value in workload["endpoints"].items()
+                                                     if len(workload["endpoints"]) > 1]:
+            print(f"{endpoint:<20} {stats['requests']:>8} {stats['errors']:>7} {stats['fallbacks']:>8} "
+                  f"{stats['throughput_rps']:>8} {stats['p50_ms']:>7}ms {stats['p95_ms']:>7}ms {stats['p99_ms']:>7}ms")
+
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已写入 {output}")
+
+    regressions = []
+    if baseline_path:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        regressions = compare(result, baseline, args.max_regression)
+    for regression in regressions:
+        print(f"退化: {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
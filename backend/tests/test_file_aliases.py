@@ -0,0 +1,59 @@
+"""旧文件迁移：中途失败时旧URL仍可访问，重新执行能完成迁移"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import file_aliases as aliases_module, models
+from app.database import Base
+from app.file_aliases import migrate_legacy_files
+from app.utils.file_manager import FileManager
+
+DATA = b"\x89PNG legacy image"
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    manager = FileManager(str(tmp_path / "uploads"))
+    monkeypatch.setattr(aliases_module, "file_manager", manager)
+    return manager
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(aliases_module, "SessionLocal", factory)
+    monkeypatch.setattr(aliases_module, "file_aliases", aliases_module.FileAliasResolver())
+    yield factory
+    engine.dispose()
+
+
+def test_failed_move_keeps_legacy_file_and_rerun_completes(manager, session_factory, monkeypatch):
+    legacy = manager.images_dir / "old-uuid.png"
+    legacy.write_bytes(DATA)
+    target = manager.content_path(manager.images_dir, DATA, ".png")
+    target_url = f"/files/{target.relative_to(manager.upload_dir).as_posix()}"
+    with session_factory() as db:
+        scenario = models.Scenario(name="洗手")
+        scenario.steps = [models.TrainingStep(step_order=1, instruction="搓手", image_url="/files/images/old-uuid.png")]
+        db.add(scenario)
+        db.commit()
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(aliases_module.os, "replace", fail)
+        with pytest.raises(OSError):
+            migrate_legacy_files()
+    # 别名已提交，旧文件仍在原位，旧URL可以直接访问
+    assert legacy.exists()
+    with session_factory() as db:
+        assert db.get(models.FileAlias, "images/old-uuid.png").target_path == target_url[len("/files/"):]
+
+    assert migrate_legacy_files() == 1
+    assert not legacy.exists()
+    assert target.read_bytes() == DATA
+    with session_factory() as db:
+        assert db.query(models.TrainingStep.image_url).scalar() == target_url
@@ -0,0 +1,103 @@
+"""FileIndex 淘汰：被训练步骤引用的文件（相对或带域名的绝对URL）不会被删除"""
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.database import Base
+from app.file_index import FileIndex, url_to_key
+from app.utils.file_manager import file_manager
+
+FILE_SIZE = 1000
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    root = tmp_path / "uploads"
+    (root / "images").mkdir(parents=True)
+    monkeypatch.setattr(file_manager, "upload_dir", root)
+    return root
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _write(uploads, name: str, mtime: int) -> str:
+    path = uploads / "images" / name
+    path.write_bytes(b"\0" * FILE_SIZE)
+    os.utime(path, (mtime, mtime))
+    return f"images/{name}"
+
+
+def test_url_to_key():
+    assert url_to_key("/files/images/a.png") == "images/a.png"
+    assert url_to_key("http://localhost:8000/files/images/a.png") == "images/a.png"
+    assert url_to_key("https://example.com/files/audio/b.wav?v=1") == "audio/b.wav"
+    assert url_to_key("https://example.com/other/a.png") is None
+    assert url_to_key("/placeholder.png") is None
+    assert url_to_key(None) is None
+
+
+def test_evict_keeps_files_referenced_by_absolute_urls(uploads, db):
+    # 被引用的两个文件最久未访问，按LRU本应最先被淘汰
+    absolute = _write(uploads, "absolute.png", 1_000_000)
+    relative = _write(uploads, "relative_ref.png", 1_000_100)
+    unreferenced = _write(uploads, "unreferenced.png", 1_000_200)
+
+    scenario = models.Scenario(name="洗手")
+    scenario.steps = [
+        models.TrainingStep(step_order=1, instruction="打开水龙头",
+                            image_url=f"http://localhost:8000/files/{absolute}"),
+        models.TrainingStep(step_order=2, instruction="搓手", image_url=f"/files/{relative}"),
+    ]
+    db.add(scenario)
+    db.commit()
+
+    index = FileIndex(max_bytes=2 * FILE_SIZE, interval_seconds=60)
+    index.bootstrap(db)
+    refs = {row.path: row.ref_count for row in db.query(models.StoredFile)}
+    assert refs == {absolute: 1, relative: 1, unreferenced: 0}
+
+    assert index.evict(db) == 1
+    assert (uploads / absolute).exists()
+    assert (uploads / relative).exists()
+    assert not (uploads / unreferenced).exists()
+
+
+def test_evict_rechecks_absolute_references_before_deleting(uploads, db):
+    """索引中的引用数尚未同步时，删除前的核对也要识别绝对URL"""
+    referenced = _write(uploads, "referenced.png", 1_000_000)
+    unreferenced = _write(uploads, "unreferenced.png", 1_000_100)
+
+    index = FileIndex(max_bytes=FILE_SIZE, interval_seconds=60)
+    index.bootstrap(db)
+
+    scenario = models.Scenario(name="排队")
+    scenario.steps = [models.TrainingStep(step_order=1, instruction="站好",
+                                          image_url=f"https://example.com/files/{referenced}")]
+    db.add(scenario)
+    db.commit()
+
+    assert index.evict(db) == 1
+    assert (uploads / referenced).exists()
+    assert not (uploads / unreferenced).exists()
+
+
+def test_note_references_accepts_absolute_urls(uploads):
+    index = FileIndex(max_bytes=0, interval_seconds=60)
+    index.note_references([
+        "http://localhost:8000/files/images/a.png",
+        "/files/audio/b.wav",
+        "https://example.com/static/c.png",
+        None,
+    ])
+    assert index._dirty_refs == {"images/a.png", "audio/b.wav"}
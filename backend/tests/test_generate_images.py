@@ -0,0 +1,123 @@
+"""批量生成图片的流式响应：客户端中途断开时，已完成的图片仍写入场景步骤"""
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models
+from app.content_cache import image_cache
+from app.database import Base, get_db
+from app.routes import ai
+
+# 每个步骤的生成耗时（秒）；最后一张在客户端断开前不会完成
+DELAYS = {"step 1": 0.01, "step 2": 0.05, "step 3": 30}
+
+
+@pytest.fixture
+async def session_factory(tmp_path, monkeypatch):
+    url = tmp_path / "test.db"
+    sync_engine = create_engine(f"sqlite:///{url}")
+    Base.metadata.create_all(bind=sync_engine)
+    sync_engine.dispose()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{url}")
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(ai, "AsyncSessionLocal", factory)
+    yield factory
+    await engine.dispose()
+
+
+@pytest.fixture
+def app(session_factory, monkeypatch):
+    async def fake_get_or_generate(db, prompt, model, generate, bypass_cache=False):
+        await asyncio.sleep(DELAYS[prompt])
+        return f"/files/images/{prompt.replace(' ', '_')}.png"
+
+    monkeypatch.setattr(image_cache, "get_or_generate", fake_get_or_generate)
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    application = FastAPI()
+    application.include_router(ai.router, prefix="/api/ai")
+    application.dependency_overrides[get_db] = override_get_db
+    return application
+
+
+async def _create_scenario(session_factory) -> int:
+    async with session_factory() as db:
+        scenario = models.Scenario(name="洗手")
+        scenario.steps = [
+            models.TrainingStep(step_order=i, instruction=f"第{i}步", image_prompt=prompt)
+            for i, prompt in enumerate(DELAYS, start=1)
+        ]
+        db.add(scenario)
+        await db.commit()
+        return scenario.id
+
+
+async def _stream(app, payload: dict, disconnect_after: int = None):
+    """以ASGI方式调用接口，收到 disconnect_after 行后模拟客户端断开，返回收到的各行"""
+    body = json.dumps(payload).encode()
+    lines = []
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            lines.extend(json.loads(line) for line in message["body"].decode().splitlines())
+            if disconnect_after is not None and len(lines) >= disconnect_after:
+                disconnected.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/api/ai/generate-images", "raw_path": b"/api/ai/generate-images",
+        "query_string": b"", "root_path": "", "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 12345), "server": ("testserver", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=10)
+    return lines
+
+
+async def _image_urls(session_factory, scenario_id: int) -> dict:
+    async with session_factory() as db:
+        rows = await db.execute(
+            select(models.TrainingStep.image_prompt, models.TrainingStep.image_url)
+            .where(models.TrainingStep.scenario_id == scenario_id)
+        )
+        return dict(rows.all())
+
+
+async def test_completed_images_persisted_after_disconnect(app, session_factory):
+    scenario_id = await _create_scenario(session_factory)
+
+    lines = await _stream(app, {"scenario_id": scenario_id}, disconnect_after=2)
+
+    assert [line["step_id"] is not None for line in lines] == [True, True]
+    assert await _image_urls(session_factory, scenario_id) == {
+        "step 1": "/files/images/step_1.png",
+        "step 2": "/files/images/step_2.png",
+        "step 3": None,
+    }
+
+
+async def test_all_images_persisted_without_disconnect(app, session_factory, monkeypatch):
+    monkeypatch.setitem(DELAYS, "step 3", 0.1)
+    scenario_id = await _create_scenario(session_factory)
+
+    lines = await _stream(app, {"scenario_id": scenario_id})
+
+    assert lines[-1] == {"done": True, "total": 3, "persisted": 3}
+    assert all((await _image_urls(session_factory, scenario_id)).values())
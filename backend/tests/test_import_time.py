@@ -0,0 +1,29 @@
+"""启动导入耗时预算：import app.main 不超过预算、不加载 google.genai、不创建数据库文件
+
+复用 benchmarks/import_time.py 的测量（子进程中 python -X importtime，取多次运行的最小值）。
+预算可用环境变量 IMPORT_TIME_BUDGET_MS 调整（较慢的CI机器）。
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from import_time import DEFAULT_FORBIDDEN, measure  # noqa: E402
+
+BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+MODULE = "app.main"
+
+
+def _loaded(rows, prefix):
+    return [name for name, _, _ in rows if name == prefix or name.startswith(prefix + ".")]
+
+
+def test_import_app_main_within_budget():
+    rows, created_db = measure(MODULE, runs=3)
+    total_ms = next(cumulative for name, _, cumulative in rows if name == MODULE) / 1000
+
+    assert total_ms <= BUDGET_MS, f"import {MODULE} 耗时 {total_ms:.1f}ms，超过预算 {BUDGET_MS:.0f}ms"
+    for prefix in DEFAULT_FORBIDDEN:
+        assert not _loaded(rows, prefix), f"导入 {MODULE} 时加载了 {prefix}"
+    assert not created_db, "导入时创建了数据库文件（数据库初始化应在 lifespan 中执行）"
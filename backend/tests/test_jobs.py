@@ -0,0 +1,85 @@
+"""后台任务队列：失败的任务按指数退避重试"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import jobs, models
+from app.database import Base
+from app.jobs import JobQueue
+
+
+@pytest.fixture
+async def session_factory(tmp_path, monkeypatch):
+    url = tmp_path / "test.db"
+    sync_engine = create_engine(f"sqlite:///{url}")
+    Base.metadata.create_all(bind=sync_engine)
+    sync_engine.dispose()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{url}")
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(jobs, "AsyncSessionLocal", factory)
+    yield factory
+    await engine.dispose()
+
+
+def test_retry_delay_grows_and_is_capped():
+    queue = JobQueue(retry_backoff_seconds=5, retry_backoff_max_seconds=30)
+    assert [queue.retry_delay(attempts) for attempts in range(1, 6)] == [5, 10, 20, 30, 30]
+
+
+async def test_failed_job_retries_after_backoff(session_factory):
+    queue = JobQueue(workers=2, max_attempts=3, retry_backoff_seconds=0.1, retry_backoff_max_seconds=1)
+    calls = []
+
+    @queue.handler("flaky")
+    async def flaky(payload):
+        calls.append(time.monotonic())
+        raise RuntimeError("503 UNAVAILABLE")
+
+    await queue.start()
+    try:
+        async with session_factory() as db:
+            job = await queue.submit(db, "flaky", {})
+
+        # 第一次失败后进入退避：状态为 pending 并记录下一次尝试时间，不会立即重试
+        await asyncio.sleep(0.05)
+        pending = await queue._load(job.id)
+        assert (pending.status, pending.attempts, len(calls)) == ("pending", 1, 1)
+        assert pending.next_attempt_at is not None
+
+        finished = await queue.wait(job.id, timeout=5)
+    finally:
+        await queue.stop()
+
+    assert (finished.status, finished.attempts) == ("failed", 3)
+    gaps = [later - earlier for earlier, later in zip(calls, calls[1:])]
+    assert gaps[0] >= 0.09 and gaps[1] >= 0.19, gaps
+
+
+async def test_start_schedules_pending_job_by_next_attempt_at(session_factory):
+    queue = JobQueue(workers=1, retry_backoff_seconds=0.2)
+    calls = []
+
+    @queue.handler("ok")
+    async def ok(payload):
+        calls.append(time.monotonic())
+        return {"ok": True}
+
+    async with session_factory() as db:
+        db.add(models.GenerationJob(id="a" * 32, job_type="ok", status="pending", payload={}, attempts=1,
+                                    next_attempt_at=datetime.now() + timedelta(seconds=0.2)))
+        await db.commit()
+
+    started = time.monotonic()
+    await queue.start()
+    try:
+        finished = await queue.wait("a" * 32, timeout=5)
+    finally:
+        await queue.stop()
+
+    assert finished.status == "succeeded"
+    assert calls[0] - started >= 0.15
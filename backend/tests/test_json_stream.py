@@ -0,0 +1,87 @@
+"""JSONArrayItemStream：分块边界、字符串转义与嵌套结构下的增量解析"""
+import json
+
+import pytest
+
+from app.utils.json_stream import JSONArrayItemStream
+
+PLAN = {
+    "total_images": 3,
+    "steps": [
+        {"step_order": 1, "instruction": "看一看", "image_prompt": "a cup"},
+        {"step_order": 2, "instruction": "说 \"你好\"", "image_prompt": "back\\slash, {brace} [bracket]"},
+        {"step_order": 3, "instruction": "走过去", "image_prompt": "x", "meta": {"tags": ["a", {"b": [1, 2]}]}},
+    ],
+}
+TEXT = f"```json\n{json.dumps(PLAN, ensure_ascii=False)}\n```"
+
+
+def _feed_all(parser, chunks):
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items
+
+
+def test_whole_text_in_one_chunk():
+    parser = JSONArrayItemStream("steps")
+    assert parser.feed(TEXT) == PLAN["steps"]
+    assert parser.finished
+    assert parser.text == TEXT
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16])
+def test_split_at_every_boundary(size):
+    parser = JSONArrayItemStream("steps")
+    chunks = [TEXT[i:i + size] for i in range(0, len(TEXT), size)]
+    assert _feed_all(parser, chunks) == PLAN["steps"]
+    assert parser.finished
+
+
+def test_items_emitted_as_soon_as_complete():
+    parser = JSONArrayItemStream("steps")
+    first_end = TEXT.index("}") + 1
+    assert parser.feed(TEXT[:first_end - 1]) == []
+    assert parser.feed(TEXT[first_end - 1:first_end]) == [PLAN["steps"][0]]
+    assert not parser.finished
+
+
+def test_escaped_quotes_and_brackets_inside_strings():
+    text = r'{"steps": [{"a": "quote \" brace } bracket ] backslash \\"}, {"b": "\\\""}]}'
+    parser = JSONArrayItemStream("steps")
+    assert _feed_all(parser, list(text)) == [{"a": 'quote " brace } bracket ] backslash \\'}, {"b": '\\"'}]
+
+
+def test_split_inside_escape_sequence():
+    text = '{"steps": [{"a": "x\\"y"}]}'
+    cut = text.index("\\") + 1
+    parser = JSONArrayItemStream("steps")
+    assert parser.feed(text[:cut]) == []
+    assert parser.feed(text[cut:]) == [{"a": 'x"y'}]
+
+
+def test_ignores_same_key_in_nested_objects_and_other_fields():
+    data = {
+        "meta": {"steps": [{"wrong": 1}]},
+        "other": [{"wrong": 2}],
+        "steps": [{"ok": {"steps": [{"inner": True}]}}],
+    }
+    parser = JSONArrayItemStream("steps")
+    assert parser.feed(json.dumps(data)) == [{"ok": {"steps": [{"inner": True}]}}]
+
+
+def test_key_inside_string_value_is_not_a_field():
+    text = '{"note": "steps", "steps": [{"a": 1}]}'
+    parser = JSONArrayItemStream("steps")
+    assert parser.feed(text) == [{"a": 1}]
+
+
+def test_only_first_matching_array_is_read():
+    parser = JSONArrayItemStream("steps")
+    assert _feed_all(parser, ['{"steps": [{"a": 1}]}', '\n{"steps": [{"b": 2}]}']) == [{"a": 1}]
+
+
+def test_missing_key_yields_nothing():
+    parser = JSONArrayItemStream("steps")
+    assert parser.feed('{"total_images": 0, "items": [{"a": 1}]}') == []
+    assert not parser.finished
@@ -1,10 +1,48 @@
 import apiClient from './client';
 
+// 读取NDJSON流式响应，逐行回调onEvent，返回最后一条事件（done/汇总）
+const postNdjson = async (endpoint, payload, onEvent) => {
+  const response = await fetch(`${apiClient.baseURL}${endpoint}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let lastEvent = null;
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (value) buffer += decoder.decode(value, { stream: !done });
+    const lines = buffer.split('\n');
+    buffer = done ? '' : lines.pop();
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      lastEvent = JSON.parse(line);
+      onEvent(lastEvent);
+    }
+    if (done) return lastEvent;
+  }
+};
+
 export const aiApi = {
   planScenario: (topic, preferences = {}) => 
     apiClient.post('/api/ai/plan-scenario', { topic, preferences }),
-  generateImage: (prompt, stepId = null, scenarioId = null) => 
-    apiClient.post('/api/ai/generate-image', { prompt, step_id: stepId, scenario_id: scenarioId }),
+  generateImage: (prompt, stepId = null, scenarioId = null, bypassCache = false) => 
+    apiClient.post('/api/ai/generate-image', { prompt, step_id: stepId, scenario_id: scenarioId, bypass_cache: bypassCache }),
+  // 批量生成图片：服务端并发生成，按完成顺序以NDJSON流返回，每完成一张回调一次onResult
+  generateImages: (payload, onResult) =>
+    postNdjson('/api/ai/generate-images', payload, (event) => {
+      if (!event.done && onResult) onResult(event);
+    }),
+  // 流式场景规划：每规划完一个步骤回调一次onStep，返回最终的done事件
+  planScenarioStream: (topic, preferences = {}, onStep) =>
+    postNdjson('/api/ai/plan-scenario/stream', { topic, preferences }, (event) => {
+      if (event.type === 'step' && onStep) onStep(event.step);
+    }),
   getPresetImage: (scenarioName, stepOrder, interest = null) =>
     apiClient.post('/api/ai/get-preset-image', { scenario_name: scenarioName, step_order: stepOrder, interest }),
   generateTTS: (text, voiceName = 'Kore', language = 'zh-CN') => 
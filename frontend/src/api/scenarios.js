@@ -1,7 +1,9 @@
 import apiClient from './client';
 
 export const scenariosApi = {
-  getAll: () => apiClient.get('/api/scenarios/'),
+  getAll: (params) => apiClient.get('/api/scenarios/', { params }),
+  // 轻量列表：只含场景基本信息和步骤数；翻页时传入 { after_id: 上一页最后一个场景的id }
+  getSummaries: (params) => apiClient.get('/api/scenarios/summary', { params }),
   getById: (id) => apiClient.get(`/api/scenarios/${id}`),
   create: (scenario) => apiClient.post('/api/scenarios/', scenario),
   update: (id, scenario) => apiClient.put(`/api/scenarios/${id}`, scenario),
@@ -2,8 +2,12 @@ import apiClient from './client';
 
 export const trainingApi = {
   start: (scenarioId) => apiClient.post('/api/training/start', { scenario_id: scenarioId }),
-  completeStep: (trainingId, stepId) => apiClient.post(`/api/training/${trainingId}/step`, { step_id: stepId }),
-  getHistory: () => apiClient.get('/api/training/history'),
+  completeStep: (trainingId, stepId, level) =>
+    apiClient.post(`/api/training/${trainingId}/step`, null, { params: { step_id: stepId, level } }),
+  // 筛选：user_id、scenario_id、start_date、end_date、overall_level；翻页传入上一页最后一条的 before(started_at)、before_id
+  getHistory: (params) => apiClient.get('/api/training/history', { params }),
   finish: (trainingId, data) => apiClient.post(`/api/training/${trainingId}/finish`, data),
+  // 训练统计汇总：{ scenario_id, user_id } 省略表示全部
+  getStats: (params) => apiClient.get('/api/training/stats', { params }),
 };
 
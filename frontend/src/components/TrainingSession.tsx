@@ -467,7 +467,10 @@ const TrainingSession: React.FC<TrainingSessionProps> = ({
         step.img_prompt_suffix, 
         preferences,
         undefined, // 不传stepId，因为是新生成的步骤
-        numericScenarioId
+        numericScenarioId,
+        undefined,
+        undefined,
+        true // 重新生成时跳过服务端图片缓存
       );
       setGenerationProgress(prev => prev + (100 / totalImagesCount));
       
@@ -94,7 +94,8 @@ export async function generateSpecialEdImage(
   stepId?: number,
   scenarioId?: number,
   scenarioName?: string,
-  stepOrder?: number
+  stepOrder?: number,
+  bypassCache: boolean = false
 ): Promise<string> {
   // #region agent log
   fetch('http://127.0.0.1:7243/ingest/77189bd5-cf28-46a6-93a6-2efc554a2100',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({location:'geminiService.ts:generateSpecialEdImage',message:'generateSpecialEdImage called',data:{stepId,scenarioId,promptSuffix:promptSuffix.substring(0,50)},timestamp:Date.now(),sessionId:'debug-session',runId:'run1',hypothesisId:'D'})}).catch(()=>{});
@@ -106,7 +107,7 @@ export async function generateSpecialEdImage(
   const fullPrompt = `${promptSuffix}, ${childDescriptor}, ${PROMPT_BASE_STYLE}, ${PROMPT_VISUAL_ANCHOR}`;
 
   try {
-    const response = await aiApi.generateImage(fullPrompt, stepId, scenarioId);
+    const response = await aiApi.generateImage(fullPrompt, stepId, scenarioId, bypassCache);
     // #region agent log
     fetch('http://127.0.0.1:7243/ingest/77189bd5-cf28-46a6-93a6-2efc554a2100',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({location:'geminiService.ts:generateSpecialEdImage',message:'generateSpecialEdImage response received',data:{stepId,scenarioId,success:response?.success,hasImageUrl:!!response?.data?.image_url},timestamp:Date.now(),sessionId:'debug-session',runId:'run1',hypothesisId:'D'})}).catch(()=>{});
     // #endregion